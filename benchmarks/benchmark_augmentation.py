@@ -0,0 +1,131 @@
+"""Throughput benchmark of the batch augmentation (dpn.augmentation) against the per-image imgaug augmentation of
+mrcnn.model.load_image_gt, for realistic numbers of instances per image.
+
+Usage: python benchmarks/benchmark_augmentation.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+# Add root directory to the python search path, if it is not already in there.
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+
+from dpn import augmentation as dpn_augmentation
+
+IMAGE_SIZE = 1024
+BATCH_SIZE = 4
+NUMBERS_OF_INSTANCES = [100, 200]
+NUMBER_OF_REPETITIONS = 5
+
+
+def create_sample(number_of_instances, random_state):
+    """Create a synthetic image with circular instance masks.
+
+    :param number_of_instances: Number of instances.
+    :param random_state: numpy RandomState object.
+    :return: Image and boolean instance masks [height, width, instance count].
+    """
+
+    image = random_state.randint(0, 256, size=(IMAGE_SIZE, IMAGE_SIZE, 3)).astype(np.uint8)
+
+    y, x = np.ogrid[:IMAGE_SIZE, :IMAGE_SIZE]
+    masks = np.zeros((IMAGE_SIZE, IMAGE_SIZE, number_of_instances), dtype=bool)
+
+    for index in range(number_of_instances):
+        center_y, center_x = random_state.randint(0, IMAGE_SIZE, size=2)
+        radius = random_state.randint(10, 40)
+        masks[:, :, index] = (y - center_y) ** 2 + (x - center_x) ** 2 <= radius ** 2
+
+    return image, masks
+
+
+def benchmark_imgaug(samples):
+    """Augment samples one by one, like mrcnn.model.load_image_gt does.
+
+    :param samples: List of (image, masks) tuples.
+    :return: Duration in seconds or None, if imgaug is not available.
+    """
+
+    try:
+        import imgaug
+        from imgaug import augmenters as iaa
+    except ImportError:
+        return None
+
+    augmentation = iaa.SomeOf((0, 2), [
+        iaa.Fliplr(0.5),
+        iaa.Flipud(0.5),
+        iaa.OneOf([iaa.Affine(rotate=90),
+                   iaa.Affine(rotate=180),
+                   iaa.Affine(rotate=270)]),
+        iaa.Multiply((0.8, 1.5)),
+        iaa.GaussianBlur(sigma=(0.0, 5.0))
+    ])
+
+    mask_augmenters = ["Sequential", "SomeOf", "OneOf", "Sometimes", "Fliplr", "Flipud", "CropAndPad", "Affine",
+                       "PiecewiseAffine"]
+
+    def hook(images, augmenter, parents, default):
+        return augmenter.__class__.__name__ in mask_augmenters
+
+    start_time = time.perf_counter()
+
+    for image, masks in samples:
+        deterministic_augmentation = augmentation.to_deterministic()
+        deterministic_augmentation.augment_image(image)
+        deterministic_augmentation.augment_image(masks.astype(np.uint8),
+                                                 hooks=imgaug.HooksImages(activator=hook))
+
+    return time.perf_counter() - start_time
+
+
+def benchmark_dpn(samples):
+    """Augment samples batch by batch with dpn.augmentation.
+
+    :param samples: List of (image, masks) tuples.
+    :return: Duration in seconds.
+    """
+
+    augmentation = dpn_augmentation.SomeOf((0, 2), [
+        dpn_augmentation.Fliplr(0.5),
+        dpn_augmentation.Flipud(0.5),
+        dpn_augmentation.Rot90(k=(1, 2, 3)),
+        dpn_augmentation.Multiply((0.8, 1.5)),
+        dpn_augmentation.GaussianBlur(sigma_range=(0.0, 5.0))
+    ])
+
+    start_time = time.perf_counter()
+
+    for batch_start in range(0, len(samples), BATCH_SIZE):
+        batch_samples = samples[batch_start:batch_start + BATCH_SIZE]
+        dpn_augmentation.augment_samples(batch_samples, augmentation)
+
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    random_state = np.random.RandomState(0)
+
+    print("{:>10} {:>20} {:>20} {:>10}".format("instances", "imgaug [samples/s]", "dpn [samples/s]", "speedup"))
+
+    for number_of_instances in NUMBERS_OF_INSTANCES:
+        samples = [create_sample(number_of_instances, random_state) for _ in range(BATCH_SIZE)]
+        samples = samples * NUMBER_OF_REPETITIONS
+        number_of_samples = len(samples)
+
+        duration_imgaug = benchmark_imgaug(samples)
+        duration_dpn = benchmark_dpn(samples)
+
+        if duration_imgaug is None:
+            print("{:>10d} {:>20} {:>20.2f} {:>10}".format(
+                number_of_instances, "n/a", number_of_samples / duration_dpn, "n/a"))
+        else:
+            print("{:>10d} {:>20.2f} {:>20.2f} {:>10.2f}".format(
+                number_of_instances,
+                number_of_samples / duration_imgaug,
+                number_of_samples / duration_dpn,
+                duration_imgaug / duration_dpn))
@@ -0,0 +1,75 @@
+"""Import time benchmark of the dpn modules. Every module is imported in a fresh interpreter, to measure its cold import
+time and to list the heavy dependencies that it pulls in.
+
+Usage: python benchmarks/benchmark_import_time.py
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+MODULES = [
+    "dpn.sizedistribution",
+    "dpn.results",
+    "dpn.detection",
+    "dpn.detectioncache",
+    "dpn.analysischeckpoint",
+    "dpn.server",
+    "dpn.visualize",
+    "dpn.dataset",
+    "dpn.model"
+]
+
+HEAVY_DEPENDENCIES = ["matplotlib", "seaborn", "tensorflow", "keras", "wget", "mrcnn"]
+
+NUMBER_OF_REPETITIONS = 3
+
+MEASUREMENT_SCRIPT = """
+import sys
+import time
+import json
+sys.path.insert(0, {root_dir!r})
+start_time = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start_time
+loaded_dependencies = [name for name in {heavy_dependencies!r} if name in sys.modules]
+print(json.dumps({{"duration": duration, "loaded_dependencies": loaded_dependencies}}))
+"""
+
+
+def measure_import_time(module):
+    """Import a module in a fresh interpreter.
+
+    :param module: Name of the module.
+    :return: Import duration in seconds and list of loaded heavy dependencies or None, None if the import failed.
+    """
+
+    script = MEASUREMENT_SCRIPT.format(root_dir=root_dir, module=module, heavy_dependencies=HEAVY_DEPENDENCIES)
+
+    process = subprocess.run([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    if process.returncode != 0:
+        return None, None
+
+    output = json.loads(process.stdout.decode().strip().splitlines()[-1])
+
+    return output["duration"], output["loaded_dependencies"]
+
+
+if __name__ == "__main__":
+    print("{:<25} {:>10}   {}".format("module", "time [s]", "heavy dependencies"))
+
+    for module in MODULES:
+        measurements = [measure_import_time(module) for _ in range(NUMBER_OF_REPETITIONS)]
+        durations = [duration for duration, _ in measurements if duration is not None]
+
+        if not durations:
+            print("{:<25} {:>10}   {}".format(module, "n/a", "import failed"))
+            continue
+
+        loaded_dependencies = measurements[-1][1]
+
+        print("{:<25} {:>10.3f}   {}".format(module, min(durations), ", ".join(loaded_dependencies) or "-"))
@@ -0,0 +1,108 @@
+"""Save/load benchmark of the serialization backends of dpn.storable on a realistic Results object, compared to plain
+dill, which was used to store all Storable objects before.
+
+Usage: python benchmarks/benchmark_serialization.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import dill
+import numpy as np
+
+# Add root directory to the python search path, if it is not already in there.
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+
+from dpn.detection import Detection
+from dpn.results import Results
+from dpn.storable import Storable
+
+IMAGE_SIZE = 1024
+NUMBER_OF_IMAGES = 10
+NUMBER_OF_INSTANCES = 50
+
+SETTINGS = [("pickle", "none"), ("pickle", "zlib"), ("pickle", "lzma"), ("dill", "zlib")]
+
+
+def create_results(random_state):
+    """Create a Results object with noisy synthetic images of circular particles and their instance masks.
+
+    :param random_state: numpy RandomState object.
+    :return: Results object.
+    """
+
+    results = Results()
+    y, x = np.ogrid[:IMAGE_SIZE, :IMAGE_SIZE]
+
+    for _ in range(NUMBER_OF_IMAGES):
+        image = np.full((IMAGE_SIZE, IMAGE_SIZE), 40.0)
+
+        masks = list()
+        bboxes = list()
+
+        for _ in range(NUMBER_OF_INSTANCES):
+            center_y, center_x = random_state.randint(0, IMAGE_SIZE, size=2)
+            radius = random_state.randint(10, 40)
+            masks.append((y - center_y) ** 2 + (x - center_x) ** 2 <= radius ** 2)
+            bboxes.append([center_y - radius, center_x - radius, center_y + radius, center_x + radius])
+
+        # Draw the particles and add noise, like in a micrograph.
+        image[np.any(masks, axis=0)] = 200
+        image += random_state.normal(0, 10, size=image.shape)
+        image = np.stack([np.clip(image, 0, 255).astype(np.uint8)] * 3, axis=-1)
+
+        scores = list(random_state.uniform(0.5, 1, size=NUMBER_OF_INSTANCES))
+        results.append_detection(Detection(image, masks, [1] * NUMBER_OF_INSTANCES, bboxes, scores))
+
+    return results
+
+
+def benchmark(save_function, path):
+    """Measure the duration of saving and loading an object.
+
+    :param save_function: Function that saves the object to a path.
+    :param path: Path of the file.
+    :return: Save duration in seconds, load duration in seconds and file size in MB.
+    """
+
+    start_time = time.perf_counter()
+    save_function(path)
+    save_duration = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    Storable.load(path)
+    load_duration = time.perf_counter() - start_time
+
+    return save_duration, load_duration, os.path.getsize(path) / 1e6
+
+
+def save_with_dill(results, path):
+    """Save an object the way Storable did before, i.e. with plain dill.
+
+    :param results: Object to save.
+    :param path: Path of the file.
+    :return: nothing
+    """
+
+    with open(path, "wb") as file:
+        dill.dump(results, file)
+
+
+if __name__ == "__main__":
+    results = create_results(np.random.RandomState(0))
+    path = os.path.join(tempfile.mkdtemp(prefix="dpn_benchmark_serialization_"), "results.pkl")
+
+    print("{:<20} {:>10} {:>10} {:>12}".format("backend", "save [s]", "load [s]", "size [MB]"))
+
+    row = benchmark(lambda p: save_with_dill(results, p), path)
+    print("{:<20} {:>10.2f} {:>10.2f} {:>12.1f}".format("dill (legacy)", *row))
+
+    for backend, compression in SETTINGS:
+        row = benchmark(lambda p: results.save(p, backend=backend, compression=compression), path)
+        print("{:<20} {:>10.2f} {:>10.2f} {:>12.1f}".format("{}/{}".format(backend, compression), *row))
+
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
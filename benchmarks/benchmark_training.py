@@ -0,0 +1,193 @@
+"""Throughput benchmark of the training data pipeline, stage by stage (image decoding, mask decoding, resizing,
+augmentation and the complete data generator including the target generation), so that the stage that limits the
+training speed can be identified. With --train, a few epochs are additionally trained on randomly initialized weights
+and the TrainingProfiler output (steps/s, samples/s, data wait vs train step time and memory) is printed.
+
+Usage: python benchmarks/benchmark_training.py [--train] [dataset_dir subset]
+
+Without dataset_dir, a synthetic dataset of PNG files is written to a temporary directory.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import skimage.io
+
+# Add root directory to the python search path, if it is not already in there.
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+
+from dpn import augmentation as dpn_augmentation
+from dpn.config import Config
+from dpn.dataset import Dataset
+from dpn.syntheticdataset import generate_sample
+
+NUMBER_OF_SAMPLES = 20
+NUMBER_OF_EPOCHS = 2
+STEPS_PER_EPOCH = 10
+
+
+class BenchmarkConfig(Config):
+    NAME = "benchmark"
+    IMAGES_PER_GPU = 2
+    IMAGE_MIN_DIM = 512
+    IMAGE_MAX_DIM = 512
+    SYNTHETIC_IMAGE_SIZE = 512
+    SYNTHETIC_NUMBER_OF_PARTICLES = (50, 100)
+    NUMBER_OF_SAMPLES_TRAIN = NUMBER_OF_SAMPLES
+    NUMBER_OF_SAMPLES_VAL = 2
+    BACKBONE = "resnet50"
+
+
+def write_synthetic_dataset(dataset_dir, subset, config, random_state):
+    """Write synthetic samples in the directory structure of Dataset.load_dataset.
+
+    :param dataset_dir: Root directory of the dataset.
+    :param subset: Name of the subset.
+    :param config: Config object, defining the SYNTHETIC_* attributes.
+    :param random_state: numpy RandomState object.
+    :return: nothing
+    """
+
+    for index in range(NUMBER_OF_SAMPLES):
+        image_id = "sample_{:04d}".format(index)
+        sample_dir = os.path.join(dataset_dir, subset, image_id)
+        os.makedirs(os.path.join(sample_dir, "images"))
+        os.makedirs(os.path.join(sample_dir, "masks"))
+
+        image, masks, class_names = generate_sample(config, random_state)
+
+        skimage.io.imsave(os.path.join(sample_dir, "images", image_id + ".png"), image)
+
+        for mask_index in range(masks.shape[-1]):
+            skimage.io.imsave(os.path.join(sample_dir, "masks", "mask_{:04d}.png".format(mask_index)),
+                              masks[:, :, mask_index].astype(np.uint8) * 255)
+
+        with open(os.path.join(sample_dir, "annotations.txt"), "w") as file:
+            file.write("\n".join(class_names))
+
+
+def measure_duration(function):
+    """Measure the duration of a function call.
+
+    :param function: Function without arguments.
+    :return: Duration in seconds.
+    """
+
+    start_time = time.perf_counter()
+    function()
+
+    return time.perf_counter() - start_time
+
+
+def benchmark_stages(dataset, config):
+    """Measure the throughput of every stage of the data pipeline.
+
+    :param dataset: Dataset object.
+    :param config: Config object.
+    :return: List of (stage, samples per second) tuples.
+    """
+
+    image_ids = list(dataset.image_ids)
+    samples = [dpn_augmentation.load_resized_sample(dataset, config, image_id) for image_id in image_ids]
+
+    augmentation = dpn_augmentation.SomeOf((0, 2), [
+        dpn_augmentation.Fliplr(0.5),
+        dpn_augmentation.Flipud(0.5),
+        dpn_augmentation.Rot90(k=(1, 2, 3)),
+        dpn_augmentation.Multiply((0.8, 1.5)),
+        dpn_augmentation.GaussianBlur(sigma_range=(0.0, 5.0))
+    ])
+
+    def load_images():
+        for image_id in image_ids:
+            dataset.load_image(image_id)
+
+    def load_masks():
+        for image_id in image_ids:
+            dataset.load_mask(image_id)
+
+    def load_resized_samples():
+        for image_id in image_ids:
+            dpn_augmentation.load_resized_sample(dataset, config, image_id)
+
+    def augment():
+        for batch_start in range(0, len(samples), config.BATCH_SIZE):
+            dpn_augmentation.augment_samples(samples[batch_start:batch_start + config.BATCH_SIZE], augmentation)
+
+    generator = dpn_augmentation.batch_augmentation_generator(dataset, config,
+                                                              shuffle=True,
+                                                              augmentation=augmentation,
+                                                              batch_size=config.BATCH_SIZE)
+    number_of_batches = -(-len(image_ids) // config.BATCH_SIZE)
+
+    def generate_batches():
+        for _ in range(number_of_batches):
+            next(generator)
+
+    stages = [("load_image", load_images),
+              ("load_mask", load_masks),
+              ("load + resize", load_resized_samples),
+              ("augmentation", augment),
+              ("data generator", generate_batches)]
+
+    return [(stage, len(image_ids) / measure_duration(function)) for stage, function in stages]
+
+
+def benchmark_training(dataset, config):
+    """Train a randomly initialized model for a few epochs and return the profiles of the TrainingProfiler.
+
+    :param dataset: Dataset object.
+    :param config: Config object.
+    :return: List of profiles, one per epoch.
+    """
+
+    from dpn.model import Model
+
+    config.EPOCHS = NUMBER_OF_EPOCHS
+    config.STEPS_PER_EPOCH = STEPS_PER_EPOCH
+    config.VALIDATION_STEPS = 1
+
+    model = Model("training", config, tempfile.mkdtemp(prefix="dpn_benchmark_training_"))
+    model.train(dataset, dataset)
+
+    return model.training_profiler.profiles
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    do_train = "--train" in arguments
+    arguments = [argument for argument in arguments if argument != "--train"]
+
+    config = BenchmarkConfig()
+
+    if arguments:
+        dataset_dir, subset = arguments
+    else:
+        dataset_dir, subset = tempfile.mkdtemp(prefix="dpn_benchmark_dataset_"), "train"
+        print("Writing synthetic dataset to {}".format(dataset_dir))
+        write_synthetic_dataset(dataset_dir, subset, config, np.random.RandomState(0))
+
+    dataset = Dataset()
+    dataset.load_dataset(dataset_dir, subset, limit=NUMBER_OF_SAMPLES)
+
+    print("{:<20} {:>12}".format("stage", "samples/s"))
+
+    for stage, rate in benchmark_stages(dataset, config):
+        print("{:<20} {:>12.2f}".format(stage, rate))
+
+    if do_train:
+        print("\n{:>6} {:>10} {:>12} {:>15} {:>15} {:>12}".format(
+            "epoch", "steps/s", "samples/s", "data wait [s]", "train step [s]", "memory [MB]"))
+
+        for profile in benchmark_training(dataset, config):
+            print("{:>6d} {:>10.2f} {:>12.2f} {:>15.2f} {:>15.2f} {:>12}".format(
+                profile["epoch"] + 1,
+                profile["steps_per_second"],
+                profile["samples_per_second"],
+                profile["data_wait_time"],
+                profile["train_step_time"],
+                "n/a" if profile["peak_memory_mb"] is None else "{:.0f}".format(profile["peak_memory_mb"])))
@@ -0,0 +1,171 @@
+import pickle
+import json
+import os
+
+
+class AnalysisCheckpoint:
+    """On-disk log of the completed detections of a long-running analysis. Detections are buffered and appended in
+    batches as shard files, in their compact form (see Detection.to_compact), without images. A line-oriented progress
+    file receives one line per completed shard, listing its file name and the keys of its detections, so that an
+    interrupted analysis can be resumed from the last completed batch and every flush only appends the new keys. The
+    progress file also stores the fingerprint of the model that wrote the detections (see check_model_fingerprint)."""
+
+    PROGRESS_FILE_NAME = "progress.jsonl"
+
+    def __init__(self, checkpoint_dir, checkpoint_interval=100):
+        """Create and initialize an AnalysisCheckpoint object. If the checkpoint directory already contains a
+        checkpoint, then its progress is loaded.
+
+        :param checkpoint_dir: Directory, where the shard files and the progress file are stored.
+        :param checkpoint_interval: Number of detections per shard file (default: 100).
+        """
+
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval = checkpoint_interval
+
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+        self.model_fingerprint = None
+        self.shard_file_names = list()
+        self.completed_keys = list()
+        self.pending_detections = list()
+
+        progress_path = os.path.join(checkpoint_dir, self.PROGRESS_FILE_NAME)
+
+        if os.path.isfile(progress_path):
+            self._read_progress(progress_path)
+
+    # Dependant properties
+    @property
+    def number_of_completed_detections(self):
+        """Number of detections that have been written to disk."""
+        return len(self.completed_keys)
+
+    # Methods
+    def load(self):
+        """Load all completed detections.
+
+        :return: Dictionary, mapping the keys of the completed detections to their compact detections.
+        """
+
+        compact_detections = dict()
+
+        for shard_file_name in self.shard_file_names:
+            with open(os.path.join(self.checkpoint_dir, shard_file_name), "rb") as file:
+                compact_detections.update(pickle.load(file))
+
+        return compact_detections
+
+    def check_model_fingerprint(self, model_fingerprint):
+        """Assert that the checkpoint was written by the same model, so that an analysis is not resumed with the
+        detections of different weights or config. The fingerprint is stored, if the checkpoint has none yet.
+
+        :param model_fingerprint: Fingerprint of the model (see DetectionCache.get_model_fingerprint).
+        :return: nothing
+        """
+
+        if self.model_fingerprint is None:
+            self._append_progress({"model_fingerprint": model_fingerprint})
+            self.model_fingerprint = model_fingerprint
+
+        assert self.model_fingerprint == model_fingerprint, \
+            "Expected the checkpoint in {} to be written by the same model (weights and config).".format(
+                self.checkpoint_dir)
+
+    def append(self, key, detection):
+        """Append a completed detection. The detections are written to disk once checkpoint_interval detections have
+        been accumulated.
+
+        :param key: Unique key of the detection, e.g. the path of the image.
+        :param detection: Detection object.
+        :return: nothing
+        """
+
+        self.pending_detections.append((key, detection.to_compact()))
+
+        if len(self.pending_detections) >= self.checkpoint_interval:
+            self.flush()
+
+    def flush(self):
+        """Write all pending detections to a new shard file and append it to the progress file.
+
+        :return: nothing
+        """
+
+        if not self.pending_detections:
+            return
+
+        shard_file_name = "shard_{:06d}.pkl".format(len(self.shard_file_names))
+
+        self._write_atomically(shard_file_name,
+                               lambda file: pickle.dump(dict(self.pending_detections),
+                                                        file,
+                                                        protocol=pickle.HIGHEST_PROTOCOL),
+                               mode="wb")
+
+        # The shard is only recorded in the progress file after it was written completely.
+        keys = [key for key, _ in self.pending_detections]
+
+        self._append_progress({"shard_file_name": shard_file_name, "keys": keys})
+
+        self.shard_file_names.append(shard_file_name)
+        self.completed_keys += keys
+        self.pending_detections = list()
+
+    def _read_progress(self, progress_path):
+        """Read the model fingerprint and the completed shards from the progress file. A partially written last line
+        of an interrupted flush is removed, so that the shard is written again.
+
+        :param progress_path: Path of the progress file.
+        :return: nothing
+        """
+
+        with open(progress_path, "rb+") as file:
+            complete_size = 0
+
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+
+                complete_size += len(line)
+                record = json.loads(line.decode())
+
+                if "model_fingerprint" in record:
+                    self.model_fingerprint = record["model_fingerprint"]
+                else:
+                    self.shard_file_names.append(record["shard_file_name"])
+                    self.completed_keys += record["keys"]
+
+            file.truncate(complete_size)
+
+    def _append_progress(self, record):
+        """Append a record as a line to the progress file and wait until it is on disk.
+
+        :param record: Dictionary to store.
+        :return: nothing
+        """
+
+        with open(os.path.join(self.checkpoint_dir, self.PROGRESS_FILE_NAME), "a") as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _write_atomically(self, file_name, write_function, mode):
+        """Write a file in the checkpoint directory via a temporary file, so that an interruption never leaves a
+        partially written file behind.
+
+        :param file_name: Name of the file.
+        :param write_function: Function that writes the content to a given file object.
+        :param mode: File mode, either "w" or "wb".
+        :return: nothing
+        """
+
+        path = os.path.join(self.checkpoint_dir, file_name)
+        temporary_path = path + ".tmp"
+
+        with open(temporary_path, mode) as file:
+            write_function(file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, path)
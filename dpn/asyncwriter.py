@@ -0,0 +1,218 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+import threading
+
+# pyplot is not thread-safe, so that detection images are rendered one at a time per process.
+PYPLOT_LOCK = threading.Lock()
+
+
+def save_detection_image(detection, output_path):
+    """Render and save an image with overlayed detections (worker function of AsyncWriter.save_detection_image).
+
+    :param detection: Detection object.
+    :param output_path: Path of the output image.
+    :return: nothing
+    """
+
+    with PYPLOT_LOCK:
+        detection.save_detection_image(output_path)
+
+
+class AsyncWriter:
+    """Background output stage, so that writing results (e.g. detection images, exports, checkpoints or stored objects)
+    overlaps with the inference. Tasks are executed by a pool of worker threads or processes. At most
+    maximum_queue_size tasks are pending at once: further submissions block until a task has been completed, so that a
+    slow disk applies backpressure instead of accumulating unwritten results in memory. Ordered tasks, e.g. appending to
+    a ParticleExporter or an AnalysisCheckpoint, are executed one after another in submission order by a dedicated
+    thread. Errors of background tasks are raised in the caller at the next submission, flush or close.
+
+    Objects that are passed to a task must not be changed until the task has been completed. Worker processes require
+    the tasks and their arguments to be picklable. Worker threads render detection images with pyplot, which requires a
+    non-interactive matplotlib backend (e.g. Agg)."""
+
+    def __init__(self, number_of_workers=2, maximum_queue_size=16, do_use_processes=False):
+        """Create and initialize an AsyncWriter object.
+
+        :param number_of_workers: Number of worker threads or processes (default: 2).
+        :param maximum_queue_size: Maximum number of pending tasks (default: 16).
+        :param do_use_processes: Whether or not to use worker processes instead of threads, e.g. for CPU-bound tasks
+                                 such as rendering (default: False).
+        """
+
+        assert maximum_queue_size >= 1, "Expected maximum_queue_size to be at least 1."
+
+        executor_class = ProcessPoolExecutor if do_use_processes else ThreadPoolExecutor
+
+        self.number_of_workers = number_of_workers
+        self.maximum_queue_size = maximum_queue_size
+        self.do_use_processes = do_use_processes
+
+        self.number_of_completed_tasks = 0
+
+        self._executor = executor_class(max_workers=number_of_workers)
+        self._ordered_executor = ThreadPoolExecutor(max_workers=1)
+
+        self._slots = threading.BoundedSemaphore(maximum_queue_size)
+        self._lock = threading.Lock()
+        self._pending_futures = set()
+        self._errors = list()
+        self._is_closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not mask the original exception with errors of the background tasks.
+            self._shutdown()
+
+    # Dependant properties
+    @property
+    def number_of_pending_tasks(self):
+        """Number of tasks that have been submitted, but not completed yet."""
+        with self._lock:
+            return len(self._pending_futures)
+
+    # Methods
+    def submit(self, function, *args, **kwargs):
+        """Submit a task. Blocks, while maximum_queue_size tasks are pending.
+
+        :param function: Function to execute.
+        :param args: Positional arguments of the function.
+        :param kwargs: Keyword arguments of the function.
+        :return: Future object of the task.
+        """
+
+        return self._submit(self._executor, function, args, kwargs)
+
+    def submit_ordered(self, function, *args, **kwargs):
+        """Submit a task that is executed after all previously submitted ordered tasks, in this process. Blocks, while
+        maximum_queue_size tasks are pending.
+
+        :param function: Function to execute.
+        :param args: Positional arguments of the function.
+        :param kwargs: Keyword arguments of the function.
+        :return: Future object of the task.
+        """
+
+        return self._submit(self._ordered_executor, function, args, kwargs)
+
+    def save(self, storable, output_path, backend="auto", compression="none"):
+        """Save a Storable object in the background (see Storable.save).
+
+        :param storable: Storable object.
+        :param output_path: Path of the output file.
+        :param backend: Serialization backend (see dpn.storable.dump, default: "auto").
+        :param compression: Compression of the serialized data (see dpn.storable.dump, default: "none").
+        :return: Future object of the task.
+        """
+
+        return self.submit(storable.save, output_path, backend=backend, compression=compression)
+
+    def save_detection_image(self, detection, output_path):
+        """Render and save an image with overlayed detections in the background (see Detection.save_detection_image).
+
+        :param detection: Detection object.
+        :param output_path: Path of the output image.
+        :return: Future object of the task.
+        """
+
+        return self.submit(save_detection_image, detection, output_path)
+
+    def flush(self):
+        """Wait until all submitted tasks have been completed.
+
+        :return: nothing
+        """
+
+        with self._lock:
+            pending_futures = list(self._pending_futures)
+
+        wait(pending_futures)
+
+        self._raise_error()
+
+    def close(self):
+        """Wait until all submitted tasks have been completed and stop the workers.
+
+        :return: nothing
+        """
+
+        try:
+            self.flush()
+        finally:
+            self._shutdown()
+
+    def _submit(self, executor, function, args, kwargs):
+        """Submit a task to an executor, once a slot in the queue is available.
+
+        :param executor: Executor object.
+        :param function: Function to execute.
+        :param args: Positional arguments of the function.
+        :param kwargs: Keyword arguments of the function.
+        :return: Future object of the task.
+        """
+
+        assert not self._is_closed, "Expected the AsyncWriter not to be closed."
+
+        self._raise_error()
+
+        self._slots.acquire()
+
+        try:
+            future = executor.submit(function, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending_futures.add(future)
+
+        future.add_done_callback(self._on_task_done)
+
+        return future
+
+    def _on_task_done(self, future):
+        """Release the slot of a completed task and keep its error, if it failed.
+
+        :param future: Future object of the task.
+        :return: nothing
+        """
+
+        with self._lock:
+            self._pending_futures.discard(future)
+            self.number_of_completed_tasks += 1
+
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())
+
+        self._slots.release()
+
+    def _raise_error(self):
+        """Raise the first error of the failed background tasks, if there is any.
+
+        :return: nothing
+        """
+
+        with self._lock:
+            if not self._errors:
+                return
+
+            error = self._errors[0]
+            self._errors = list()
+
+        raise error
+
+    def _shutdown(self):
+        """Wait for the running tasks and stop the workers.
+
+        :return: nothing
+        """
+
+        if self._is_closed:
+            return
+
+        self._is_closed = True
+        self._ordered_executor.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
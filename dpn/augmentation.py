@@ -0,0 +1,384 @@
+from mrcnn import utils
+from mrcnn.model import compute_backbone_shapes, compose_image_meta, build_rpn_targets, mold_image
+from dpn.utilities import get_bboxes
+from scipy.ndimage import gaussian_filter
+import numpy as np
+import logging
+
+
+class BatchAugmenter:
+    """Base class of augmenters that process a whole batch at once. Images are passed as one array of shape
+    [batch size, height, width, channels] and the instance masks of all images as one array of shape
+    [batch size, height, width, instance count], so that a geometric transformation is applied to all instance masks of
+    an image with a single array operation, regardless of the number of instances."""
+
+    def augment_batch(self, images, masks, do_apply=None):
+        """Augment a batch of images and their instance masks.
+
+        :param images: Array of images [batch size, height, width, channels].
+        :param masks: Boolean array of instance masks [batch size, height, width, instance count].
+        :param do_apply: Boolean array [batch size] that marks the samples the augmenter may be applied to
+                         (default: None, all samples).
+        :return: Augmented images and masks.
+        """
+
+        if do_apply is None:
+            do_apply = np.ones(len(images), dtype=bool)
+
+        return self._augment_batch(images, masks, do_apply)
+
+    def _augment_batch(self, images, masks, do_apply):
+        raise NotImplementedError
+
+
+class GeometricBatchAugmenter(BatchAugmenter):
+    """Base class of geometric augmenters, that apply a transformation with probability p to images and masks alike."""
+
+    def __init__(self, p=0.5):
+        """Create and initialize a geometric augmenter.
+
+        :param p: Probability to apply the transformation to a sample (default: 0.5).
+        """
+
+        self.p = p
+
+    def _augment_batch(self, images, masks, do_apply):
+        is_selected = do_apply & (np.random.rand(len(images)) < self.p)
+
+        if np.any(is_selected):
+            images[is_selected] = self._transform(images[is_selected])
+            masks[is_selected] = self._transform(masks[is_selected])
+
+        return images, masks
+
+    def _transform(self, batch):
+        raise NotImplementedError
+
+
+class Fliplr(GeometricBatchAugmenter):
+    """Flip images and masks horizontally."""
+
+    def _transform(self, batch):
+        return batch[:, :, ::-1]
+
+
+class Flipud(GeometricBatchAugmenter):
+    """Flip images and masks vertically."""
+
+    def _transform(self, batch):
+        return batch[:, ::-1]
+
+
+class Rot90(BatchAugmenter):
+    """Rotate images and masks by a multiple of 90°. Rotations by 90° and 270° require square images."""
+
+    def __init__(self, k=(1, 2, 3), p=1.0):
+        """Create and initialize a Rot90 augmenter.
+
+        :param k: Possible numbers of counterclockwise 90° rotations, one of which is chosen randomly for each sample
+                  (default: (1, 2, 3)).
+        :param p: Probability to rotate a sample (default: 1.0).
+        """
+
+        self.k = list(k)
+        self.p = p
+
+    def _augment_batch(self, images, masks, do_apply):
+        is_selected = do_apply & (np.random.rand(len(images)) < self.p)
+        ks = np.random.choice(self.k, size=len(images))
+
+        for k in np.unique(ks[is_selected]):
+            assert k % 2 == 0 or images.shape[1] == images.shape[2], \
+                "Rotations by 90° and 270° require square images."
+
+            is_rotated = is_selected & (ks == k)
+            images[is_rotated] = np.rot90(images[is_rotated], k, axes=(1, 2))
+            masks[is_rotated] = np.rot90(masks[is_rotated], k, axes=(1, 2))
+
+        return images, masks
+
+
+class Multiply(BatchAugmenter):
+    """Multiply the intensities of images with a random factor. Masks are not affected."""
+
+    def __init__(self, factor_range=(0.8, 1.5)):
+        """Create and initialize a Multiply augmenter.
+
+        :param factor_range: Range of the random factor (default: (0.8, 1.5)).
+        """
+
+        self.factor_range = factor_range
+
+    def _augment_batch(self, images, masks, do_apply):
+        factors = np.where(do_apply, np.random.uniform(*self.factor_range, size=len(images)), 1)
+        images[...] = np.clip(images * factors[:, np.newaxis, np.newaxis, np.newaxis], 0, 255)
+
+        return images, masks
+
+
+class GaussianBlur(BatchAugmenter):
+    """Blur images with a Gaussian kernel of random standard deviation. Masks are not affected."""
+
+    def __init__(self, sigma_range=(0.0, 5.0)):
+        """Create and initialize a GaussianBlur augmenter.
+
+        :param sigma_range: Range of the standard deviation of the Gaussian kernel (default: (0.0, 5.0)).
+        """
+
+        self.sigma_range = sigma_range
+
+    def _augment_batch(self, images, masks, do_apply):
+        sigmas = np.random.uniform(*self.sigma_range, size=len(images))
+
+        for index in np.flatnonzero(do_apply & (sigmas > 0)):
+            images[index] = gaussian_filter(images[index], sigma=(sigmas[index], sigmas[index], 0))
+
+        return images, masks
+
+
+class Sequential(BatchAugmenter):
+    """Apply a list of augmenters one after another."""
+
+    def __init__(self, children):
+        """Create and initialize a Sequential augmenter.
+
+        :param children: List of augmenters.
+        """
+
+        self.children = children
+
+    def _augment_batch(self, images, masks, do_apply):
+        for child in self.children:
+            images, masks = child.augment_batch(images, masks, do_apply=do_apply)
+
+        return images, masks
+
+
+class SomeOf(BatchAugmenter):
+    """Apply a random subset of a list of augmenters to every sample."""
+
+    def __init__(self, number_range, children):
+        """Create and initialize a SomeOf augmenter.
+
+        :param number_range: Tuple (minimum, maximum) of the number of augmenters to apply to each sample.
+        :param children: List of augmenters.
+        """
+
+        self.number_range = number_range
+        self.children = children
+
+    def _augment_batch(self, images, masks, do_apply):
+        batch_size = len(images)
+        number_of_children = len(self.children)
+
+        minimum, maximum = self.number_range
+        numbers = np.random.randint(minimum, min(maximum, number_of_children) + 1, size=batch_size)
+
+        # Select a random subset of children for each sample, by ranking random numbers.
+        ranks = np.argsort(np.argsort(np.random.rand(batch_size, number_of_children), axis=1), axis=1)
+        is_active = ranks < numbers[:, np.newaxis]
+
+        for child_index, child in enumerate(self.children):
+            images, masks = child.augment_batch(images, masks, do_apply=do_apply & is_active[:, child_index])
+
+        return images, masks
+
+
+class OneOf(BatchAugmenter):
+    """Apply exactly one randomly chosen augmenter of a list of augmenters to every sample."""
+
+    def __init__(self, children):
+        """Create and initialize a OneOf augmenter.
+
+        :param children: List of augmenters.
+        """
+
+        self.children = children
+
+    def _augment_batch(self, images, masks, do_apply):
+        choices = np.random.randint(len(self.children), size=len(images))
+
+        for child_index, child in enumerate(self.children):
+            images, masks = child.augment_batch(images, masks, do_apply=do_apply & (choices == child_index))
+
+        return images, masks
+
+
+def load_resized_sample(dataset, config, image_id):
+    """Load and resize an image and its instance masks, analogous to mrcnn.model.load_image_gt.
+
+    :param dataset: Dataset object.
+    :param config: Config object.
+    :param image_id: ID of the image.
+    :return: image, instance masks, class IDs, original image shape, window and scale.
+    """
+
+    image = dataset.load_image(image_id)
+    masks, class_ids = dataset.load_mask(image_id)
+    original_shape = image.shape
+
+    image, window, scale, padding, crop = utils.resize_image(image,
+                                                             min_dim=config.IMAGE_MIN_DIM,
+                                                             min_scale=config.IMAGE_MIN_SCALE,
+                                                             max_dim=config.IMAGE_MAX_DIM,
+                                                             mode=config.IMAGE_RESIZE_MODE)
+    masks = utils.resize_mask(masks, scale, padding, crop)
+
+    return image, masks, class_ids, original_shape, window, scale
+
+
+def augment_samples(samples, augmentation):
+    """Augment a list of resized samples as one batch. Samples of differing shapes are augmented one by one.
+
+    :param samples: List of samples, as returned by load_resized_sample.
+    :param augmentation: BatchAugmenter object.
+    :return: List of augmented images and list of augmented instance masks.
+    """
+
+    images = [sample[0] for sample in samples]
+    masks = [sample[1] for sample in samples]
+
+    if len(set(image.shape for image in images)) > 1:
+        augmented = [augment_samples([sample], augmentation) for sample in samples]
+        return [images[0] for images, _ in augmented], [masks[0] for _, masks in augmented]
+
+    # Stack the masks of all samples into a single array, padded to the largest number of instances.
+    numbers_of_instances = [sample_masks.shape[-1] for sample_masks in masks]
+    batch_masks = np.zeros((len(samples),) + masks[0].shape[:2] + (max(numbers_of_instances),), dtype=bool)
+    for index, sample_masks in enumerate(masks):
+        batch_masks[index, :, :, :sample_masks.shape[-1]] = sample_masks
+
+    batch_images = np.stack(images).astype(np.float32)
+
+    batch_images, batch_masks = augmentation.augment_batch(batch_images, batch_masks)
+
+    images = [image.astype(samples[0][0].dtype) for image in batch_images]
+    masks = [batch_masks[index, :, :, :number_of_instances]
+             for index, number_of_instances in enumerate(numbers_of_instances)]
+
+    return images, masks
+
+
+def batch_augmentation_generator(dataset, config, shuffle=True, augmentation=None, batch_size=1,
+                                 no_augmentation_sources=None):
+    """Data generator analogous to mrcnn.model.data_generator, which augments every batch at once with a
+    BatchAugmenter instead of augmenting image by image.
+
+    :param dataset: Dataset object.
+    :param config: Config object.
+    :param shuffle: Whether or not to shuffle the samples (default: True).
+    :param augmentation: BatchAugmenter object (default: None, no augmentation).
+    :param batch_size: Number of samples per batch (default: 1).
+    :param no_augmentation_sources: List of dataset sources to exclude from augmentation (default: None).
+    :return: Generator yielding the inputs and outputs of the model in training mode.
+    """
+
+    no_augmentation_sources = no_augmentation_sources or []
+
+    image_index = -1
+    image_ids = np.copy(dataset.image_ids)
+    error_count = 0
+
+    backbone_shapes = compute_backbone_shapes(config, config.IMAGE_SHAPE)
+    anchors = utils.generate_pyramid_anchors(config.RPN_ANCHOR_SCALES,
+                                             config.RPN_ANCHOR_RATIOS,
+                                             backbone_shapes,
+                                             config.BACKBONE_STRIDES,
+                                             config.RPN_ANCHOR_STRIDE)
+
+    while True:
+        try:
+            # Load and resize the samples of the next batch.
+            batch_image_ids = list()
+            samples = list()
+
+            for _ in range(batch_size):
+                image_index = (image_index + 1) % len(image_ids)
+
+                if shuffle and image_index == 0:
+                    np.random.shuffle(image_ids)
+
+                batch_image_ids.append(image_ids[image_index])
+                samples.append(load_resized_sample(dataset, config, image_ids[image_index]))
+
+            # Augment all samples of the batch at once.
+            images = [sample[0] for sample in samples]
+            masks = [sample[1] for sample in samples]
+
+            if augmentation is not None:
+                do_augment = [dataset.image_info[image_id]["source"] not in no_augmentation_sources
+                              for image_id in batch_image_ids]
+
+                if any(do_augment):
+                    augmented_indices = np.flatnonzero(do_augment)
+                    augmented_images, augmented_masks = augment_samples([samples[i] for i in augmented_indices],
+                                                                        augmentation)
+
+                    for index, image, sample_masks in zip(augmented_indices, augmented_images, augmented_masks):
+                        images[index] = image
+                        masks[index] = sample_masks
+
+            batch_images = np.zeros((batch_size,) + images[0].shape, dtype=np.float32)
+            batch_image_meta = None
+
+            for b, (image_id, sample, image, sample_masks) in enumerate(zip(batch_image_ids, samples, images, masks)):
+                _, _, class_ids, original_shape, window, scale = sample
+
+                # Remove masks that became empty, e.g. due to cropping.
+                is_not_empty = np.any(sample_masks, axis=(0, 1))
+                sample_masks = sample_masks[:, :, is_not_empty]
+                class_ids = class_ids[is_not_empty]
+
+                assert np.any(class_ids > 0), "Image {} has no instances.".format(image_id)
+
+                bboxes = get_bboxes(sample_masks)
+
+                active_class_ids = np.zeros([dataset.num_classes], dtype=np.int32)
+                source_class_ids = dataset.source_class_ids[dataset.image_info[image_id]["source"]]
+                active_class_ids[source_class_ids] = 1
+
+                if config.USE_MINI_MASK:
+                    sample_masks = utils.minimize_mask(bboxes, sample_masks, config.MINI_MASK_SHAPE)
+
+                image_meta = compose_image_meta(image_id, original_shape, image.shape, window, scale, active_class_ids)
+
+                rpn_match, rpn_bbox = build_rpn_targets(image.shape, anchors, class_ids, bboxes, config)
+
+                if batch_image_meta is None:
+                    batch_image_meta = np.zeros((batch_size,) + image_meta.shape, dtype=image_meta.dtype)
+                    batch_rpn_match = np.zeros([batch_size, anchors.shape[0], 1], dtype=rpn_match.dtype)
+                    batch_rpn_bbox = np.zeros([batch_size, config.RPN_TRAIN_ANCHORS_PER_IMAGE, 4], dtype=rpn_bbox.dtype)
+                    batch_gt_class_ids = np.zeros((batch_size, config.MAX_GT_INSTANCES), dtype=np.int32)
+                    batch_gt_boxes = np.zeros((batch_size, config.MAX_GT_INSTANCES, 4), dtype=np.int32)
+                    batch_gt_masks = np.zeros((batch_size, sample_masks.shape[0], sample_masks.shape[1],
+                                               config.MAX_GT_INSTANCES), dtype=sample_masks.dtype)
+
+                # If more instances than fits in the array, sub-sample from them.
+                if bboxes.shape[0] > config.MAX_GT_INSTANCES:
+                    ids = np.random.choice(np.arange(bboxes.shape[0]), config.MAX_GT_INSTANCES, replace=False)
+                    class_ids = class_ids[ids]
+                    bboxes = bboxes[ids]
+                    sample_masks = sample_masks[:, :, ids]
+
+                batch_image_meta[b] = image_meta
+                batch_rpn_match[b] = rpn_match[:, np.newaxis]
+                batch_rpn_bbox[b] = rpn_bbox
+                batch_images[b] = mold_image(image.astype(np.float32), config)
+                batch_gt_class_ids[b, :class_ids.shape[0]] = class_ids
+                batch_gt_boxes[b, :bboxes.shape[0]] = bboxes
+                batch_gt_masks[b, :, :, :sample_masks.shape[-1]] = sample_masks
+
+            inputs = [batch_images, batch_image_meta, batch_rpn_match, batch_rpn_bbox,
+                      batch_gt_class_ids, batch_gt_boxes, batch_gt_masks]
+            outputs = []
+
+            yield inputs, outputs
+
+        except (GeneratorExit, KeyboardInterrupt):
+            raise
+        except Exception:
+            # Log it and skip the batch
+            logging.exception("Error processing batch {}".format(batch_image_ids))
+            error_count += 1
+            if error_count > 5:
+                raise
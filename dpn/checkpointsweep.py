@@ -0,0 +1,243 @@
+from dpn.detection import Detection
+from dpn.results import Results
+from dpn.sizedistribution import SizeDistribution
+from dpn.utilities import compute_average_precision
+import numpy as np
+import multiprocessing
+import tempfile
+import weakref
+import shutil
+import glob
+import dill
+import csv
+import re
+import os
+
+
+def find_checkpoints(log_dir):
+    """Find the checkpoints (.h5 files) of a training log directory and determine their epochs.
+
+    :param log_dir: Training log directory.
+    :return: List of (epoch, path) tuples, sorted by epoch.
+    """
+
+    checkpoints = list()
+
+    for checkpoint_path in glob.glob(os.path.join(log_dir, "*.h5")):
+        match = re.search(r"_(\d+)\.h5$", checkpoint_path)
+
+        if match:
+            checkpoints.append((int(match.group(1)), checkpoint_path))
+
+    return sorted(checkpoints)
+
+
+class CheckpointSweep:
+    """Evaluate all checkpoints of a training log directory on a validation dataset. The images and the ground truth
+    masks are decoded only once and shared with the worker processes via a memory-mapped file. Every worker builds the
+    model graph only once and then swaps in the weights of one checkpoint after the other. The temporary files are
+    removed by cleanup, when the object is used as context manager and exits, or when it is garbage collected."""
+
+    def __init__(self, config, log_dir, dataset, measurand="equivalent_diameter", iou_threshold=0.5):
+        """Create and initialize a CheckpointSweep object, i.e. decode the images and the ground truth of the dataset.
+
+        :param config: Config object for the inference mode.
+        :param log_dir: Training log directory, containing the checkpoints.
+        :param dataset: Dataset object storing the validation data.
+        :param measurand: Measurand to use for the size distributions (see Results.to_size_distribution,
+                          default: "equivalent_diameter").
+        :param iou_threshold: IoU threshold for the calculation of the average precision (default: 0.5).
+        """
+
+        self.config = config
+        self.log_dir = log_dir
+        self.measurand = measurand
+        self.iou_threshold = iou_threshold
+
+        self.checkpoints = find_checkpoints(log_dir)
+
+        ground_truth = dataset.get_ground_truth()
+        self.ground_truth_sizes = ground_truth.to_size_distribution(measurand).sizes
+
+        # Write all images and ground truth masks into a single memory-mapped file.
+        self.shared_dir = tempfile.mkdtemp(prefix="dpn_checkpoint_sweep_")
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.shared_dir, True)
+        self.shared_path = os.path.join(self.shared_dir, "data.bin")
+
+        arrays = list()
+        for detection in ground_truth.detections:
+            arrays.append(np.ascontiguousarray(detection.image))
+            if detection.number_of_instances > 0:
+                arrays.append(np.stack(detection.masks, axis=-1).view(np.uint8))
+            else:
+                arrays.append(np.zeros(detection.image.shape[:2] + (0,), dtype=np.uint8))
+
+        total_size = sum(array.nbytes for array in arrays)
+        shared_data = np.memmap(self.shared_path, dtype=np.uint8, mode="w+", shape=(max(total_size, 1),))
+
+        self.layout = list()
+        offset = 0
+        for array in arrays:
+            shared_data[offset:offset + array.nbytes] = array.reshape(-1).view(np.uint8)
+            self.layout.append((offset, array.shape, array.dtype.str))
+            offset += array.nbytes
+
+        shared_data.flush()
+        del shared_data
+
+        self.ground_truth_metadata = [(detection.class_ids, detection.bboxes) for detection in ground_truth.detections]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def run(self, number_of_processes=2, output_path=None, verbose=True):
+        """Evaluate all checkpoints in parallel.
+
+        :param number_of_processes: Number of worker processes, each of which holds one model (default: 2).
+        :param output_path: Path of the CSV file to write the table to (default: None, write checkpoint_sweep.csv to
+                            the log directory).
+        :param verbose: If True, then the table is printed (default: True).
+        :return: List of dictionaries, one per checkpoint, with the epoch, the path, the mean average precision (mAP)
+                 and the errors of the geometric mean (error_d_g), the geometric standard deviation (error_s_g) and
+                 the number of particles (error_N) with regard to the ground truth.
+        """
+
+        if output_path is None:
+            output_path = os.path.join(self.log_dir, "checkpoint_sweep.csv")
+
+        # Spawn fresh processes, since TensorFlow does not support forking an initialized session.
+        context = multiprocessing.get_context("spawn")
+
+        # The model directories of the workers are created in a directory of this process, since the pool terminates
+        # the workers without running their exit handlers.
+        worker_dir = tempfile.mkdtemp(prefix="workers_", dir=self.shared_dir)
+
+        initialization_arguments = (dill.dumps(self.config),
+                                    worker_dir,
+                                    self.shared_path,
+                                    self.layout,
+                                    self.ground_truth_metadata,
+                                    self.ground_truth_sizes,
+                                    self.measurand,
+                                    self.iou_threshold)
+
+        try:
+            with context.Pool(number_of_processes,
+                              initializer=_initialize_worker,
+                              initargs=initialization_arguments) as pool:
+                rows = pool.map(_evaluate_checkpoint, self.checkpoints, chunksize=1)
+        finally:
+            shutil.rmtree(worker_dir, ignore_errors=True)
+
+        field_names = ["epoch", "mAP", "error_d_g", "error_s_g", "error_N", "path"]
+
+        with open(output_path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=field_names)
+            writer.writeheader()
+            writer.writerows(rows)
+
+        if verbose:
+            print("{:>6} {:>8} {:>10} {:>10} {:>10}".format("epoch", "mAP", "error_d_g", "error_s_g", "error_N"))
+            for row in rows:
+                print("{:>6d} {:>8.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                    row["epoch"], row["mAP"], row["error_d_g"], row["error_s_g"], row["error_N"]))
+
+        return rows
+
+    def cleanup(self):
+        """Remove the shared memory-mapped file and the temporary directory.
+
+        :return: nothing
+        """
+
+        self._finalizer()
+
+
+# State of a worker process of CheckpointSweep.
+_worker_state = dict()
+
+
+def _initialize_worker(serialized_config, worker_dir, shared_path, layout, ground_truth_metadata, ground_truth_sizes,
+                       measurand, iou_threshold):
+    """Build the model of a worker process and map the shared images and ground truth masks.
+
+    :return: nothing
+    """
+
+    from dpn.model import Model
+
+    config = dill.loads(serialized_config)
+
+    model_dir = tempfile.mkdtemp(prefix="worker_", dir=worker_dir)
+    model = Model(mode="inference", config=config, model_dir=model_dir)
+
+    shared_data = np.memmap(shared_path, dtype=np.uint8, mode="r")
+
+    arrays = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=shared_data, offset=offset)
+              for offset, shape, dtype in layout]
+
+    images = arrays[0::2]
+    ground_truth = list()
+
+    for image, masks, (class_ids, bboxes) in zip(images, arrays[1::2], ground_truth_metadata):
+        masks = [masks[:, :, index].view(bool) for index in range(masks.shape[-1])]
+        ground_truth.append(Detection(image, masks, class_ids, bboxes, [1] * len(masks)))
+
+    ground_truth_size_distribution = SizeDistribution("px")
+    ground_truth_size_distribution.sizes = ground_truth_sizes
+
+    _worker_state.update({
+        "model": model,
+        "images": images,
+        "ground_truth": ground_truth,
+        "ground_truth_size_distribution": ground_truth_size_distribution,
+        "measurand": measurand,
+        "iou_threshold": iou_threshold
+    })
+
+
+def _evaluate_checkpoint(checkpoint):
+    """Evaluate a single checkpoint in a worker process.
+
+    :param checkpoint: Tuple (epoch, path) of the checkpoint.
+    :return: Dictionary with the evaluation results.
+    """
+
+    epoch, checkpoint_path = checkpoint
+
+    model = _worker_state["model"]
+    model.load_weights(checkpoint_path, by_name=True)
+
+    results = Results()
+    average_precisions = list()
+
+    for image, ground_truth_detection in zip(_worker_state["images"], _worker_state["ground_truth"]):
+        detection = model.detect(np.array(image))
+        results.append_detection(detection)
+
+        if detection.number_of_instances > 0 and ground_truth_detection.number_of_instances > 0:
+            average_precisions.append(compute_average_precision(detection,
+                                                                ground_truth_detection,
+                                                                iou_threshold=_worker_state["iou_threshold"]))
+        elif detection.number_of_instances == 0 and ground_truth_detection.number_of_instances == 0:
+            # No detections on an image without particles are a perfect prediction.
+            average_precisions.append(1.0)
+        else:
+            average_precisions.append(0.0)
+
+    size_distribution = results.to_size_distribution(_worker_state["measurand"])
+    error_d_g, error_s_g, error_N = size_distribution.compare(_worker_state["ground_truth_size_distribution"],
+                                                              do_return_errors=True,
+                                                              do_print_output=False)
+
+    return {
+        "epoch": epoch,
+        "mAP": float(np.mean(average_precisions)),
+        "error_d_g": error_d_g,
+        "error_s_g": error_s_g,
+        "error_N": error_N,
+        "path": checkpoint_path
+    }
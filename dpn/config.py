@@ -14,6 +14,18 @@ class Config(MrcnnConfig, Storable):
     NUMBER_OF_SAMPLES_TRAIN = 100
     NUMBER_OF_SAMPLES_VAL = 10
 
+    # Synthetic dataset (see SyntheticDataset)
+    SYNTHETIC_IMAGE_SIZE = 512
+    SYNTHETIC_CLASSES = ["sphere", "cube"]  # Any subset of the shapes "sphere" and "cube"; class IDs follow the order.
+    SYNTHETIC_NUMBER_OF_PARTICLES = (10, 50)  # Range of the number of particles per image.
+    SYNTHETIC_DIAMETER_GEOMETRIC_MEAN = 40  # px
+    SYNTHETIC_DIAMETER_GEOMETRIC_STANDARD_DEVIATION = 1.2
+    SYNTHETIC_MAXIMUM_OVERLAP = 0.3  # Maximum fraction of the area of a particle that is covered by other particles.
+    SYNTHETIC_BACKGROUND_INTENSITY = 40
+    SYNTHETIC_PARTICLE_INTENSITY = 200
+    SYNTHETIC_NOISE_STANDARD_DEVIATION = 10
+    SYNTHETIC_SEED = 0
+
     # Architecture
     DETECTION_MAX_INSTANCES = 100
     NUM_CLASSES = 1 + 2  # Background + sphere + cube
@@ -25,15 +37,30 @@ class Config(MrcnnConfig, Storable):
     LAYERS = "all"
     LEARNING_RATE = 0.01
     EPOCHS = 10000
+    GRADIENT_ACCUMULATION_STEPS = 1  # Number of micro-batches per optimizer step.
+
+    # Head training with cached backbone features (see HeadTrainingModel)
+    FEATURE_CACHE_PATH = None
+    FEATURE_CACHE_DTYPE = "float16"
 
     def __init__(self):
         """Create and initialize a configuration."""
 
-        # Effective batch size
+        # Batch size, i.e. number of samples per micro-batch.
         self.BATCH_SIZE = self.IMAGES_PER_GPU * self.GPU_COUNT
 
-        # Calculate number of training steps per epoch, so that all trainings samples are used once per epoch.
-        self.STEPS_PER_EPOCH = round(self.NUMBER_OF_SAMPLES_TRAIN/self.BATCH_SIZE)
+        # Effective batch size, i.e. number of samples per optimizer step.
+        self.EFFECTIVE_BATCH_SIZE = self.BATCH_SIZE * self.GRADIENT_ACCUMULATION_STEPS
+
+        # Calculate number of training steps (micro-batches) per epoch, so that all trainings samples are used once per
+        # epoch and every epoch ends with a complete optimizer step.
+        self.STEPS_PER_EPOCH = \
+            round(self.NUMBER_OF_SAMPLES_TRAIN/self.EFFECTIVE_BATCH_SIZE) * self.GRADIENT_ACCUMULATION_STEPS
+
+        # Train at least one optimizer step per epoch.
+        if self.STEPS_PER_EPOCH < self.GRADIENT_ACCUMULATION_STEPS:
+            self.STEPS_PER_EPOCH = self.GRADIENT_ACCUMULATION_STEPS
+
         # Calculate number of validation steps per epoch, so that all validation samples are used once per epoch.
         self.VALIDATION_STEPS = round(self.NUMBER_OF_SAMPLES_VAL/self.BATCH_SIZE)
         
@@ -6,6 +6,7 @@ from mrcnn.utils import Dataset as MrcnnDataset
 from mrcnn.utils import extract_bboxes
 from dpn.results import Results
 from dpn.detection import Detection
+from dpn.utilities import read_image
 
 
 class Dataset(MrcnnDataset):
@@ -14,6 +15,9 @@ class Dataset(MrcnnDataset):
     # Allow the user to define a class for the dataset, if there is only one.
     MONOCLASS = False  # e.g. MONOCLASS = "sphere"
 
+    # Supported image formats, in order of preference.
+    IMAGE_FILE_EXTENSIONS = [".png", ".tif", ".tiff", ".jpg", ".jpeg"]
+
     def __init__(self, class_map=None, config=None, dataset_name=None):
         """Create and initialize a dataset object.
 
@@ -71,8 +75,9 @@ class Dataset(MrcnnDataset):
         subset_dir = subset
         dataset_dir = os.path.join(dataset_dir, subset_dir)
 
-        # Get image ids from directory names
-        image_ids = next(os.walk(dataset_dir))[1]
+        # Get image ids from directory names. Sort them, so that the order (and thereby the subset selected by limit)
+        # does not depend on the file system.
+        image_ids = sorted(next(os.walk(dataset_dir))[1])
 
         # Add images
         image_counter = 0
@@ -81,7 +86,7 @@ class Dataset(MrcnnDataset):
             self.add_image(
                 "dataset",
                 image_id=image_id,
-                path=os.path.join(dataset_dir, image_id, "images", "{}.png".format(image_id)))
+                path=self.find_image_file(os.path.join(dataset_dir, image_id, "images"), image_id))
 
             # Enforce the limit of the number of images.
             if limit is not None:
@@ -91,6 +96,33 @@ class Dataset(MrcnnDataset):
 
         self.prepare()
 
+    @staticmethod
+    def find_image_file(image_dir, image_id):
+        """Find the image file of a sample, which may be stored in any of the supported image formats.
+
+        :param image_dir: Directory of the image file.
+        :param image_id: ID of the image, i.e. the name of the image file without extension.
+        :return: Path of the image file.
+        """
+
+        for file_extension in Dataset.IMAGE_FILE_EXTENSIONS:
+            path = os.path.join(image_dir, image_id + file_extension)
+
+            if os.path.isfile(path):
+                return path
+
+        # Fall back to the default format.
+        return os.path.join(image_dir, image_id + Dataset.IMAGE_FILE_EXTENSIONS[0])
+
+    def load_image(self, image_id):
+        """Load an image as RGB image. TIFF files are read region by region (see TiffImage).
+
+        :param image_id: ID of the image.
+        :return: RGB image [height, width, 3].
+        """
+
+        return read_image(self.image_info[image_id]["path"])
+
     def load_mask(self, image_id):
         """Load instance masks of an image.
 
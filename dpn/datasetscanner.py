@@ -0,0 +1,329 @@
+from dpn.dataset import Dataset
+from dpn.sizedistribution import SizeDistribution
+from dpn.tiffimage import TiffImage, is_tiff_file, tifffile
+from dpn.utilities import read_image, calculate_equivalent_diameter
+import numpy as np
+import skimage.io
+import multiprocessing
+import json
+import os
+
+
+def get_sample_fingerprint(sample_dir):
+    """Fingerprint of the files of a sample, based on their names, sizes and modification times, so that changed
+    samples can be detected without reading them.
+
+    :param sample_dir: Directory of the sample.
+    :return: Fingerprint string.
+    """
+
+    entries = list()
+
+    for directory, _, file_names in sorted(os.walk(sample_dir)):
+        for file_name in sorted(file_names):
+            stat = os.stat(os.path.join(directory, file_name))
+            entries.append("{}:{}:{}".format(os.path.relpath(os.path.join(directory, file_name), sample_dir),
+                                             stat.st_size,
+                                             stat.st_mtime_ns))
+
+    return "|".join(entries)
+
+
+def scan_sample(sample_dir, image_id, class_names, monoclass=False):
+    """Validate a sample in the directory structure of Dataset.load_dataset and determine its statistics. The masks
+    are read in the same order as by Dataset.load_mask, so that their assignment to the annotations is checked as it is
+    used in training.
+
+    :param sample_dir: Directory of the sample.
+    :param image_id: ID of the image, i.e. the name of the sample directory.
+    :param class_names: List of valid class names.
+    :param monoclass: Class name of all instances, if the dataset has no annotations (default: False).
+    :return: Dictionary with the image size, the number of instances, class names, areas and bounding box sizes of the
+             instances, the fingerprint of the sample and a list of errors. The sample is valid, if there are no errors.
+    """
+
+    sample = {
+        "image_id": image_id,
+        "fingerprint": get_sample_fingerprint(sample_dir),
+        "height": None,
+        "width": None,
+        "number_of_instances": 0,
+        "class_names": [],
+        "areas": [],
+        "bbox_heights": [],
+        "bbox_widths": [],
+        "errors": []
+    }
+
+    errors = sample["errors"]
+
+    # Check the image.
+    image_path = Dataset.find_image_file(os.path.join(sample_dir, "images"), image_id)
+
+    try:
+        # Only read the header of TIFF files, which may be too large to be decoded as a whole.
+        if is_tiff_file(image_path) and tifffile is not None:
+            with TiffImage(image_path, intensity_range=(0, 1)) as tiff_image:
+                image_shape = tiff_image.shape
+        else:
+            image_shape = read_image(image_path).shape
+
+        sample["height"], sample["width"] = int(image_shape[0]), int(image_shape[1])
+    except Exception as error:
+        errors.append("Unreadable image {}: {}".format(image_path, error))
+
+    # Check the masks.
+    mask_dir = os.path.join(sample_dir, "masks")
+
+    if not os.path.isdir(mask_dir):
+        errors.append("Missing mask directory {}.".format(mask_dir))
+        return sample
+
+    mask_file_names = [file_name for file_name in next(os.walk(mask_dir))[2] if file_name.endswith(".png")]
+
+    if not mask_file_names:
+        errors.append("No masks in {}.".format(mask_dir))
+
+    for file_name in mask_file_names:
+        try:
+            mask = skimage.io.imread(os.path.join(mask_dir, file_name)).astype(bool)
+        except Exception as error:
+            errors.append("Unreadable mask {}: {}".format(file_name, error))
+            continue
+
+        if sample["height"] is not None and mask.shape != (sample["height"], sample["width"]):
+            errors.append("Mask {} has shape {}, but the image has shape {}.".format(
+                file_name, mask.shape, (sample["height"], sample["width"])))
+            continue
+
+        row_indices = np.flatnonzero(np.any(mask, axis=1))
+        column_indices = np.flatnonzero(np.any(mask, axis=0))
+
+        if row_indices.size == 0:
+            errors.append("Mask {} is empty.".format(file_name))
+            continue
+
+        sample["areas"].append(int(np.sum(mask)))
+        sample["bbox_heights"].append(int(row_indices[-1] - row_indices[0] + 1))
+        sample["bbox_widths"].append(int(column_indices[-1] - column_indices[0] + 1))
+
+    sample["number_of_instances"] = len(mask_file_names)
+
+    # Check the annotations.
+    if monoclass:
+        sample["class_names"] = [monoclass] * len(mask_file_names)
+    else:
+        annotation_path = os.path.join(sample_dir, "annotations.txt")
+
+        if not os.path.isfile(annotation_path):
+            errors.append("Missing annotations {}.".format(annotation_path))
+            return sample
+
+        with open(annotation_path) as file:
+            annotations = file.read().splitlines()
+
+        if len(annotations) != len(mask_file_names):
+            errors.append("{} annotations, but {} masks.".format(len(annotations), len(mask_file_names)))
+
+        unknown_class_names = sorted(set(annotations) - set(class_names))
+
+        if unknown_class_names:
+            errors.append("Unknown classes: {}.".format(", ".join(unknown_class_names)))
+
+        sample["class_names"] = annotations
+
+    return sample
+
+
+class DatasetScanner:
+    """Validate all samples of a dataset subset (see Dataset.load_dataset) in parallel and store their statistics in
+    an index file in the subset directory. Samples whose files did not change since the last scan are not read again,
+    unless the class names or the monoclass setting, which are stored in the index, changed.
+    Based on the index, config values, such as MAX_GT_INSTANCES, IMAGE_MAX_DIM and RPN_ANCHOR_SCALES, can be derived
+    from the data."""
+
+    INDEX_FILE_NAME = "dataset_index.json"
+
+    def __init__(self, dataset_dir, subset, class_names=("sphere", "cube"), monoclass=False):
+        """Create and initialize a DatasetScanner object. An existing index is loaded, if it was created with the same
+        class names and monoclass setting.
+
+        :param dataset_dir: Root directory of the dataset.
+        :param subset: Subset to scan, specified by the name of the sub-directory.
+        :param class_names: List of valid class names (default: ("sphere", "cube"), see Dataset.load_dataset).
+        :param monoclass: Class name of all instances, if the dataset has no annotations (default: False, see
+                          Dataset.MONOCLASS).
+        """
+
+        self.subset_dir = os.path.join(dataset_dir, subset)
+        self.class_names = list(class_names)
+        self.monoclass = monoclass
+
+        # Samples by image ID.
+        self.index = dict()
+
+        index_path = os.path.join(self.subset_dir, self.INDEX_FILE_NAME)
+
+        if os.path.isfile(index_path):
+            with open(index_path) as file:
+                stored_index = json.load(file)
+
+            if stored_index.get("class_names") == self.class_names and stored_index.get("monoclass") == monoclass:
+                self.index = stored_index["samples"]
+
+    # Dependant properties
+    @property
+    def samples(self):
+        """List of all samples, sorted by image ID."""
+        return [self.index[image_id] for image_id in sorted(self.index)]
+
+    @property
+    def valid_samples(self):
+        """List of the samples without errors."""
+        return [sample for sample in self.samples if not sample["errors"]]
+
+    @property
+    def invalid_samples(self):
+        """List of the samples with errors."""
+        return [sample for sample in self.samples if sample["errors"]]
+
+    @property
+    def class_size_distributions(self):
+        """Dictionary, mapping every class name to the SizeDistribution of the area equivalent diameters of its
+        instances in the valid samples."""
+
+        areas = dict()
+
+        for sample in self.valid_samples:
+            for class_name, area in zip(sample["class_names"], sample["areas"]):
+                areas.setdefault(class_name, list()).append(area)
+
+        size_distributions = dict()
+
+        for class_name, class_areas in areas.items():
+            size_distribution = SizeDistribution("px")
+            size_distribution.sizes = np.asarray(calculate_equivalent_diameter(class_areas))
+            size_distributions[class_name] = size_distribution
+
+        return size_distributions
+
+    # Methods
+    def scan(self, number_of_processes=None, verbose=True):
+        """Scan all samples that are new or changed since the last scan with a pool of processes and update the index
+        file.
+
+        :param number_of_processes: Number of worker processes (default: None, use the number of CPUs).
+        :param verbose: If True, then the number of scanned samples and the errors are printed (default: True).
+        :return: nothing
+        """
+
+        image_ids = sorted(next(os.walk(self.subset_dir))[1])
+
+        # Only scan samples that are new or were changed.
+        arguments = list()
+
+        for image_id in image_ids:
+            sample_dir = os.path.join(self.subset_dir, image_id)
+            sample = self.index.get(image_id)
+
+            if sample is None or sample["fingerprint"] != get_sample_fingerprint(sample_dir):
+                arguments.append((sample_dir, image_id, self.class_names, self.monoclass))
+
+        if number_of_processes is None:
+            number_of_processes = multiprocessing.cpu_count()
+
+        if number_of_processes > 1 and len(arguments) > 1:
+            with multiprocessing.Pool(min(number_of_processes, len(arguments))) as pool:
+                scanned_samples = pool.starmap(scan_sample, arguments)
+        else:
+            scanned_samples = [scan_sample(*argument) for argument in arguments]
+
+        # Remove samples that no longer exist.
+        self.index = {image_id: self.index[image_id] for image_id in image_ids if image_id in self.index}
+
+        for sample in scanned_samples:
+            self.index[sample["image_id"]] = sample
+
+        self.save()
+
+        if verbose:
+            print("Scanned {} of {} samples.".format(len(scanned_samples), len(image_ids)))
+
+            for sample in self.invalid_samples:
+                for error in sample["errors"]:
+                    print("{}: {}".format(sample["image_id"], error))
+
+    def save(self):
+        """Write the index file via a temporary file, so that an interruption never leaves a partial index behind.
+
+        :return: nothing
+        """
+
+        index_path = os.path.join(self.subset_dir, self.INDEX_FILE_NAME)
+        temporary_path = index_path + ".tmp"
+
+        with open(temporary_path, "w") as file:
+            json.dump({"class_names": self.class_names, "monoclass": self.monoclass, "samples": self.index}, file)
+
+        os.replace(temporary_path, index_path)
+
+    def suggest_config(self, percentile=1):
+        """Suggest config values based on the valid samples:
+        MAX_GT_INSTANCES: Largest number of instances of a sample.
+        IMAGE_MAX_DIM: Largest image side, rounded up to a multiple of 64 (as required by the model), so that images
+                       are not downscaled.
+        RPN_ANCHOR_SCALES: Five scales, one per level of the feature pyramid, doubling from the power of two that is
+                           closest to the given percentile of the major bounding box side lengths.
+
+        :param percentile: Percentile of the major bounding box side lengths that determines the smallest anchor scale
+                           (default: 1).
+        :return: Dictionary, mapping the config attributes to the suggested values.
+        """
+
+        samples = self.valid_samples
+
+        assert samples, "Expected at least one valid sample."
+
+        maximum_number_of_instances = max(sample["number_of_instances"] for sample in samples)
+        maximum_image_side = max(max(sample["height"], sample["width"]) for sample in samples)
+
+        major_bbox_side_lengths = np.concatenate([np.maximum(sample["bbox_heights"], sample["bbox_widths"])
+                                                  for sample in samples])
+        smallest_scale = 2 ** int(np.round(np.log2(np.percentile(major_bbox_side_lengths, percentile))))
+
+        return {
+            "MAX_GT_INSTANCES": int(maximum_number_of_instances),
+            "IMAGE_MAX_DIM": int(-(-maximum_image_side // 64) * 64),
+            "RPN_ANCHOR_SCALES": tuple(smallest_scale * 2 ** level for level in range(5))
+        }
+
+    def print_statistics(self):
+        """Print the number of (invalid) samples, image sizes, instance counts and the size statistics per class.
+
+        :return: nothing
+        """
+
+        samples = self.valid_samples
+
+        print("{} samples, {} invalid.".format(len(self.index), len(self.invalid_samples)))
+
+        if not samples:
+            return
+
+        heights = [sample["height"] for sample in samples]
+        widths = [sample["width"] for sample in samples]
+        numbers_of_instances = [sample["number_of_instances"] for sample in samples]
+
+        print("Image size: {}-{} x {}-{}px".format(min(heights), max(heights), min(widths), max(widths)))
+        print("Instances per image: {}-{} (mean: {:.1f})".format(min(numbers_of_instances),
+                                                                max(numbers_of_instances),
+                                                                np.mean(numbers_of_instances)))
+
+        for class_name, size_distribution in sorted(self.class_size_distributions.items()):
+            print("{}: N = {:d}; d_g = {:.1f}px; s_g = {:.3f}; d = {:.1f}-{:.1f}px".format(
+                class_name,
+                size_distribution.number_of_particles,
+                size_distribution.geometric_mean,
+                size_distribution.geometric_standard_deviation,
+                size_distribution.minimum_size,
+                size_distribution.maximum_size))
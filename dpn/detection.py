@@ -1,14 +1,17 @@
-from dpn.visualize import display_instance_outlines
+from dpn.utilities import encode_mask, decode_mask, masks_to_label_image, label_image_to_crops
 import numpy as np
 from itertools import compress
+import weakref
 from skimage.segmentation import clear_border
 from skimage.morphology import binary_erosion
-import matplotlib.pyplot as plt
 from .storable import Storable
 
 
 class Detection(Storable):
     """Class to store Detection objects."""
+
+    # Attributes with one value per instance. Their observers are notified, when they are reassigned.
+    INSTANCE_ATTRIBUTES = ("masks", "class_ids", "bboxes", "scores")
     
     def __init__(self, image, masks, class_ids, bboxes, scores, data_set=None, image_file_name=None, comment=None):
         """Create and initialize a Detection object.
@@ -32,6 +35,19 @@ class Detection(Storable):
         self.image_file_name = image_file_name
         self.comment = comment
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+
+        if name in self.INSTANCE_ATTRIBUTES:
+            for observer in list(self.__dict__.get("_observers", ())):
+                observer.on_detection_changed(self)
+
+    def __getstate__(self):
+        # Observers are not stored, but register again with restored detections.
+        state = self.__dict__.copy()
+        state.pop("_observers", None)
+        return state
+
     # Dependant properties
     @property
     def areas(self):
@@ -50,6 +66,105 @@ class Detection(Storable):
         return len(self.masks)
 
     # Methods
+    def add_observer(self, observer):
+        """Register an object whose on_detection_changed method is called, when an instance attribute (masks,
+        class_ids, bboxes or scores) is reassigned, e.g. by a filter. Observers are referenced weakly.
+
+        :param observer: Observer object, e.g. a DetectionList.
+        :return: nothing
+        """
+
+        if "_observers" not in self.__dict__:
+            self._observers = weakref.WeakSet()
+
+        self._observers.add(observer)
+
+    def to_compact(self, do_include_image=False):
+        """Convert the detection to a compact dictionary, e.g. for transmission or storage. Masks are cropped to their
+        bounding boxes and packed into bits.
+
+        :param do_include_image: Whether or not to include the image (default: False).
+        :return: Dictionary storing the compact detection.
+        """
+
+        return {
+            "image": self.image if do_include_image else None,
+            "masks": [encode_mask(mask) for mask in self.masks],
+            "class_ids": list(self.class_ids),
+            "bboxes": list(self.bboxes),
+            "scores": list(self.scores),
+            "data_set": self.data_set,
+            "image_file_name": self.image_file_name,
+            "comment": self.comment
+        }
+
+    @staticmethod
+    def from_compact(compact_detection, image=None):
+        """Create a Detection object from a compact dictionary, as returned by to_compact.
+
+        :param compact_detection: Dictionary storing the compact detection.
+        :param image: Image of the detection. If None, then the image stored in the compact detection is used
+                      (default: None).
+        :return: Detection object.
+        """
+
+        if image is None:
+            image = compact_detection["image"]
+
+        masks = [decode_mask(encoded_mask) for encoded_mask in compact_detection["masks"]]
+
+        return Detection(image,
+                         masks,
+                         list(compact_detection["class_ids"]),
+                         list(compact_detection["bboxes"]),
+                         list(compact_detection["scores"]),
+                         data_set=compact_detection["data_set"],
+                         image_file_name=compact_detection["image_file_name"],
+                         comment=compact_detection["comment"])
+
+    def to_label_image(self, do_return_overlap_areas=False):
+        """Convert the masks to a label image. Pixels that belong to several instances are assigned to the instance
+        with the highest score.
+
+        :param do_return_overlap_areas: Whether or not to return the overlap areas of the instances as well, i.e. the
+                                        number of pixels that an instance shares with other instances (default: False).
+        :return: Label image of type int32, where 0 is background and i + 1 is the i-th instance and, if
+                 do_return_overlap_areas=True, array of overlap areas.
+        """
+
+        label_image, overlap_areas = masks_to_label_image(self.masks, self.scores)
+
+        if label_image is None:
+            label_image = np.zeros(self.image.shape[:2], dtype=np.int32)
+
+        if do_return_overlap_areas:
+            return label_image, overlap_areas
+
+        return label_image
+
+    @staticmethod
+    def from_label_image(image, label_image, class_ids, scores, **kwargs):
+        """Create a Detection object from a label image.
+
+        :param image: Original image.
+        :param label_image: Label image, where 0 is background and i + 1 is the i-th instance.
+        :param class_ids: List of class IDs, one per instance.
+        :param scores: List of scores, one per instance.
+        :param kwargs: Additional arguments to be passed to the constructor (e.g. data_set).
+        :return: Detection object.
+        """
+
+        crops, bboxes = label_image_to_crops(label_image, number_of_instances=len(class_ids))
+
+        masks = list()
+
+        for crop, (y1, x1, y2, x2) in zip(crops, bboxes):
+            mask = np.zeros(label_image.shape, dtype=bool)
+            mask[y1:y2, x1:x2] = crop
+            masks.append(mask)
+
+        return Detection(image, masks, list(class_ids), bboxes.tolist(), list(scores), **kwargs)
+
     def display_detection_image(self,
                                 do_return_figure_handle=False,
                                 linewidth=1.5,
@@ -64,6 +179,9 @@ class Detection(Storable):
         :return: If do_return_figure_handle=True: Handle of the generated figure. Else: nothing
         """
 
+        # Import the plotting dependencies only when they are needed.
+        from dpn.visualize import display_instance_outlines
+
         figure_handle = display_instance_outlines(self.image,
                                                   self.masks,
                                                   linewidth=linewidth,
@@ -84,6 +202,7 @@ class Detection(Storable):
 
         # Close figure if it is not required.
         if not do_display_detections:
+            import matplotlib.pyplot as plt
             plt.close(figure_handle)
 
     def clear_border_objects(self, verbose=False):
@@ -138,7 +257,7 @@ class Detection(Storable):
         :return: nothing
         """
 
-        do_keep = [class_id is class_id_to_keep for class_id in self.class_ids]
+        do_keep = [class_id == class_id_to_keep for class_id in self.class_ids]
         self.filter_by_list(do_keep, verbose=verbose)
 
     def filter_by_minimum_area(self, minimum_area, verbose=False):
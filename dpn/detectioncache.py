@@ -0,0 +1,214 @@
+from dpn.detection import Detection
+import numpy as np
+import hashlib
+import pickle
+import os
+
+
+class DetectionCache:
+    """Content-addressed on-disk cache of detections. Entries are keyed by the hash of the image content, the hash of
+    the model weights and the configuration values that influence the inference. The detections are stored in their
+    compact form (see Detection.to_compact), without the image. If the cache exceeds its maximum size, then the least
+    recently used entries are evicted."""
+
+    # Configuration values that influence the inference.
+    INFERENCE_CONFIG_KEYS = ["BACKBONE",
+                             "BACKBONE_STRIDES",
+                             "NUM_CLASSES",
+                             "IMAGE_RESIZE_MODE",
+                             "IMAGE_MIN_DIM",
+                             "IMAGE_MAX_DIM",
+                             "IMAGE_MIN_SCALE",
+                             "MEAN_PIXEL",
+                             "RPN_ANCHOR_SCALES",
+                             "RPN_ANCHOR_RATIOS",
+                             "RPN_ANCHOR_STRIDE",
+                             "RPN_NMS_THRESHOLD",
+                             "POST_NMS_ROIS_INFERENCE",
+                             "DETECTION_MIN_CONFIDENCE",
+                             "DETECTION_NMS_THRESHOLD",
+                             "DETECTION_MAX_INSTANCES",
+                             "MASK_SHAPE"]
+
+    FILE_EXTENSION = ".pkl"
+
+    def __init__(self, cache_dir, maximum_size=10 ** 9):
+        """Create and initialize a DetectionCache object.
+
+        :param cache_dir: Directory, where the cached detections are stored.
+        :param maximum_size: Maximum size of the cache in bytes (default: 1e9).
+        """
+
+        self.cache_dir = cache_dir
+        self.maximum_size = maximum_size
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.size = sum(entry.stat().st_size for entry in self._scan_entries())
+
+        # Statistics
+        self.number_of_hits = 0
+        self.number_of_misses = 0
+        self.number_of_evictions = 0
+
+    # Dependant properties
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that were answered by the cache."""
+        number_of_lookups = self.number_of_hits + self.number_of_misses
+
+        if number_of_lookups == 0:
+            return 0.0
+
+        return self.number_of_hits / number_of_lookups
+
+    @property
+    def statistics(self):
+        """Dictionary with the number of hits, misses and evictions, the hit rate and the size of the cache."""
+        return {
+            "hits": self.number_of_hits,
+            "misses": self.number_of_misses,
+            "evictions": self.number_of_evictions,
+            "hit_rate": self.hit_rate,
+            "size": self.size
+        }
+
+    # Methods
+    @staticmethod
+    def get_model_fingerprint(model):
+        """Calculate a hash of the weights and of the inference-relevant configuration of a model.
+
+        :param model: Model object.
+        :return: Hexadecimal hash string.
+        """
+
+        hash_object = hashlib.sha256()
+
+        for weights in model.keras_model.get_weights():
+            hash_object.update(np.ascontiguousarray(weights).tobytes())
+
+        for key in DetectionCache.INFERENCE_CONFIG_KEYS:
+            value = getattr(model.config, key, None)
+
+            if isinstance(value, np.ndarray):
+                value = value.tolist()
+
+            hash_object.update("{}={!r};".format(key, value).encode())
+
+        return hash_object.hexdigest()
+
+    def get_key(self, image, model_fingerprint):
+        """Calculate the cache key of an image.
+
+        :param image: Image.
+        :param model_fingerprint: Fingerprint of the model, as returned by get_model_fingerprint.
+        :return: Hexadecimal hash string.
+        """
+
+        image = np.ascontiguousarray(image)
+
+        hash_object = hashlib.sha256()
+        hash_object.update(model_fingerprint.encode())
+        hash_object.update("{}{}".format(image.shape, image.dtype.str).encode())
+        hash_object.update(image.tobytes())
+
+        return hash_object.hexdigest()
+
+    def get(self, key, image=None):
+        """Look up a detection.
+
+        :param key: Cache key, as returned by get_key.
+        :param image: Image to attach to the detection (default: None).
+        :return: Detection object or None, if the key is not in the cache.
+        """
+
+        entry_path = self._get_entry_path(key)
+
+        try:
+            with open(entry_path, "rb") as file:
+                compact_detection = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.number_of_misses += 1
+            return None
+
+        # Mark the entry as recently used.
+        os.utime(entry_path)
+
+        self.number_of_hits += 1
+
+        return Detection.from_compact(compact_detection, image=image)
+
+    def put(self, key, detection):
+        """Store a detection.
+
+        :param key: Cache key, as returned by get_key.
+        :param detection: Detection object.
+        :return: nothing
+        """
+
+        entry_path = self._get_entry_path(key)
+        temporary_path = entry_path + ".tmp"
+
+        if os.path.isfile(entry_path):
+            self.size -= os.path.getsize(entry_path)
+
+        # Write to a temporary file first, so that an interrupted write does not leave a corrupt entry.
+        with open(temporary_path, "wb") as file:
+            pickle.dump(detection.to_compact(), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temporary_path, entry_path)
+
+        self.size += os.path.getsize(entry_path)
+
+        if self.size > self.maximum_size:
+            self.evict()
+
+    def evict(self, target_fraction=0.9):
+        """Evict the least recently used entries, until the cache is smaller than a fraction of its maximum size.
+
+        :param target_fraction: Fraction of the maximum size to shrink the cache to (default: 0.9).
+        :return: nothing
+        """
+
+        entries = sorted(self._scan_entries(), key=lambda entry: entry.stat().st_mtime)
+
+        self.size = sum(entry.stat().st_size for entry in entries)
+
+        for entry in entries:
+            if self.size <= target_fraction * self.maximum_size:
+                break
+
+            entry_size = entry.stat().st_size
+            os.remove(entry.path)
+
+            self.size -= entry_size
+            self.number_of_evictions += 1
+
+    def clear(self):
+        """Remove all entries from the cache.
+
+        :return: nothing
+        """
+
+        for entry in self._scan_entries():
+            os.remove(entry.path)
+
+        self.size = 0
+
+    def _get_entry_path(self, key):
+        """Get the file path of a cache entry.
+
+        :param key: Cache key.
+        :return: Path of the entry.
+        """
+
+        return os.path.join(self.cache_dir, key + self.FILE_EXTENSION)
+
+    def _scan_entries(self):
+        """List the entries of the cache.
+
+        :return: List of os.DirEntry objects.
+        """
+
+        return [entry for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and entry.name.endswith(self.FILE_EXTENSION)]
@@ -0,0 +1,273 @@
+from dpn.storable import dump, load
+from collections import OrderedDict
+from collections.abc import MutableSequence
+import tempfile
+import io
+import weakref
+import shutil
+import os
+
+
+def get_detection_size(detection):
+    """Estimate the memory usage of a detection, based on its image and masks.
+
+    :param detection: Detection object.
+    :return: Number of bytes.
+    """
+
+    size = getattr(detection.image, "nbytes", 0)
+    size += sum(getattr(mask, "nbytes", 0) for mask in detection.masks)
+
+    return size
+
+
+class SpilledDetection:
+    """Detection in its serialized form, as stored in a spill file. SpillingDetectionList objects are pickled as a
+    sequence of SpilledDetection objects, so that their detections are neither loaded nor kept in memory all at once."""
+
+    def __init__(self, data):
+        """Create and initialize a SpilledDetection object.
+
+        :param data: Bytes of the spill file (see dpn.storable.dump).
+        """
+
+        self.data = data
+
+
+class DetectionList(MutableSequence):
+    """List of detections in memory, which counts its changes and the reassignments of instance attributes of its
+    detections (see Detection.add_observer), so that objects that cache values derived from the detections (e.g.
+    Results) can detect that they were changed."""
+
+    def __init__(self, detections=None):
+        """Create and initialize a DetectionList object.
+
+        :param detections: Initial detections (default: None).
+        """
+
+        self._detections = list()
+        self.modification_count = 0
+
+        if detections is not None:
+            self.extend(detections)
+
+    def __getstate__(self):
+        return {"detections": self._detections}
+
+    def __setstate__(self, state):
+        # Register with the restored detections again.
+        self.__init__(state["detections"])
+
+    # Methods
+    def __len__(self):
+        return len(self._detections)
+
+    def __getitem__(self, index):
+        return self._detections[index]
+
+    def __setitem__(self, index, detection):
+        self._detections[index] = detection
+        detection.add_observer(self)
+        self.modification_count += 1
+
+    def __delitem__(self, index):
+        del self._detections[index]
+        self.modification_count += 1
+
+    def insert(self, index, detection):
+        self._detections.insert(index, detection)
+        detection.add_observer(self)
+        self.modification_count += 1
+
+    def on_detection_changed(self, detection):
+        """Count the change of an instance attribute of a detection (see Detection.add_observer).
+
+        :param detection: Changed Detection object.
+        :return: nothing
+        """
+
+        self.modification_count += 1
+
+
+class SpillingDetectionList(MutableSequence):
+    """List of detections with a memory budget. Once the detections in memory exceed the budget, the least recently
+    used detections are spilled to files in a spill directory and transparently loaded again on access. Detections are
+    always written when they are spilled, so that changes of detections that were accessed in the meantime are kept.
+    Like DetectionList, it counts its changes and the reassignments of instance attributes of its detections in memory.
+
+    When the list is pickled (e.g. as part of Results.save), the detections are read one after another from their spill
+    files, or serialized, if they are in memory, and stored as SpilledDetection objects. When it is unpickled, they are
+    written to spill files without being deserialized, so that the list never loads all of its detections."""
+
+    def __init__(self, memory_budget, spill_dir=None, detections=None):
+        """Create and initialize a SpillingDetectionList object.
+
+        :param memory_budget: Maximum memory usage of the detections in memory in bytes. The most recently used
+                              detection is always kept in memory, even if it exceeds the budget on its own.
+        :param spill_dir: Directory, in which the temporary directory for the spilled detections is created. The
+                          temporary directory is removed along with the object (default: None, use the default
+                          directory for temporary files).
+        :param detections: Initial detections or SpilledDetection objects (default: None).
+        """
+
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        # Every list uses its own directory, so that lists with the same spill_dir (e.g. a list and its unpickled copy)
+        # do not overwrite the spill files of each other.
+        self._entry_dir = tempfile.mkdtemp(prefix="dpn_spilled_detections_", dir=spill_dir)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self._entry_dir, True)
+
+        # Every entry has a unique ID, which names its spill file.
+        self._entry_ids = list()
+        self._next_entry_id = 0
+
+        # Detections in memory and their sizes by entry ID, in order of their last use.
+        self._resident_detections = OrderedDict()
+        self.memory_usage = 0
+
+        self.modification_count = 0
+
+        if detections is not None:
+            self.extend(detections)
+
+    def __reduce__(self):
+        # The spill files are temporary, so that the detections are stored as items of the list, which pickle takes
+        # from the iterator one after another.
+        return SpillingDetectionList, (self.memory_budget, self.spill_dir), None, self._iterate_spilled_detections()
+
+    # Dependant properties
+    @property
+    def number_of_spilled_detections(self):
+        """Number of detections that are currently stored on disk only."""
+        return len(self._entry_ids) - len(self._resident_detections)
+
+    # Methods
+    def __len__(self):
+        return len(self._entry_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        entry_id = self._entry_ids[index]
+
+        if entry_id in self._resident_detections:
+            self._resident_detections.move_to_end(entry_id)
+            return self._resident_detections[entry_id][0]
+
+        with open(self._get_spill_path(entry_id), "rb") as file:
+            detection = load(file)
+
+        self._add_resident_detection(entry_id, detection)
+
+        return detection
+
+    def __setitem__(self, index, detection):
+        entry_id = self._entry_ids[index]
+
+        self._remove_resident_detection(entry_id)
+        self._add_resident_detection(entry_id, detection)
+
+        self.modification_count += 1
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for i in sorted(range(*index.indices(len(self))), reverse=True):
+                del self[i]
+            return
+
+        entry_id = self._entry_ids.pop(index)
+
+        self._remove_resident_detection(entry_id)
+
+        spill_path = self._get_spill_path(entry_id)
+        if os.path.isfile(spill_path):
+            os.remove(spill_path)
+
+        self.modification_count += 1
+
+    def insert(self, index, detection):
+        entry_id = self._next_entry_id
+        self._next_entry_id += 1
+
+        self._entry_ids.insert(index, entry_id)
+
+        if isinstance(detection, SpilledDetection):
+            with open(self._get_spill_path(entry_id), "wb") as file:
+                file.write(detection.data)
+        else:
+            self._add_resident_detection(entry_id, detection)
+
+        self.modification_count += 1
+
+    def on_detection_changed(self, detection):
+        """Count the change of an instance attribute of a detection (see Detection.add_observer).
+
+        :param detection: Changed Detection object.
+        :return: nothing
+        """
+
+        self.modification_count += 1
+
+    def _get_spill_path(self, entry_id):
+        """Path of the spill file of an entry.
+
+        :param entry_id: ID of the entry.
+        :return: Path.
+        """
+
+        return os.path.join(self._entry_dir, "detection_{:d}.pkl".format(entry_id))
+
+    def _iterate_spilled_detections(self):
+        """Iterate over the detections in their serialized form, without changing which detections are in memory.
+
+        :return: Generator of SpilledDetection objects.
+        """
+
+        for entry_id in list(self._entry_ids):
+            if entry_id in self._resident_detections:
+                file = io.BytesIO()
+                dump(self._resident_detections[entry_id][0], file)
+                data = file.getvalue()
+            else:
+                with open(self._get_spill_path(entry_id), "rb") as file:
+                    data = file.read()
+
+            yield SpilledDetection(data)
+
+    def _add_resident_detection(self, entry_id, detection):
+        """Keep a detection in memory as most recently used and spill the least recently used detections, if the
+        budget is exceeded.
+
+        :param entry_id: ID of the entry.
+        :param detection: Detection object.
+        :return: nothing
+        """
+
+        detection.add_observer(self)
+
+        size = get_detection_size(detection)
+        self._resident_detections[entry_id] = (detection, size)
+        self.memory_usage += size
+
+        while self.memory_usage > self.memory_budget and len(self._resident_detections) > 1:
+            spilled_entry_id, (spilled_detection, spilled_size) = self._resident_detections.popitem(last=False)
+            self.memory_usage -= spilled_size
+
+            with open(self._get_spill_path(spilled_entry_id), "wb") as file:
+                dump(spilled_detection, file)
+
+    def _remove_resident_detection(self, entry_id):
+        """Remove a detection from memory without spilling it, before it is replaced or deleted.
+
+        :param entry_id: ID of the entry.
+        :return: nothing
+        """
+
+        if entry_id in self._resident_detections:
+            _, size = self._resident_detections.pop(entry_id)
+            self.memory_usage -= size
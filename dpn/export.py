@@ -0,0 +1,247 @@
+from dpn.utilities import calculate_equivalent_diameter, get_maximum_feret_diameter
+from skimage.measure import regionprops
+from skimage.morphology import binary_erosion
+import numpy as np
+import csv
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ["image_id", "data_set", "image_file_name", "instance_id", "class_id", "score",
+           "y1", "x1", "y2", "x2", "area", "perimeter", "circularity",
+           "equivalent_diameter", "equivalent_diameter_convex", "major_axis_length", "major_bbox_side_length"]
+
+FILE_FORMATS = ["csv", "parquet"]
+
+# Columns that are stored as strings, integers or floats in Parquet files.
+STRING_COLUMNS = ["image_id", "data_set", "image_file_name"]
+FLOAT_COLUMNS = ["score", "circularity", "equivalent_diameter", "equivalent_diameter_convex", "major_axis_length",
+                 "maximum_feret_diameter"]
+
+
+def measure_detection(detection, image_id=None, do_measure_maximum_feret_diameter=False):
+    """Measure all instances of a detection. Every mask is only processed within its extent (plus a margin of one
+    pixel), so that the costs depend on the size of the particles rather than the size of the image. The bounding box
+    columns are taken from the bounding boxes of the detection. Empty masks yield rows with NaN measurements, so that
+    there is one row per instance.
+
+    :param detection: Detection object.
+    :param image_id: ID of the image (default: None).
+    :param do_measure_maximum_feret_diameter: Whether or not to measure the (expensive) maximum Feret diameter
+                                              (default: False).
+    :return: Dictionary, mapping the column names to lists of values, one per instance.
+    """
+
+    columns = COLUMNS + (["maximum_feret_diameter"] if do_measure_maximum_feret_diameter else [])
+    rows = {column: list() for column in columns}
+
+    for instance_id, (mask, bbox, class_id, score) in enumerate(zip(detection.masks, detection.bboxes,
+                                                                    detection.class_ids, detection.scores)):
+        mask = np.asarray(mask, dtype=bool)
+        height, width = mask.shape
+
+        # Bounding box columns are based on the bounding boxes of the detection, like Results.measure.
+        y1, x1, y2, x2 = [int(coordinate) for coordinate in bbox]
+
+        rows["image_id"].append(image_id)
+        rows["data_set"].append(detection.data_set)
+        rows["image_file_name"].append(detection.image_file_name)
+        rows["instance_id"].append(instance_id)
+        rows["class_id"].append(int(class_id))
+        rows["score"].append(float(score))
+        rows["y1"].append(y1)
+        rows["x1"].append(x1)
+        rows["y2"].append(y2)
+        rows["x2"].append(x2)
+        rows["major_bbox_side_length"].append(max(y2 - y1, x2 - x1))
+
+        # The mask is only processed within its own extent.
+        row_indices = np.flatnonzero(np.any(mask, axis=1))
+        column_indices = np.flatnonzero(np.any(mask, axis=0))
+
+        if row_indices.size == 0:
+            # Empty masks cannot be measured.
+            rows["area"].append(0)
+            rows["perimeter"].append(0)
+
+            for column in ["circularity", "equivalent_diameter", "equivalent_diameter_convex", "major_axis_length"]:
+                rows[column].append(np.nan)
+
+            if do_measure_maximum_feret_diameter:
+                rows["maximum_feret_diameter"].append(np.nan)
+
+            continue
+
+        mask_y1, mask_y2 = int(row_indices[0]), int(row_indices[-1]) + 1
+        mask_x1, mask_x2 = int(column_indices[0]), int(column_indices[-1]) + 1
+
+        # Keep a margin, so that the erosion yields the same outline as for the full mask.
+        crop = mask[max(mask_y1 - 1, 0):min(mask_y2 + 1, height), max(mask_x1 - 1, 0):min(mask_x2 + 1, width)]
+
+        area = int(np.sum(crop))
+        perimeter = int(np.sum(crop ^ binary_erosion(crop)))
+        instance = regionprops(crop.astype(np.uint8))[0]
+
+        rows["area"].append(area)
+        rows["perimeter"].append(perimeter)
+        rows["circularity"].append(4 * np.pi * area / perimeter ** 2 if perimeter > 0 else np.nan)
+        rows["equivalent_diameter"].append(float(calculate_equivalent_diameter(instance.filled_area)))
+        rows["equivalent_diameter_convex"].append(float(calculate_equivalent_diameter(instance.convex_area)))
+        rows["major_axis_length"].append(float(instance.major_axis_length))
+
+        if do_measure_maximum_feret_diameter:
+            maximum_feret_diameters = get_maximum_feret_diameter([crop], do_skip_invalid_masks=False)
+            rows["maximum_feret_diameter"].append(float(maximum_feret_diameters[0]))
+
+    return rows
+
+
+class ParticleExporter:
+    """Stream per-particle measurements to a CSV or Parquet file. Detections are measured as they are appended and the
+    rows are written in chunks of chunk_size rows, so that neither the masks nor all rows have to be kept in memory.
+    Writing Parquet files requires the pyarrow package."""
+
+    def __init__(self, output_path, file_format=None, chunk_size=100000, do_measure_maximum_feret_diameter=False):
+        """Create and initialize a ParticleExporter object.
+
+        :param output_path: Path of the output file.
+        :param file_format: "csv" or "parquet" (default: None, derive the format from the file extension).
+        :param chunk_size: Number of rows that are buffered before they are written (default: 100000).
+        :param do_measure_maximum_feret_diameter: Whether or not to measure the (expensive) maximum Feret diameter
+                                                  (default: False).
+        """
+
+        if file_format is None:
+            file_format = os.path.splitext(output_path)[1].lstrip(".").lower()
+
+        assert file_format in FILE_FORMATS, "Expected file_format to be one of the following: {}.".format(FILE_FORMATS)
+
+        self.output_path = output_path
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.do_measure_maximum_feret_diameter = do_measure_maximum_feret_diameter
+
+        self.columns = COLUMNS + (["maximum_feret_diameter"] if do_measure_maximum_feret_diameter else [])
+        self.number_of_rows = 0
+        self.number_of_detections = 0
+
+        self._buffer = {column: list() for column in self.columns}
+        self._number_of_buffered_rows = 0
+
+        if file_format == "csv":
+            self._file = open(output_path, "w", newline="")
+            self._csv_writer = csv.writer(self._file)
+            self._csv_writer.writerow(self.columns)
+        else:
+            assert pyarrow is not None, "Writing Parquet files requires the pyarrow package."
+
+            fields = list()
+            for column in self.columns:
+                if column in STRING_COLUMNS:
+                    data_type = pyarrow.string()
+                elif column in FLOAT_COLUMNS:
+                    data_type = pyarrow.float64()
+                else:
+                    data_type = pyarrow.int64()
+
+                fields.append(pyarrow.field(column, data_type))
+
+            self._schema = pyarrow.schema(fields)
+            self._parquet_writer = pyarrow.parquet.ParquetWriter(output_path, self._schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Methods
+    def append_detection(self, detection, image_id=None):
+        """Measure the instances of a detection and append them to the export.
+
+        :param detection: Detection object.
+        :param image_id: ID of the image (default: None, use the number of previously appended detections).
+        :return: nothing
+        """
+
+        if image_id is None:
+            image_id = self.number_of_detections
+
+        rows = measure_detection(detection,
+                                 image_id=image_id,
+                                 do_measure_maximum_feret_diameter=self.do_measure_maximum_feret_diameter)
+
+        for column in self.columns:
+            self._buffer[column] += rows[column]
+
+        self._number_of_buffered_rows += len(rows["instance_id"])
+        self.number_of_detections += 1
+
+        if self._number_of_buffered_rows >= self.chunk_size:
+            self.flush()
+
+    def append_results(self, results):
+        """Append all detections of a Results object.
+
+        :param results: Results object.
+        :return: nothing
+        """
+
+        for detection in results.detections:
+            self.append_detection(detection)
+
+    def flush(self):
+        """Write the buffered rows.
+
+        :return: nothing
+        """
+
+        if self._number_of_buffered_rows == 0:
+            return
+
+        if self.file_format == "csv":
+            self._csv_writer.writerows(zip(*[self._buffer[column] for column in self.columns]))
+            self._file.flush()
+        else:
+            # Image IDs may be integers (e.g. indices) or strings (e.g. directory names).
+            self._buffer["image_id"] = [None if image_id is None else str(image_id)
+                                        for image_id in self._buffer["image_id"]]
+
+            self._parquet_writer.write_table(pyarrow.Table.from_pydict(self._buffer, schema=self._schema))
+
+        self.number_of_rows += self._number_of_buffered_rows
+
+        self._buffer = {column: list() for column in self.columns}
+        self._number_of_buffered_rows = 0
+
+    def close(self):
+        """Write the remaining rows and close the file.
+
+        :return: nothing
+        """
+
+        self.flush()
+
+        if self.file_format == "csv":
+            self._file.close()
+        else:
+            self._parquet_writer.close()
+
+
+def export_results(results, output_path, **kwargs):
+    """Export the per-particle measurements of a Results object to a CSV or Parquet file.
+
+    :param results: Results object.
+    :param output_path: Path of the output file.
+    :param kwargs: Additional arguments to be passed to ParticleExporter.
+    :return: Number of exported particles.
+    """
+
+    with ParticleExporter(output_path, **kwargs) as exporter:
+        exporter.append_results(results)
+
+    return exporter.number_of_rows
@@ -0,0 +1,351 @@
+from dpn.model import Model
+from mrcnn.model import resnet_graph, build_rpn_model, ProposalLayer, DetectionTargetLayer, fpn_classifier_graph, \
+    build_fpn_mask_graph, norm_boxes_graph, parse_image_meta_graph, rpn_class_loss_graph, rpn_bbox_loss_graph, \
+    mrcnn_class_loss_graph, mrcnn_bbox_loss_graph, mrcnn_mask_loss_graph, data_generator, load_image_gt, mold_image
+import keras.layers as KL
+import keras.models as KM
+import tensorflow as tf
+import numpy as np
+import json
+import os
+
+
+class BackboneFeatureCache:
+    """Memory-mapped on-disk cache of the backbone feature maps (C2, C3, C4, C5) of the un-augmented images of a
+    dataset. Each level is stored as one array of shape [number of images, height, width, channels]."""
+
+    LEVEL_NAMES = ["C2", "C3", "C4", "C5"]
+    INDEX_FILE_NAME = "index.json"
+
+    def __init__(self, cache_dir, dtype="float16"):
+        """Create and initialize a BackboneFeatureCache object.
+
+        :param cache_dir: Directory, where the feature maps are stored.
+        :param dtype: Data type of the stored feature maps (default: "float16").
+        """
+
+        self.cache_dir = cache_dir
+        self.dtype = np.dtype(dtype)
+
+        self.index = None
+        self.feature_maps = None
+
+        index_path = os.path.join(cache_dir, self.INDEX_FILE_NAME)
+
+        if os.path.isfile(index_path):
+            with open(index_path) as file:
+                self.index = json.load(file)
+
+    # Methods
+    def is_valid(self, dataset):
+        """Check whether the cache contains the feature maps of all images of a dataset.
+
+        :param dataset: Dataset object.
+        :return: True, if the cache is complete and matches the dataset.
+        """
+
+        if self.index is None:
+            return False
+
+        image_paths = [dataset.image_info[image_id]["path"] for image_id in dataset.image_ids]
+
+        return self.index["image_paths"] == image_paths and self.index["dtype"] == self.dtype.str
+
+    def build(self, backbone_model, dataset, config, verbose=True):
+        """Run the backbone once over the un-augmented images of a dataset and store the feature maps.
+
+        :param backbone_model: Keras model that maps molded images to the feature maps C2, C3, C4 and C5.
+        :param dataset: Dataset object.
+        :param config: Config object.
+        :param verbose: If True, then the progress is printed (default: True).
+        :return: nothing
+        """
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        image_ids = list(dataset.image_ids)
+        number_of_images = len(image_ids)
+
+        feature_maps = None
+
+        for batch_start in range(0, number_of_images, config.BATCH_SIZE):
+            batch_image_ids = image_ids[batch_start:batch_start + config.BATCH_SIZE]
+
+            molded_images = list()
+            for image_id in batch_image_ids:
+                image, _, _, _, _ = load_image_gt(dataset, config, image_id, augment=False, augmentation=None)
+                molded_images.append(mold_image(image.astype(np.float32), config))
+
+            batch_feature_maps = backbone_model.predict(np.stack(molded_images), batch_size=len(molded_images))
+
+            # Allocate the memory-mapped arrays, as soon as the shapes of the feature maps are known.
+            if feature_maps is None:
+                feature_maps = [np.lib.format.open_memmap(self._get_level_path(level_name),
+                                                          mode="w+",
+                                                          dtype=self.dtype,
+                                                          shape=(number_of_images,) + level_feature_maps.shape[1:])
+                                for level_name, level_feature_maps in zip(self.LEVEL_NAMES, batch_feature_maps)]
+
+            for level_feature_maps, batch_level_feature_maps in zip(feature_maps, batch_feature_maps):
+                level_feature_maps[batch_start:batch_start + len(batch_image_ids)] = batch_level_feature_maps
+
+            if verbose:
+                print("\r   Caching backbone features: {}/{}".format(batch_start + len(batch_image_ids),
+                                                                      number_of_images), end="")
+
+        if verbose:
+            print("")
+
+        for level_feature_maps in feature_maps:
+            level_feature_maps.flush()
+
+        # Write the index last, so that an interrupted build is detected as invalid.
+        self.index = {
+            "image_paths": [dataset.image_info[image_id]["path"] for image_id in image_ids],
+            "image_ids": [int(image_id) for image_id in image_ids],
+            "dtype": self.dtype.str
+        }
+
+        with open(os.path.join(self.cache_dir, self.INDEX_FILE_NAME), "w") as file:
+            json.dump(self.index, file)
+
+        self.feature_maps = None
+
+    def get_feature_maps(self, image_ids):
+        """Get the feature maps of a batch of images.
+
+        :param image_ids: List of dataset image IDs.
+        :return: List of float32 arrays, one for each level, of shape [batch size, height, width, channels].
+        """
+
+        # Open the memory maps lazily, so that every data generator worker process maps the files on its own.
+        if self.feature_maps is None:
+            self.feature_maps = [np.load(self._get_level_path(level_name), mmap_mode="r")
+                                 for level_name in self.LEVEL_NAMES]
+
+        row_of_image_id = {image_id: row for row, image_id in enumerate(self.index["image_ids"])}
+        rows = [row_of_image_id[int(image_id)] for image_id in image_ids]
+
+        return [level_feature_maps[rows].astype(np.float32) for level_feature_maps in self.feature_maps]
+
+    def _get_level_path(self, level_name):
+        """Get the path of the file storing the feature maps of a level.
+
+        :param level_name: Name of the level.
+        :return: File path.
+        """
+
+        return os.path.join(self.cache_dir, level_name + ".npy")
+
+
+def feature_cache_generator(dataset, config, feature_cache, shuffle=True):
+    """Data generator that replaces the images of the default data generator with their cached backbone feature maps.
+    Augmentation is not supported, since the feature maps are computed for the un-augmented images.
+
+    :param dataset: Dataset object.
+    :param config: Config object.
+    :param feature_cache: BackboneFeatureCache object, containing the feature maps of the dataset.
+    :param shuffle: Whether or not to shuffle the samples (default: True).
+    :return: Generator yielding the inputs and outputs of the HeadTrainingModel.
+    """
+
+    generator = data_generator(dataset, config, shuffle=shuffle, augmentation=None, batch_size=config.BATCH_SIZE)
+
+    for inputs, outputs in generator:
+        batch_image_meta = inputs[1]
+        image_ids = batch_image_meta[:, 0].astype(np.int64)
+
+        yield feature_cache.get_feature_maps(image_ids) + inputs[1:], outputs
+
+
+class HeadTrainingModel(Model):
+    """Model to train the FPN, RPN and heads (i.e. config.LAYERS = "heads") from cached backbone feature maps. The
+    frozen ResNet backbone is only run once per image, to fill the feature cache, instead of once per sample and epoch.
+
+    The checkpoints contain the weights of the FPN, RPN and heads. To use them for inference, load the backbone weights
+    (e.g. via config.USE_PRETRAINED_WEIGHTS) and then the checkpoint with Model.load_weights(path, by_name=True).
+    """
+
+    def __init__(self, config, model_dir):
+        """Create and initialize a HeadTrainingModel object.
+
+        :param config: Config object. config.FEATURE_CACHE_PATH must be set.
+        :param model_dir: Directory, where the config, training logs and trained weights of the model are saved.
+        """
+
+        assert config.FEATURE_CACHE_PATH is not None, "Expected config.FEATURE_CACHE_PATH to be set."
+        assert config.LAYERS == "heads", "Expected config.LAYERS to be \"heads\"."
+        assert not config.TRAIN_BN, "Cached backbone features require frozen batch normalization layers."
+        assert config.IMAGE_RESIZE_MODE == "square", \
+            "Cached backbone features require config.IMAGE_RESIZE_MODE = \"square\"."
+        assert config.AUGMENTATION is None, "Cached backbone features do not support augmentation."
+
+        self.backbone_model = None
+
+        super().__init__("training", config, model_dir)
+
+    def build(self, mode, config):
+        """Build the backbone model, to fill the feature cache, and the head model, which takes the feature maps of
+        the backbone as inputs. Layer names are identical to the ones of the MaskRCNN architecture, so that weights can
+        be exchanged by name.
+
+        :param mode: Must be "training".
+        :param config: Config object.
+        :return: Keras model of the FPN, RPN and heads.
+        """
+
+        assert mode == "training", "HeadTrainingModel only supports the training mode."
+
+        # Backbone
+        input_image = KL.Input(shape=[None, None, config.IMAGE_SHAPE[2]], name="input_image")
+        _, C2, C3, C4, C5 = resnet_graph(input_image, config.BACKBONE, stage5=True, train_bn=config.TRAIN_BN)
+        self.backbone_model = KM.Model(input_image, [C2, C3, C4, C5], name="backbone")
+
+        # Inputs
+        feature_shapes = [
+            [config.IMAGE_SHAPE[0] // stride, config.IMAGE_SHAPE[1] // stride, int(feature_map.shape[-1])]
+            for stride, feature_map in zip([4, 8, 16, 32], [C2, C3, C4, C5])]
+        input_C2, input_C3, input_C4, input_C5 = [
+            KL.Input(shape=feature_shape, name="input_" + level_name.lower())
+            for feature_shape, level_name in zip(feature_shapes, BackboneFeatureCache.LEVEL_NAMES)]
+
+        input_image_meta = KL.Input(shape=[config.IMAGE_META_SIZE], name="input_image_meta")
+        input_rpn_match = KL.Input(shape=[None, 1], name="input_rpn_match", dtype=tf.int32)
+        input_rpn_bbox = KL.Input(shape=[None, 4], name="input_rpn_bbox", dtype=tf.float32)
+        input_gt_class_ids = KL.Input(shape=[None], name="input_gt_class_ids", dtype=tf.int32)
+        input_gt_boxes = KL.Input(shape=[None, 4], name="input_gt_boxes", dtype=tf.float32)
+        gt_boxes = KL.Lambda(lambda x: norm_boxes_graph(x, config.IMAGE_SHAPE[:2]))(input_gt_boxes)
+
+        if config.USE_MINI_MASK:
+            input_gt_masks = KL.Input(shape=[config.MINI_MASK_SHAPE[0], config.MINI_MASK_SHAPE[1], None],
+                                      name="input_gt_masks", dtype=bool)
+        else:
+            input_gt_masks = KL.Input(shape=[config.IMAGE_SHAPE[0], config.IMAGE_SHAPE[1], None],
+                                      name="input_gt_masks", dtype=bool)
+
+        # FPN
+        P5 = KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (1, 1), name="fpn_c5p5")(input_C5)
+        P4 = KL.Add(name="fpn_p4add")([
+            KL.UpSampling2D(size=(2, 2), name="fpn_p5upsampled")(P5),
+            KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (1, 1), name="fpn_c4p4")(input_C4)])
+        P3 = KL.Add(name="fpn_p3add")([
+            KL.UpSampling2D(size=(2, 2), name="fpn_p4upsampled")(P4),
+            KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (1, 1), name="fpn_c3p3")(input_C3)])
+        P2 = KL.Add(name="fpn_p2add")([
+            KL.UpSampling2D(size=(2, 2), name="fpn_p3upsampled")(P3),
+            KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (1, 1), name="fpn_c2p2")(input_C2)])
+        P2 = KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (3, 3), padding="SAME", name="fpn_p2")(P2)
+        P3 = KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (3, 3), padding="SAME", name="fpn_p3")(P3)
+        P4 = KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (3, 3), padding="SAME", name="fpn_p4")(P4)
+        P5 = KL.Conv2D(config.TOP_DOWN_PYRAMID_SIZE, (3, 3), padding="SAME", name="fpn_p5")(P5)
+        P6 = KL.MaxPooling2D(pool_size=(1, 1), strides=2, name="fpn_p6")(P5)
+
+        rpn_feature_maps = [P2, P3, P4, P5, P6]
+        mrcnn_feature_maps = [P2, P3, P4, P5]
+
+        # Anchors
+        anchors = self.get_anchors(config.IMAGE_SHAPE)
+        anchors = np.broadcast_to(anchors, (config.BATCH_SIZE,) + anchors.shape)
+        anchors = KL.Lambda(lambda x: tf.Variable(anchors), name="anchors")(input_image_meta)
+
+        # RPN
+        rpn = build_rpn_model(config.RPN_ANCHOR_STRIDE, len(config.RPN_ANCHOR_RATIOS), config.TOP_DOWN_PYRAMID_SIZE)
+
+        layer_outputs = [rpn([p]) for p in rpn_feature_maps]
+        output_names = ["rpn_class_logits", "rpn_class", "rpn_bbox"]
+        outputs = list(zip(*layer_outputs))
+        outputs = [KL.Concatenate(axis=1, name=n)(list(o)) for o, n in zip(outputs, output_names)]
+        rpn_class_logits, rpn_class, rpn_bbox = outputs
+
+        rpn_rois = ProposalLayer(proposal_count=config.POST_NMS_ROIS_TRAINING,
+                                 nms_threshold=config.RPN_NMS_THRESHOLD,
+                                 name="ROI",
+                                 config=config)([rpn_class, rpn_bbox, anchors])
+
+        # Heads
+        active_class_ids = KL.Lambda(lambda x: parse_image_meta_graph(x)["active_class_ids"])(input_image_meta)
+
+        rois, target_class_ids, target_bbox, target_mask = DetectionTargetLayer(config, name="proposal_targets")(
+            [rpn_rois, input_gt_class_ids, gt_boxes, input_gt_masks])
+
+        mrcnn_class_logits, mrcnn_class, mrcnn_bbox = fpn_classifier_graph(
+            rois, mrcnn_feature_maps, input_image_meta, config.POOL_SIZE, config.NUM_CLASSES,
+            train_bn=config.TRAIN_BN, fc_layers_size=config.FPN_CLASSIF_FC_LAYERS_SIZE)
+
+        mrcnn_mask = build_fpn_mask_graph(rois, mrcnn_feature_maps, input_image_meta, config.MASK_POOL_SIZE,
+                                          config.NUM_CLASSES, train_bn=config.TRAIN_BN)
+
+        output_rois = KL.Lambda(lambda x: x * 1, name="output_rois")(rois)
+
+        # Losses
+        rpn_class_loss = KL.Lambda(lambda x: rpn_class_loss_graph(*x), name="rpn_class_loss")(
+            [input_rpn_match, rpn_class_logits])
+        rpn_bbox_loss = KL.Lambda(lambda x: rpn_bbox_loss_graph(config, *x), name="rpn_bbox_loss")(
+            [input_rpn_bbox, input_rpn_match, rpn_bbox])
+        class_loss = KL.Lambda(lambda x: mrcnn_class_loss_graph(*x), name="mrcnn_class_loss")(
+            [target_class_ids, mrcnn_class_logits, active_class_ids])
+        bbox_loss = KL.Lambda(lambda x: mrcnn_bbox_loss_graph(*x), name="mrcnn_bbox_loss")(
+            [target_bbox, target_class_ids, mrcnn_bbox])
+        mask_loss = KL.Lambda(lambda x: mrcnn_mask_loss_graph(*x), name="mrcnn_mask_loss")(
+            [target_mask, target_class_ids, mrcnn_mask])
+
+        inputs = [input_C2, input_C3, input_C4, input_C5, input_image_meta,
+                  input_rpn_match, input_rpn_bbox, input_gt_class_ids, input_gt_boxes, input_gt_masks]
+        outputs = [rpn_class_logits, rpn_class, rpn_bbox,
+                   mrcnn_class_logits, mrcnn_class, mrcnn_bbox, mrcnn_mask,
+                   rpn_rois, output_rois,
+                   rpn_class_loss, rpn_bbox_loss, class_loss, bbox_loss, mask_loss]
+
+        model = KM.Model(inputs, outputs, name="mask_rcnn_heads")
+
+        if config.GPU_COUNT > 1:
+            from mrcnn.parallel_model import ParallelModel
+            model = ParallelModel(model, config.GPU_COUNT)
+
+        return model
+
+    def load_weights(self, filepath, by_name=False, exclude=None):
+        """Load weights into the head model and, by name, into the backbone model.
+
+        :param filepath: Path of the weights file.
+        :param by_name: Whether or not to load the weights by name.
+        :param exclude: List of layer names to exclude.
+        :return: nothing
+        """
+
+        super().load_weights(filepath, by_name=by_name, exclude=exclude)
+        self.backbone_model.load_weights(filepath, by_name=True)
+
+    def get_feature_cache(self, dataset, dataset_name):
+        """Get the feature cache of a dataset. The cache is built, if it does not exist or does not match the dataset.
+
+        :param dataset: Dataset object.
+        :param dataset_name: Name of the sub-directory of config.FEATURE_CACHE_PATH to store the cache in.
+        :return: BackboneFeatureCache object.
+        """
+
+        feature_cache = BackboneFeatureCache(os.path.join(self.config.FEATURE_CACHE_PATH, dataset_name),
+                                             dtype=self.config.FEATURE_CACHE_DTYPE)
+
+        if not feature_cache.is_valid(dataset):
+            print("Building feature cache: {}".format(feature_cache.cache_dir))
+            feature_cache.build(self.backbone_model, dataset, self.config)
+
+        return feature_cache
+
+    def train(self, dataset_train, dataset_val, save_best_only=False):
+        """ Method to train the FPN, RPN and heads from cached backbone feature maps.
+
+        :param dataset_train: Dataset object storing the training data.
+        :param dataset_val: Dataset object storing the validation data.
+        :param save_best_only: When true, only the best models are saved in the log directory.
+        :return: Training history.
+        """
+
+        feature_cache_train = self.get_feature_cache(dataset_train, "train")
+        feature_cache_val = self.get_feature_cache(dataset_val, "val")
+
+        train_generator = feature_cache_generator(dataset_train, self.config, feature_cache_train, shuffle=True)
+        val_generator = feature_cache_generator(dataset_val, self.config, feature_cache_val, shuffle=True)
+
+        return self.fit_generators(train_generator, val_generator, save_best_only=save_best_only)
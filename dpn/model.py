@@ -1,12 +1,17 @@
 from mrcnn.model import MaskRCNN
 from dpn.results import Results
 from dpn.detection import Detection
+from dpn.detectioncache import DetectionCache
+from dpn.augmentation import BatchAugmenter, batch_augmentation_generator
+from dpn.trainingprofiler import TrainingProfiler
+from dpn.testtimeaugmentation import VIEWS, transform_image, inverse_transform_image, inverse_transform_bboxes, \
+    merge_detections
 import numpy as np
-from keras.callbacks import CSVLogger, TerminateOnNaN
+from keras.callbacks import CSVLogger, TerminateOnNaN, TensorBoard, ModelCheckpoint
 import os
 import inspect
+import multiprocessing
 from pathlib import Path
-import wget
 
 
 class Model(MaskRCNN):
@@ -23,6 +28,9 @@ class Model(MaskRCNN):
         # Create MaskRCNN model.
         super().__init__(mode, config, model_dir)
 
+        # TrainingProfiler of the last training run.
+        self.training_profiler = None
+
         # If the user set USE_PRETRAINED_WEIGHTS in the config, then try to load a preset weight set. If that fails,
         # then try to load the weights from a file that the user may have specified.
         if config.USE_PRETRAINED_WEIGHTS is not None:
@@ -42,17 +50,20 @@ class Model(MaskRCNN):
         :return: Training history.
         """
 
-        # Save config in the log dir.
-        self.config.save(self.log_dir)
+        # Augment whole batches at once, if the augmentation is a BatchAugmenter.
+        if isinstance(self.config.AUGMENTATION, BatchAugmenter):
+            train_generator = batch_augmentation_generator(dataset_train, self.config,
+                                                           shuffle=True,
+                                                           augmentation=self.config.AUGMENTATION,
+                                                           batch_size=self.config.BATCH_SIZE,
+                                                           no_augmentation_sources=self.config.NO_AUGMENTATION_SOURCES)
+            val_generator = batch_augmentation_generator(dataset_val, self.config,
+                                                         shuffle=True,
+                                                         batch_size=self.config.BATCH_SIZE)
 
-        # Append a CSVLogger to the custom callbacks by default.
-        csv_path = os.path.join(self.log_dir, self.config.NAME.lower()+"_training.csv")
-        csv_logger = CSVLogger(csv_path, append=True)
-        self.config.CUSTOM_CALLBACKS.append(csv_logger)
+            return self.fit_generators(train_generator, val_generator, save_best_only=save_best_only)
 
-        # Append a TerminateOnNaN callback to the custom callbacks by default.
-        nan_terminator = TerminateOnNaN()
-        self.config.CUSTOM_CALLBACKS.append(nan_terminator)
+        custom_callbacks = self.prepare_training()
 
         # Call the training method of the super class.
         history = super().train(dataset_train, dataset_val,
@@ -60,13 +71,131 @@ class Model(MaskRCNN):
                                 epochs=self.config.EPOCHS,
                                 layers=self.config.LAYERS,
                                 augmentation=self.config.AUGMENTATION,
-                                custom_callbacks=self.config.CUSTOM_CALLBACKS,
+                                custom_callbacks=custom_callbacks,
                                 no_augmentation_sources=self.config.NO_AUGMENTATION_SOURCES,
                                 save_best_only=save_best_only,
                                 monitored_quantity='val_loss')
 
         return history
 
+    def prepare_training(self):
+        """ Save the config in the log directory and create the custom callbacks of a training run, i.e. the callbacks
+        of config.CUSTOM_CALLBACKS and the default callbacks (CSVLogger, TrainingProfiler and TerminateOnNaN). The
+        config is not changed, so that repeated training runs do not accumulate default callbacks. The TrainingProfiler
+        of the run is kept as training_profiler.
+
+        :return: List of the custom callbacks.
+        """
+
+        # Save config in the log dir.
+        self.config.save(self.log_dir)
+
+        custom_callbacks = list(self.config.CUSTOM_CALLBACKS)
+
+        # Append a CSVLogger to the custom callbacks by default.
+        csv_path = os.path.join(self.log_dir, self.config.NAME.lower()+"_training.csv")
+        csv_logger = CSVLogger(csv_path, append=True)
+        custom_callbacks.append(csv_logger)
+
+        # Append a TrainingProfiler to the custom callbacks by default, which writes its profile next to the CSV log.
+        profile_path = os.path.join(self.log_dir, self.config.NAME.lower()+"_profile.csv")
+        self.training_profiler = TrainingProfiler(profile_path, batch_size=self.config.BATCH_SIZE)
+        custom_callbacks.append(self.training_profiler)
+
+        # Append a TerminateOnNaN callback to the custom callbacks by default.
+        nan_terminator = TerminateOnNaN()
+        custom_callbacks.append(nan_terminator)
+
+        return custom_callbacks
+
+    def fit_generators(self, train_generator, val_generator, save_best_only=False):
+        """ Train the model with custom data generators, analogous to the training method of the super class, which
+        always uses the default data generator.
+
+        :param train_generator: Generator yielding the training batches.
+        :param val_generator: Generator yielding the validation batches.
+        :param save_best_only: When true, only the best models are saved in the log directory.
+        :return: Training history.
+        """
+
+        assert self.mode == "training", "Create model in training mode."
+
+        custom_callbacks = self.prepare_training()
+
+        # Pre-defined layer regular expressions
+        layer_regex = {
+            # all layers but the backbone
+            "heads": r"(mrcnn\_.*)|(rpn\_.*)|(fpn\_.*)",
+            # From a specific Resnet stage and up
+            "3+": r"(res3.*)|(bn3.*)|(res4.*)|(bn4.*)|(res5.*)|(bn5.*)|(mrcnn\_.*)|(rpn\_.*)|(fpn\_.*)",
+            "4+": r"(res4.*)|(bn4.*)|(res5.*)|(bn5.*)|(mrcnn\_.*)|(rpn\_.*)|(fpn\_.*)",
+            "5+": r"(res5.*)|(bn5.*)|(mrcnn\_.*)|(rpn\_.*)|(fpn\_.*)",
+            # All layers
+            "all": ".*",
+        }
+
+        layers = self.config.LAYERS
+        if layers in layer_regex.keys():
+            layers = layer_regex[layers]
+
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+
+        callbacks = [
+            TensorBoard(log_dir=self.log_dir, histogram_freq=0, write_graph=True, write_images=False),
+            ModelCheckpoint(self.checkpoint_path, verbose=0, save_weights_only=True,
+                            save_best_only=save_best_only, monitor="val_loss"),
+        ]
+        callbacks += custom_callbacks
+
+        print("\nStarting at epoch {}. LR={}\n".format(self.epoch, self.config.LEARNING_RATE))
+        print("Checkpoint Path: {}".format(self.checkpoint_path))
+
+        self.set_trainable(layers)
+        self.compile(self.config.LEARNING_RATE, self.config.LEARNING_MOMENTUM)
+
+        # Work-around for Windows: Keras fails on Windows when using multiprocessing workers.
+        workers = 0 if os.name == "nt" else multiprocessing.cpu_count()
+
+        history = self.keras_model.fit_generator(
+            train_generator,
+            initial_epoch=self.epoch,
+            epochs=self.config.EPOCHS,
+            steps_per_epoch=self.config.STEPS_PER_EPOCH,
+            callbacks=callbacks,
+            validation_data=val_generator,
+            validation_steps=self.config.VALIDATION_STEPS,
+            max_queue_size=100,
+            workers=workers,
+            use_multiprocessing=True,
+        )
+        self.epoch = max(self.epoch, self.config.EPOCHS)
+
+        return history
+
+    def compile(self, learning_rate, momentum):
+        """ Compile the model. If config.GRADIENT_ACCUMULATION_STEPS > 1, then the optimizer of the super class is
+        replaced with an AccumulatingSGD optimizer, which only updates the weights every
+        config.GRADIENT_ACCUMULATION_STEPS micro-batches.
+
+        :param learning_rate: Learning rate.
+        :param momentum: Momentum.
+        :return: nothing
+        """
+
+        super().compile(learning_rate, momentum)
+
+        if self.config.GRADIENT_ACCUMULATION_STEPS > 1:
+            from dpn.optimizers import AccumulatingSGD
+
+            self.keras_model.optimizer = AccumulatingSGD(accumulation_steps=self.config.GRADIENT_ACCUMULATION_STEPS,
+                                                         lr=learning_rate,
+                                                         momentum=momentum,
+                                                         clipnorm=self.config.GRADIENT_CLIP_NORM)
+
+            # The training function is built lazily by keras, i.e. it will use the new optimizer.
+            self.keras_model.train_function = None
+
     def detect(self, image, verbose=0):
         """ Find primary particles on an image.
 
@@ -75,9 +204,74 @@ class Model(MaskRCNN):
         :return: Detection object that stores the bounding boxes, masks and classes of the detected primary particles.
         """
 
-        # Call the training method of the super class.
-        results_dict_list = super().detect([image], verbose=verbose)
-        results_dict = results_dict_list[0]
+        return self.detect_batch([image], verbose=verbose)[0]
+
+    def detect_batch(self, images, verbose=0):
+        """ Find primary particles on a list of images. The images are processed in batches of config.BATCH_SIZE
+        images. Incomplete batches are padded with copies of their last image.
+
+        :param images: List of input images.
+        :param verbose: Verbose mode.
+        :return: List of Detection objects, one for each input image.
+        """
+
+        batch_size = self.config.BATCH_SIZE
+
+        detections = list()
+
+        for batch_start in range(0, len(images), batch_size):
+            batch_images = list(images[batch_start:batch_start + batch_size])
+
+            # Pad incomplete batches, since the model expects exactly config.BATCH_SIZE images.
+            number_of_padding_images = batch_size - len(batch_images)
+            padded_batch_images = batch_images + [batch_images[-1]] * number_of_padding_images
+
+            # Call the detection method of the super class.
+            results_dict_list = super().detect(padded_batch_images, verbose=verbose)
+
+            for image, results_dict in zip(batch_images, results_dict_list):
+                detections.append(self.results_dict_to_detection(image, results_dict))
+
+        return detections
+
+    def detect_tta(self, image, number_of_views=8, iou_threshold=0.5, minimum_votes=None, verbose=0):
+        """ Find primary particles on an image with test-time augmentation. Flipped and rotated views of the image are
+        detected in batches, mapped back to the original orientation and merged (see
+        testtimeaugmentation.merge_detections).
+
+        :param image: Input image.
+        :param number_of_views: Number of views (1 to 8). 2: identity and left-right flip. 4: additionally up-down flip
+                                and 180° rotation. 8: all flips and 90° rotations (default: 8).
+        :param iou_threshold: Minimum IoU of instances of different views to be merged (default: 0.5).
+        :param minimum_votes: Minimum number of views that have to detect an instance (default: None, half of the
+                              views).
+        :param verbose: Verbose mode.
+        :return: Merged Detection object.
+        """
+
+        assert 1 <= number_of_views <= len(VIEWS), "Expected number_of_views to be between 1 and {}.".format(len(VIEWS))
+
+        views = VIEWS[:number_of_views]
+        view_images = [np.ascontiguousarray(transform_image(image, view)) for view in views]
+
+        detections = list()
+
+        for view, view_image, view_detection in zip(views, view_images, self.detect_batch(view_images, verbose)):
+            masks = [inverse_transform_image(mask, view) for mask in view_detection.masks]
+            bboxes = inverse_transform_bboxes(view_detection.bboxes, view, view_image.shape)
+
+            detections.append(Detection(image, masks, view_detection.class_ids, bboxes, view_detection.scores))
+
+        return merge_detections(image, detections, views, iou_threshold=iou_threshold, minimum_votes=minimum_votes)
+
+    @staticmethod
+    def results_dict_to_detection(image, results_dict):
+        """ Convert a results dictionary of the MaskRCNN detection method to a Detection object.
+
+        :param image: Input image.
+        :param results_dict: Results dictionary, as returned by MaskRCNN.detect.
+        :return: Detection object that stores the bounding boxes, masks and classes of the detected primary particles.
+        """
 
         # Extract properties from results_dict.
         masks = results_dict["masks"]
@@ -104,29 +298,123 @@ class Model(MaskRCNN):
 
         return Detection(image, masks, class_ids, bboxes, scores)
 
-    def analyze_dataset(self, dataset):
+    def analyze_dataset(self, dataset, cache=None, checkpoint=None, image_ids=None, exporter=None,
+                        do_keep_detections=True, writer=None):
         """ Analyze a complete set of images.
 
         :param dataset: Dataset object that stores the images to be analyzed.
+        :param cache: DetectionCache object. If given, then only images that are not in the cache yet are analyzed
+                      (default: None).
+        :param checkpoint: AnalysisCheckpoint object. If given, then completed detections are periodically written to
+                           disk and images that were completed by a previous, interrupted run are not analyzed again.
+                           The checkpoint has to be written by the same model (default: None).
+        :param image_ids: IDs of the images to analyze (default: None, analyze all images of the dataset).
+        :param exporter: ParticleExporter object. If given, then the measurements of every detection are exported as
+                         soon as it is available (default: None).
+        :param do_keep_detections: Whether or not to keep the detections in the returned Results object. Set it to False
+                                   to stream very large datasets to an exporter without keeping their masks in memory
+                                   (default: True).
+        :param writer: AsyncWriter object. If given, then the checkpoint and the exporter are written by its ordered
+                       background thread, so that writing overlaps with the detection (default: None).
         :return: List of Detection objects.
         """
 
+        if image_ids is None:
+            image_ids = dataset.image_ids
+
+        def write(function, *args, **kwargs):
+            # Write outputs in the background, in submission order, if a writer is given.
+            if writer is not None:
+                writer.submit_ordered(function, *args, **kwargs)
+            else:
+                function(*args, **kwargs)
+
         # Create a Results-object.
         results = Results()
 
-        for image_id in dataset.image_ids:
+        if cache is not None or checkpoint is not None:
+            model_fingerprint = DetectionCache.get_model_fingerprint(self)
+
+        if checkpoint is not None:
+            checkpoint.check_model_fingerprint(model_fingerprint)
+            completed_detections = checkpoint.load()
+
+            if completed_detections:
+                print("Resuming analysis: {} of {} images already completed.".format(len(completed_detections),
+                                                                                      len(image_ids)))
+
+        for image_id in image_ids:
 
             # Load image.
             image = dataset.load_image(image_id)
 
-            # Perform detection.
-            new_detection = self.detect(image)
+            # Restore detections that were completed by a previous run.
+            if checkpoint is not None:
+                checkpoint_key = dataset.image_info[image_id]["path"]
+
+                if checkpoint_key in completed_detections:
+                    restored_detection = Detection.from_compact(completed_detections[checkpoint_key], image=image)
+
+                    if exporter is not None:
+                        write(exporter.append_detection, restored_detection,
+                              image_id=dataset.image_info[image_id]["id"])
+
+                    if do_keep_detections:
+                        results.append_detection(restored_detection)
+
+                    continue
+
+            # Look up the detection in the cache or perform detection.
+            if cache is not None:
+                cache_key = cache.get_key(image, model_fingerprint)
+                new_detection = cache.get(cache_key, image=image)
+
+                if new_detection is None:
+                    new_detection = self.detect(image)
+                    cache.put(cache_key, new_detection)
+            else:
+                new_detection = self.detect(image)
+
+            if checkpoint is not None:
+                write(checkpoint.append, checkpoint_key, new_detection)
+
+            if exporter is not None:
+                write(exporter.append_detection, new_detection, image_id=dataset.image_info[image_id]["id"])
 
             # Append results.
-            results.append_detection(new_detection)
+            if do_keep_detections:
+                results.append_detection(new_detection)
+
+        if checkpoint is not None:
+            write(checkpoint.flush)
+
+        if exporter is not None:
+            write(exporter.flush)
+
+        if writer is not None:
+            writer.flush()
 
         return results
 
+    def to_reduced_precision(self, mode="int8", calibration_dataset=None, number_of_calibration_images=10):
+        """Create a reduced precision version of the model for CPU inference (see QuantizedModel).
+
+        :param mode: Either "int8" or "int8_weights" (default: "int8").
+        :param calibration_dataset: Dataset object to calibrate the quantization ranges with (default: None, the ranges
+                                    are computed dynamically).
+        :param number_of_calibration_images: Maximum number of images to use for the calibration (default: 10).
+        :return: QuantizedModel object.
+        """
+
+        from dpn.quantization import QuantizedModel
+
+        quantized_model = QuantizedModel(self, mode=mode)
+
+        if calibration_dataset is not None:
+            quantized_model.calibrate(calibration_dataset, number_of_images=number_of_calibration_images)
+
+        return quantized_model
+
     def get_pretrained_model_dir(self):
         """Get path of the directory, where the pretrained models are stored.
 
@@ -161,6 +449,8 @@ class Model(MaskRCNN):
             print("Downloading weights to: "+weight_path)
         
         # Download the desired weights.
+        import wget
+
         def bar_custom(transmitted_data, total_data, width=80):
             progress = transmitted_data/total_data*100
             
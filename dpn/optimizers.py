@@ -0,0 +1,100 @@
+from keras.optimizers import SGD, clip_norm
+from keras import backend as K
+import tensorflow as tf
+
+
+class AccumulatingSGD(SGD):
+    """Stochastic gradient descent with gradient accumulation. The gradients of accumulation_steps consecutive
+    micro-batches are summed up and their mean is applied in a single (momentum) SGD step. Thus, training with
+    micro-batches of size BATCH_SIZE behaves like training with batches of size BATCH_SIZE * accumulation_steps, while
+    only a single micro-batch has to fit into memory. Gradient clipping (clipnorm, clipvalue) is applied to the mean
+    accumulated gradient of each update, not to the gradients of the individual micro-batches, as for a large batch.
+
+    The learning rate is read at the time of each update, so that learning rate schedules (e.g. callbacks that set the
+    learning rate per batch) keep working. self.iterations counts optimizer updates, not micro-batches."""
+
+    def __init__(self, accumulation_steps=1, **kwargs):
+        """Create and initialize an AccumulatingSGD optimizer.
+
+        :param accumulation_steps: Number of micro-batches per optimizer update (default: 1).
+        :param kwargs: Additional arguments to be passed to keras.optimizers.SGD (e.g. lr, momentum, clipnorm).
+        """
+
+        super().__init__(**kwargs)
+
+        self.accumulation_steps = accumulation_steps
+
+        with K.name_scope(self.__class__.__name__):
+            self.micro_iterations = K.variable(0, dtype="int64", name="micro_iterations")
+
+    def get_updates(self, loss, params):
+        # Use the unclipped gradients, since clipping is applied to the accumulated gradients.
+        grads = K.gradients(loss, params)
+
+        lr = self.lr
+        if self.initial_decay > 0:
+            lr *= (1. / (1. + self.decay * K.cast(self.iterations, K.dtype(self.decay))))
+
+        shapes = [K.int_shape(p) for p in params]
+        moments = [K.zeros(shape) for shape in shapes]
+        accumulators = [K.zeros(shape) for shape in shapes]
+        self.weights = [self.iterations, self.micro_iterations] + moments + accumulators
+
+        # Check whether the current micro-batch completes an accumulation cycle.
+        is_update_step = K.equal((self.micro_iterations + 1) % self.accumulation_steps, 0)
+
+        accumulated_gradients = [a + g for a, g in zip(accumulators, grads)]
+        mean_gradients = self._clip_gradients([accumulated_gradient / self.accumulation_steps
+                                               for accumulated_gradient in accumulated_gradients])
+
+        new_values = list()
+
+        for p, m, a, accumulated_gradient, mean_gradient in zip(params, moments, accumulators, accumulated_gradients,
+                                                                mean_gradients):
+            v = self.momentum * m - lr * mean_gradient
+
+            if self.nesterov:
+                new_p = p + self.momentum * v - lr * mean_gradient
+            else:
+                new_p = p + v
+
+            # Apply constraints.
+            if getattr(p, "constraint", None) is not None:
+                new_p = p.constraint(new_p)
+
+            new_values += [(m, K.switch(is_update_step, v, m)),
+                           (p, K.switch(is_update_step, new_p, p)),
+                           (a, K.switch(is_update_step, K.zeros_like(a), accumulated_gradient))]
+
+        # Compute all new values before any variable is assigned, so that no update reads an already updated variable.
+        with tf.control_dependencies([new_value for _, new_value in new_values]):
+            variable_updates = [K.update(variable, new_value) for variable, new_value in new_values]
+
+        with tf.control_dependencies(variable_updates):
+            counter_updates = [K.update_add(self.iterations, K.cast(is_update_step, "int64")),
+                               K.update_add(self.micro_iterations, 1)]
+
+        self.updates = variable_updates + counter_updates
+
+        return self.updates
+
+    def _clip_gradients(self, grads):
+        """Clip gradients by their global norm and by value, analogous to keras.optimizers.Optimizer.get_gradients.
+
+        :param grads: List of gradient tensors.
+        :return: List of clipped gradient tensors.
+        """
+
+        if getattr(self, "clipnorm", 0) > 0:
+            norm = K.sqrt(sum([K.sum(K.square(g)) for g in grads]))
+            grads = [clip_norm(g, self.clipnorm, norm) for g in grads]
+
+        if getattr(self, "clipvalue", 0) > 0:
+            grads = [K.clip(g, -self.clipvalue, self.clipvalue) for g in grads]
+
+        return grads
+
+    def get_config(self):
+        config = {"accumulation_steps": self.accumulation_steps}
+        base_config = super().get_config()
+        return dict(list(base_config.items()) + list(config.items()))
@@ -0,0 +1,289 @@
+from dpn.model import Model
+from dpn.results import Results
+import numpy as np
+import tempfile
+import time
+import sys
+import os
+
+
+class QuantizedModel:
+    """Reduced-precision CPU inference for a Model in inference mode. The graph of the model is frozen and rewritten
+    with the TensorFlow graph transforms:
+
+        "int8_weights": Weights are stored with 8 bits and converted back to 32 bit floats during inference. This
+                        reduces the memory footprint, but not the computational cost.
+        "int8":         Weights are stored with 8 bits and convolutions, matrix multiplications, etc. are computed
+                        with 8 bit kernels. The ranges of the quantized activations can be calibrated based on a
+                        dataset (see calibrate). Otherwise, they are computed dynamically for every image.
+    """
+
+    def __init__(self, model, mode="int8"):
+        """Create and initialize a QuantizedModel object.
+
+        :param model: Model object in inference mode, with loaded weights.
+        :param mode: Either "int8" or "int8_weights" (default: "int8").
+        """
+
+        assert model.mode == "inference", "Expected model to be in inference mode."
+
+        mode = mode.lower()
+        assert mode in ["int8", "int8_weights"], "Expected mode to be \"int8\" or \"int8_weights\"."
+
+        self.model = model
+        self.config = model.config
+        self.mode = mode
+        self.is_calibrated = False
+
+        self.input_names = [tensor.op.name for tensor in model.keras_model.inputs]
+        self.output_names = [tensor.op.name for tensor in model.keras_model.outputs]
+
+        self.float32_graph_def = self._freeze_graph()
+
+        self.graph_def = self._transform_graph(self.float32_graph_def, self._get_transforms())
+        self.session = self._create_session(self.graph_def)
+
+    def _freeze_graph(self):
+        """Convert the variables of the keras model into constants.
+
+        :return: Frozen GraphDef.
+        """
+
+        from keras import backend as K
+        from tensorflow.python.framework import graph_util
+
+        session = K.get_session()
+        return graph_util.convert_variables_to_constants(session,
+                                                         session.graph.as_graph_def(),
+                                                         self.output_names)
+
+    def _get_transforms(self, min_max_log_path=None):
+        """Assemble the list of graph transforms for the selected mode.
+
+        :param min_max_log_path: Path of a calibration log. If it is given, then the calibrated requantization ranges
+                                 are frozen into the graph (default: None).
+        :return: List of graph transforms.
+        """
+
+        transforms = ["fold_constants(ignore_errors=true)",
+                      "fold_batch_norms",
+                      "fold_old_batch_norms",
+                      "quantize_weights"]
+
+        if self.mode == "int8":
+            transforms += ["quantize_nodes"]
+
+            if min_max_log_path is not None:
+                transforms += ["freeze_requantization_ranges(min_max_log_file=\"{}\")".format(min_max_log_path)]
+
+        transforms += ["sort_by_execution_order"]
+
+        return transforms
+
+    def _transform_graph(self, graph_def, transforms):
+        """Apply a list of graph transforms to a GraphDef.
+
+        :param graph_def: GraphDef to transform.
+        :param transforms: List of graph transforms.
+        :return: Transformed GraphDef.
+        """
+
+        from tensorflow.tools.graph_transforms import TransformGraph
+
+        return TransformGraph(graph_def, self.input_names, self.output_names, transforms)
+
+    def _create_session(self, graph_def):
+        """Import a GraphDef into a new graph and create a session for it.
+
+        :param graph_def: GraphDef to import.
+        :return: Session object.
+        """
+
+        import tensorflow as tf
+
+        graph = tf.Graph()
+        with graph.as_default():
+            tf.import_graph_def(graph_def, name="")
+
+        return tf.Session(graph=graph)
+
+    def calibrate(self, dataset, number_of_images=10, verbose=True):
+        """Calibrate the ranges of the quantized activations, based on a subset of images of a dataset. Only needed for
+        the "int8" mode.
+
+        :param dataset: Dataset object that stores the calibration images.
+        :param number_of_images: Maximum number of images to use for the calibration (default: 10).
+        :param verbose: If True, then the progress is printed (default: True).
+        :return: nothing
+        """
+
+        assert self.mode == "int8", "Calibration is only supported for the \"int8\" mode."
+
+        # Log the ranges of all requantization operations.
+        logging_transforms = self._get_transforms()
+        logging_transforms.insert(-1, "insert_logging(op=RequantizationRange, show_name=true, "
+                                      "message=\"__requant_min_max:\")")
+        logging_graph_def = self._transform_graph(self.float32_graph_def, logging_transforms)
+        logging_session = self._create_session(logging_graph_def)
+
+        image_ids = dataset.image_ids[:number_of_images]
+
+        if verbose:
+            print("Calibrating quantization ranges with {} images.".format(len(image_ids)))
+
+        # The ranges are printed by the TensorFlow runtime to stderr. Thus, temporarily redirect stderr to a file.
+        log_file = tempfile.NamedTemporaryFile(mode="w+b", suffix=".txt", delete=False)
+        sys.stderr.flush()
+        stderr_file_descriptor = os.dup(2)
+        os.dup2(log_file.fileno(), 2)
+
+        try:
+            for image_id in image_ids:
+                self._run_batch(logging_session, [dataset.load_image(image_id)])
+        finally:
+            sys.stderr.flush()
+            os.dup2(stderr_file_descriptor, 2)
+            os.close(stderr_file_descriptor)
+            log_file.close()
+
+        logging_session.close()
+
+        # Freeze the logged ranges into the graph.
+        self.graph_def = self._transform_graph(self.float32_graph_def, self._get_transforms(log_file.name))
+        self.session.close()
+        self.session = self._create_session(self.graph_def)
+        self.is_calibrated = True
+
+        os.remove(log_file.name)
+
+    def _run_batch(self, session, images):
+        """Run the frozen graph for a batch of images. Incomplete batches are padded with copies of their last image.
+
+        :param session: Session to use.
+        :param images: List of input images (at most config.BATCH_SIZE).
+        :return: List of results dictionaries, analogous to MaskRCNN.detect.
+        """
+
+        number_of_padding_images = self.config.BATCH_SIZE - len(images)
+        padded_images = list(images) + [images[-1]] * number_of_padding_images
+
+        # Mold inputs to the format expected by the neural network.
+        molded_images, image_metas, windows = self.model.mold_inputs(padded_images)
+
+        anchors = self.model.get_anchors(molded_images[0].shape)
+        anchors = np.broadcast_to(anchors, (self.config.BATCH_SIZE,) + anchors.shape)
+
+        feed_dict = dict(zip([name + ":0" for name in self.input_names], [molded_images, image_metas, anchors]))
+        outputs = session.run([name + ":0" for name in self.output_names], feed_dict=feed_dict)
+
+        detections = outputs[0]
+        mrcnn_mask = outputs[3]
+
+        results_dict_list = list()
+
+        for i, image in enumerate(images):
+            rois, class_ids, scores, masks = self.model.unmold_detections(detections[i],
+                                                                           mrcnn_mask[i],
+                                                                           image.shape,
+                                                                           molded_images[i].shape,
+                                                                           windows[i])
+            results_dict_list.append({"rois": rois, "class_ids": class_ids, "scores": scores, "masks": masks})
+
+        return results_dict_list
+
+    def detect_batch(self, images):
+        """ Find primary particles on a list of images, using reduced precision.
+
+        :param images: List of input images.
+        :return: List of Detection objects, one for each input image.
+        """
+
+        batch_size = self.config.BATCH_SIZE
+
+        detections = list()
+
+        for batch_start in range(0, len(images), batch_size):
+            batch_images = list(images[batch_start:batch_start + batch_size])
+            results_dict_list = self._run_batch(self.session, batch_images)
+
+            for image, results_dict in zip(batch_images, results_dict_list):
+                detections.append(Model.results_dict_to_detection(image, results_dict))
+
+        return detections
+
+    def detect(self, image):
+        """ Find primary particles on an image, using reduced precision.
+
+        :param image: Input image.
+        :return: Detection object that stores the bounding boxes, masks and classes of the detected primary particles.
+        """
+
+        return self.detect_batch([image])[0]
+
+    def analyze_dataset(self, dataset):
+        """ Analyze a complete set of images, using reduced precision.
+
+        :param dataset: Dataset object that stores the images to be analyzed.
+        :return: Results object.
+        """
+
+        results = Results()
+
+        for image_id in dataset.image_ids:
+            results.append_detection(self.detect(dataset.load_image(image_id)))
+
+        return results
+
+    def compare_with_float32(self, dataset, measurand="equivalent_diameter", verbose=True):
+        """Compare the reduced precision inference with the float32 inference of the original model, with regard to
+        speed and to the errors of the resulting size distributions.
+
+        :param dataset: Dataset object that stores the test images.
+        :param measurand: Measurand to use for the size distributions (see Results.to_size_distribution,
+                          default: "equivalent_diameter").
+        :param verbose: If True, then a report is printed (default: True).
+        :return: Dictionary with the inference times, the speedup and the errors of the geometric mean (error_d_g), the
+                 geometric standard deviation (error_s_g) and the number of particles (error_N) of the reduced
+                 precision size distribution with regard to the float32 size distribution.
+        """
+
+        # Warm up both models, so that one-time initializations do not distort the timing.
+        first_image = dataset.load_image(dataset.image_ids[0])
+        self.model.detect(first_image)
+        self.detect(first_image)
+
+        start_time = time.perf_counter()
+        results_float32 = self.model.analyze_dataset(dataset)
+        time_float32 = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        results_quantized = self.analyze_dataset(dataset)
+        time_quantized = time.perf_counter() - start_time
+
+        size_distribution_float32 = results_float32.to_size_distribution(measurand)
+        size_distribution_quantized = results_quantized.to_size_distribution(measurand)
+
+        error_d_g, error_s_g, error_N = size_distribution_quantized.compare(size_distribution_float32,
+                                                                            do_return_errors=True,
+                                                                            do_print_output=False)
+
+        report = {
+            "time_float32": time_float32,
+            "time_quantized": time_quantized,
+            "speedup": time_float32 / time_quantized,
+            "error_d_g": error_d_g,
+            "error_s_g": error_s_g,
+            "error_N": error_N
+        }
+
+        if verbose:
+            print("Mode: {} (calibrated: {})".format(self.mode, self.is_calibrated))
+            print("t_float32 = {:.2f} s".format(time_float32))
+            print("t_{} = {:.2f} s".format(self.mode, time_quantized))
+            print("speedup = {:.2f}".format(report["speedup"]))
+            print("\n")
+            print("error_d_g = {:.3f}".format(error_d_g))
+            print("error_s_g = {:.3f}".format(error_s_g))
+            print("error_N = {:.3f}".format(error_N))
+
+        return report
@@ -1,3 +1,4 @@
+from dpn.detectionstore import DetectionList, SpillingDetectionList
 from dpn.sizedistribution import SizeDistribution
 from dpn.utilities import calculate_equivalent_diameter, get_major_bbox_side_length, get_maximum_feret_diameter
 import numpy as np
@@ -7,58 +8,112 @@ from dpn.storable import Storable
 
 
 class Results(Storable):
-    """Class to store, filter and convert detection results, i.e. images, classes, scores, boundingboxes, masks."""
-    def __init__(self, detection=None):
+    """Class to store, filter and convert detection results, i.e. images, classes, scores, boundingboxes, masks.
+
+    The instance columns (masks, bboxes, class_ids and scores) are tuples instead of lists, since they are cached and
+    shared between all callers. Use e.g. list(results.scores) to get a list that can be changed."""
+    def __init__(self, detection=None, memory_budget=None, spill_dir=None):
         """Create and initialize a Results object.
 
         :param detection: First detection (optional).
+        :param memory_budget: Maximum memory usage of the detections in bytes. Past the budget, the least recently used
+                              detections are spilled to disk and transparently loaded again on access (default: None,
+                              keep all detections in memory).
+        :param spill_dir: Directory, in which a temporary directory for the spilled detections is created (default:
+                          None, use the default directory for temporary files).
         """
 
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+
+        # Cached columns of all instances and the modification count of the detection list they were built at, so that
+        # they are rebuilt when the detections change.
+        self._columns = dict()
+        self._columns_modification_count = None
+
         self.detections = list()
 
         if detection is not None:
             self.append_detection(detection)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_columns"]
+        del state["_columns_modification_count"]
+        return state
+
+    def __setstate__(self, state):
+        # Objects that were stored before the detections became a property store them as "detections".
+        if "detections" in state:
+            state["_detections"] = state.pop("detections")
+
+        state.setdefault("memory_budget", None)
+        state.setdefault("spill_dir", None)
+
+        # Objects that were stored before the detection lists counted their changes store a list.
+        if isinstance(state["_detections"], list):
+            state["_detections"] = DetectionList(state["_detections"])
+
+        self.__dict__.update(state)
+        self.invalidate_cache()
+
     # Dependant attributes
+    @property
+    def detections(self):
+        """List of detections. Changes of the list and reassignments of the instance attributes of its detections
+        are detected. If the instance attributes of a detection are changed in place (e.g. detection.scores[0] = 1),
+        then invalidate_cache has to be called."""
+        return self._detections
+
+    @detections.setter
+    def detections(self, detections):
+        # In-place operations, e.g. results.detections += [...], assign the list that was already changed.
+        if detections is getattr(self, "_detections", None):
+            return
+
+        if self.memory_budget is not None:
+            detections = SpillingDetectionList(self.memory_budget, spill_dir=self.spill_dir, detections=detections)
+        else:
+            detections = DetectionList(detections)
+
+        self._detections = detections
+        self.invalidate_cache()
+
+    @property
+    def is_spilling(self):
+        """True, if detections are spilled to disk past the memory budget."""
+        return isinstance(self._detections, SpillingDetectionList)
+
     @property
     def masks(self):
-        """List of masks."""
-        all_masks = list()
-        for detection in self.detections:
-            all_masks += detection.masks
-        return all_masks
+        """Tuple of the masks of all instances (formerly a list). Masks are not cached, if detections are spilled to
+        disk."""
+        if self.is_spilling:
+            return tuple(self._concatenate_column("masks"))
+        return self._get_column("masks")
 
     @property
     def images(self):
         """List of images."""
         all_images = list()
         for detection in self.detections:
-            all_images += detection.images
+            all_images.append(detection.image)
         return all_images
 
     @property
     def bboxes(self):
-        """List of bounding boxes."""
-        all_bboxes = list()
-        for detection in self.detections:
-            all_bboxes += detection.bboxes
-        return all_bboxes
+        """Tuple of the bounding boxes of all instances (formerly a list)."""
+        return self._get_column("bboxes")
 
     @property
     def class_ids(self):
-        """List of class IDs."""
-        class_ids = list()
-        for detection in self.detections:
-            class_ids += detection.class_ids
-        return class_ids
+        """Tuple of the class IDs of all instances (formerly a list)."""
+        return self._get_column("class_ids")
 
     @property
     def scores(self):
-        """List of scores."""
-        all_scores = list()
-        for detection in self.detections:
-            all_scores += detection.scores
-        return all_scores
+        """Tuple of the scores of all instances (formerly a list)."""
+        return self._get_column("scores")
 
     @property
     def number_of_detections(self):
@@ -68,7 +123,7 @@ class Results(Storable):
     @property
     def detection_ids(self):
         """List of detection IDs."""
-        return range(self.number_of_detections-1)
+        return range(self.number_of_detections)
 
     # Methods
     def append_detection(self, detection):
@@ -77,7 +132,16 @@ class Results(Storable):
         :param detection: Detection object that is going to be appended.
         :return: nothing
         """
-        self.detections += [detection]
+        self.detections.append(detection)
+
+    def invalidate_cache(self):
+        """Discard the cached columns, e.g. after detections were changed directly.
+
+        :return: nothing
+        """
+
+        self._columns = dict()
+        self._columns_modification_count = None
 
     def filter_by_minimum_score(self, minimum_score, verbose=False):
         """Filter results based on their score.
@@ -90,6 +154,8 @@ class Results(Storable):
         for detection in self.detections:
             detection.filter_by_minimum_score(minimum_score, verbose=verbose)
 
+        self.invalidate_cache()
+
     def filter_by_class(self, class_id_to_keep, verbose=False):
         """Filter results based on the class of the detections.
 
@@ -101,6 +167,8 @@ class Results(Storable):
         for detection in self.detections:
             detection.filter_by_class(class_id_to_keep, verbose=verbose)
 
+        self.invalidate_cache()
+
     def filter_by_minimum_area(self, minimum_area, verbose=False):
         """Filter results based on a threshold for the minimum area of a detection.
 
@@ -112,6 +180,8 @@ class Results(Storable):
         for detection in self.detections:
             detection.filter_by_minimum_area(minimum_area, verbose=verbose)
 
+        self.invalidate_cache()
+
     def filter_by_maximum_area(self, maximum_area, verbose=False):
         """Filter results based on a threshold for the maximum area of an instance.
 
@@ -122,6 +192,8 @@ class Results(Storable):
         for detection in self.detections:
             detection.filter_by_maximum_area(maximum_area, verbose=verbose)
 
+        self.invalidate_cache()
+
     def filter_by_minimum_circularity(self, minimum_circularity, verbose=False):
         """Filter results based on circularity of the detected instances.
 
@@ -133,6 +205,8 @@ class Results(Storable):
         for detection in self.detections:
             detection.filter_by_minimum_circularity(minimum_circularity, verbose=verbose)
 
+        self.invalidate_cache()
+
     def clear_border_objects(self, verbose=False):
         """Remove instances that touch the border of an image from the results.
 
@@ -143,16 +217,13 @@ class Results(Storable):
         for detection in self.detections:
             detection.clear_border_objects(verbose=verbose)
 
-    def to_size_distribution(self, measurand):
-        """Convert the results to a particle size distribution, based on a certain measurand.
+        self.invalidate_cache()
 
-        :param measurand: Measurand to use for the conversion:
-                          "equivalent_diameter"
-                          "equivalent_diameter_convex"
-                          "major_bbox_side_length"
-                          "major_axis_length"
-                          "maximum_feret_diameter"
-        :return: A SizeDistribution object.
+    def measure(self, measurand):
+        """Measure every instance of the results, based on a certain measurand.
+
+        :param measurand: Measurand to use (see to_size_distribution).
+        :return: Numpy array of measurements, aligned with the masks. Instances that cannot be measured are NaN.
         """
 
         measurand = measurand.lower()
@@ -167,22 +238,50 @@ class Results(Storable):
             "major_axis_length, " \
             "maximum_feret_diameter"
 
-        # Analyze region properties of the masks, if necessary.
-        if measurand is not "maximum_feret_diameter":
-            instances = [regionprops(mask.astype(int))[0] for mask in self.masks]
-
-        if measurand == "equivalent_diameter":
-            areas = [instance.filled_area for instance in instances]
-            measurements = calculate_equivalent_diameter(areas)
-        elif measurand == "equivalent_diameter_convex":
-            areas = [instance.convex_area for instance in instances]
-            measurements = calculate_equivalent_diameter(areas)
-        elif measurand == "major_bbox_side_length":
-            measurements = get_major_bbox_side_length(self.bboxes)
-        elif measurand == "major_axis_length":
-            measurements = [instance.major_axis_length for instance in instances]
-        elif measurand == "maximum_feret_diameter":
-            measurements = get_maximum_feret_diameter(self.masks)
+        # Measure detection by detection, so that only the masks of one detection are needed at once.
+        measurements = list()
+
+        for detection in self.detections:
+            masks = detection.masks
+
+            if len(masks) == 0:
+                continue
+
+            # Analyze region properties of the masks, if necessary.
+            if measurand != "maximum_feret_diameter":
+                instances = [regionprops(mask.astype(int))[0] for mask in masks]
+
+            if measurand == "equivalent_diameter":
+                areas = [instance.filled_area for instance in instances]
+                measurements += calculate_equivalent_diameter(areas)
+            elif measurand == "equivalent_diameter_convex":
+                areas = [instance.convex_area for instance in instances]
+                measurements += calculate_equivalent_diameter(areas)
+            elif measurand == "major_bbox_side_length":
+                measurements += get_major_bbox_side_length(detection.bboxes)
+            elif measurand == "major_axis_length":
+                measurements += [instance.major_axis_length for instance in instances]
+            elif measurand == "maximum_feret_diameter":
+                measurements += get_maximum_feret_diameter(masks, do_skip_invalid_masks=False)
+
+        return np.asarray(measurements, dtype=float)
+
+    def to_size_distribution(self, measurand):
+        """Convert the results to a particle size distribution, based on a certain measurand.
+
+        :param measurand: Measurand to use for the conversion:
+                          "equivalent_diameter"
+                          "equivalent_diameter_convex"
+                          "major_bbox_side_length"
+                          "major_axis_length"
+                          "maximum_feret_diameter"
+        :return: A SizeDistribution object.
+        """
+
+        measurements = self.measure(measurand)
+
+        # Skip instances that could not be measured.
+        measurements = measurements[~np.isnan(measurements)]
 
         # Create and return a SizeDistribution-object.
         size_distribution = SizeDistribution("px")
@@ -190,6 +289,122 @@ class Results(Storable):
 
         return size_distribution
 
+    def to_size_distributions(self, measurand, do_group_by_data_set=False):
+        """Convert the results to one particle size distribution per class, based on a certain measurand. All instances
+        are measured in a single pass, without copying or filtering the results.
+
+        :param measurand: Measurand to use for the conversion (see to_size_distribution).
+        :param do_group_by_data_set: If True, then the instances are additionally grouped by the data_set of their
+                                     detection (default: False).
+        :return: Dictionary of SizeDistribution objects. Keys are class IDs or, if do_group_by_data_set is True,
+                 (data_set, class ID) tuples.
+        """
+
+        measurements = self.measure(measurand)
+
+        if do_group_by_data_set:
+            group_keys = [(detection.data_set, class_id)
+                          for detection in self.detections
+                          for class_id in detection.class_ids]
+        else:
+            group_keys = self.class_ids
+
+        # Assign every instance to a group, in order of first appearance.
+        group_indices = dict()
+        instance_groups = np.array([group_indices.setdefault(key, len(group_indices)) for key in group_keys],
+                                   dtype=int)
+
+        # Skip instances that could not be measured.
+        is_valid = ~np.isnan(measurements)
+
+        size_distributions = dict()
+
+        for key, group_index in group_indices.items():
+            size_distribution = SizeDistribution("px")
+            size_distribution.sizes = measurements[is_valid & (instance_groups == group_index)]
+            size_distributions[key] = size_distribution
+
+        return size_distributions
+
+    def sweep_thresholds(self, measurand, minimum_scores, minimum_areas=None, ground_truth=None):
+        """Calculate the characteristics of the size distributions that result from filtering the results with a grid
+        of minimum score and minimum area thresholds, without modifying the results. Scores, areas and measurements of
+        all instances are determined once. Then, the number of particles as well as the sums of the logarithmic sizes
+        and of their squares are accumulated for all thresholds at once.
+
+        :param measurand: Measurand to use (see to_size_distribution).
+        :param minimum_scores: List of minimum score thresholds (see filter_by_minimum_score).
+        :param minimum_areas: List of minimum area thresholds (see filter_by_minimum_area, default: None, no area
+                              filter).
+        :param ground_truth: SizeDistribution object representing the ground truth. If it is given, then the errors
+                             with regard to the ground truth are calculated as well (see SizeDistribution.compare,
+                             default: None).
+        :return: Dictionary of arrays of shape [number of minimum scores, number of minimum areas]:
+                 "d_g" (geometric mean), "s_g" (geometric standard deviation), "N" (number of particles) and, if a
+                 ground truth is given, "error_d_g", "error_s_g" and "error_N".
+        """
+
+        minimum_scores = np.asarray(minimum_scores, dtype=float)
+        minimum_areas = np.asarray([0] if minimum_areas is None else minimum_areas, dtype=float)
+
+        # Determine the properties of all instances once.
+        scores = np.asarray(self.scores, dtype=float)
+        areas = np.asarray([area for detection in self.detections for area in detection.areas], dtype=float)
+        measurements = self.measure(measurand)
+
+        is_valid = ~np.isnan(measurements)
+        scores = scores[is_valid]
+        areas = areas[is_valid]
+        log_sizes = np.log(measurements[is_valid])
+
+        # Find the largest threshold of each kind that every instance satisfies.
+        score_order = np.argsort(minimum_scores)
+        area_order = np.argsort(minimum_areas)
+        score_bins = np.searchsorted(minimum_scores[score_order], scores, side="right") - 1
+        area_bins = np.searchsorted(minimum_areas[area_order], areas, side="right") - 1
+
+        # Discard instances that do not satisfy any of the thresholds.
+        is_kept = (score_bins >= 0) & (area_bins >= 0)
+        number_of_score_bins = len(minimum_scores)
+        number_of_area_bins = len(minimum_areas)
+        flat_bins = score_bins[is_kept] * number_of_area_bins + area_bins[is_kept]
+        log_sizes = log_sizes[is_kept]
+
+        # Accumulate per bin and then cumulatively over all bins that satisfy at least the thresholds of a grid point.
+        grid_shape = (number_of_score_bins, number_of_area_bins)
+        number_of_bins = number_of_score_bins * number_of_area_bins
+
+        sums = [np.bincount(flat_bins, weights=weights, minlength=number_of_bins).reshape(grid_shape)
+                for weights in [None, log_sizes, log_sizes ** 2]]
+        number_of_particles, sum_of_log_sizes, sum_of_squared_log_sizes = \
+            [np.cumsum(np.cumsum(s[::-1, ::-1], axis=0), axis=1)[::-1, ::-1] for s in sums]
+
+        # Restore the order of the thresholds of the caller.
+        inverse_score_order = np.argsort(score_order)
+        inverse_area_order = np.argsort(area_order)
+        number_of_particles, sum_of_log_sizes, sum_of_squared_log_sizes = \
+            [s[inverse_score_order][:, inverse_area_order]
+             for s in [number_of_particles, sum_of_log_sizes, sum_of_squared_log_sizes]]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_log_sizes = sum_of_log_sizes / number_of_particles
+            variances = np.clip(sum_of_squared_log_sizes / number_of_particles - mean_log_sizes ** 2, 0, None)
+
+            sweep = {
+                "minimum_scores": minimum_scores,
+                "minimum_areas": minimum_areas,
+                "d_g": np.exp(mean_log_sizes),
+                "s_g": np.exp(np.sqrt(variances)),
+                "N": number_of_particles.astype(int)
+            }
+
+            if ground_truth is not None:
+                sweep["error_d_g"] = sweep["d_g"] / ground_truth.geometric_mean - 1
+                sweep["error_s_g"] = sweep["s_g"] / ground_truth.geometric_standard_deviation - 1
+                sweep["error_N"] = sweep["N"] / ground_truth.number_of_particles - 1
+
+        return sweep
+
     def display_detection_image(self, detection_id):
         """Display an image with overlayed detections.
 
@@ -210,17 +425,57 @@ class Results(Storable):
 
         self.detections[detection_id].save_detection_image(output_path, do_display_detections=do_display_detections)
 
-    def save_all_detection_images(self, output_folder, filename_prefix="", filetype="png", do_display_detections=False):
+    def save_all_detection_images(self, output_folder, filename_prefix="", filetype="png", do_display_detections=False,
+                                  writer=None):
         """Save images with overlayed detections for all images of the Results object.
 
         :param output_folder: Folder, where the detection images will be saved.
         :param filename_prefix: Prefix for the filename (default: "")
         :param filetype: Filetype to use (default: "png")
         :param do_display_detections: Display detections before saving them (default: False).
+        :param writer: AsyncWriter object. If given, then the images are rendered and saved in the background and the
+                       method returns as soon as all images have been submitted (default: None).
         :return: nothing
         """
 
+        assert writer is None or not do_display_detections, \
+            "Expected do_display_detections to be False, if the images are saved in the background."
+
         for detection_id in self.detection_ids:
             filename = filename_prefix+"_detection_{:d}.".format(detection_id)+filetype
             output_path = os.path.join(output_folder, filename)
-            self.detections[detection_id].save_detection_image(output_path, do_display_detections=do_display_detections)
+
+            if writer is not None:
+                writer.save_detection_image(self.detections[detection_id], output_path)
+            else:
+                self.detections[detection_id].save_detection_image(output_path,
+                                                                   do_display_detections=do_display_detections)
+
+    def _concatenate_column(self, key):
+        """Concatenate an attribute of all detections.
+
+        :param key: Name of the attribute, e.g. "scores".
+        :return: List of the values of all instances.
+        """
+
+        column = list()
+        for detection in self.detections:
+            column += list(getattr(detection, key))
+        return column
+
+    def _get_column(self, key):
+        """Get a cached column or concatenate and cache it.
+
+        :param key: Name of the attribute, e.g. "scores".
+        :return: Tuple of the values of all instances. The cached tuple itself is returned, so that accessing a column
+                 does not copy it.
+        """
+
+        if self._detections.modification_count != self._columns_modification_count:
+            self.invalidate_cache()
+            self._columns_modification_count = self._detections.modification_count
+
+        if key not in self._columns:
+            self._columns[key] = tuple(self._concatenate_column(key))
+
+        return self._columns[key]
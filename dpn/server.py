@@ -0,0 +1,326 @@
+from dpn.detection import Detection
+from multiprocessing.connection import Listener, Client
+from multiprocessing import AuthenticationError
+from collections import deque
+import numpy as np
+import threading
+import socket
+import queue
+import time
+
+
+class InferenceServer:
+    """Long-lived local inference service, that shares a single Model between many clients. Concurrent single-image
+    requests are collected into dynamic batches of up to config.BATCH_SIZE images, which are processed as soon as the
+    batch is full or the oldest request of the batch has waited for max_latency seconds."""
+
+    def __init__(self, model, address, authkey=None, max_latency=0.05, metrics_window=1000):
+        """Create and initialize an InferenceServer object.
+
+        :param model: Model object in inference mode. The maximum batch size is given by model.config.BATCH_SIZE.
+        :param address: Either a path of a Unix socket (e.g. "/tmp/dpn.sock") or a tuple (host, port) for a localhost
+                        TCP socket (e.g. ("localhost", 6000)).
+        :param authkey: Authentication key (bytes), that clients have to provide (default: None).
+        :param max_latency: Maximum time in seconds that a request waits for further requests to fill its batch
+                            (default: 0.05).
+        :param metrics_window: Number of most recent requests, that the latency metrics are based on (default: 1000).
+        """
+
+        assert model.mode == "inference", "Expected model to be in inference mode."
+
+        self.model = model
+        self.address = address
+        self.authkey = authkey
+        self.max_latency = max_latency
+
+        self.request_queue = queue.Queue()
+        self.is_running = False
+
+        # Requests are only queued while the server is running, so that no request is queued after the queue was drained
+        # on shutdown.
+        self.queue_lock = threading.Lock()
+
+        # Metrics
+        self.metrics_lock = threading.Lock()
+        self.number_of_requests = 0
+        self.number_of_batches = 0
+        self.queue_latencies = deque(maxlen=metrics_window)
+        self.total_latencies = deque(maxlen=metrics_window)
+        self.batch_sizes = deque(maxlen=metrics_window)
+
+        self.listener = None
+
+    # Dependant properties
+    @property
+    def queue_depth(self):
+        """Number of requests that are waiting to be processed."""
+        return self.request_queue.qsize()
+
+    @property
+    def metrics(self):
+        """Dictionary with the queue depth, request and batch counts, as well as batch size and latency statistics."""
+
+        with self.metrics_lock:
+            queue_latencies = np.asarray(self.queue_latencies)
+            total_latencies = np.asarray(self.total_latencies)
+            batch_sizes = np.asarray(self.batch_sizes)
+
+            metrics = {
+                "queue_depth": self.queue_depth,
+                "number_of_requests": self.number_of_requests,
+                "number_of_batches": self.number_of_batches,
+                "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes.size else 0.0
+            }
+
+        for name, latencies in [("queue_latency", queue_latencies), ("total_latency", total_latencies)]:
+            if latencies.size:
+                metrics[name + "_mean"] = float(np.mean(latencies))
+                metrics[name + "_p50"] = float(np.percentile(latencies, 50))
+                metrics[name + "_p95"] = float(np.percentile(latencies, 95))
+            else:
+                metrics[name + "_mean"] = metrics[name + "_p50"] = metrics[name + "_p95"] = 0.0
+
+        return metrics
+
+    # Methods
+    def serve_forever(self):
+        """Accept client connections in background threads and process the requests in the calling thread, until
+        shutdown is called. The model is only used by the calling thread.
+
+        :return: nothing
+        """
+
+        family = "AF_UNIX" if isinstance(self.address, str) else "AF_INET"
+        self.listener = Listener(self.address, family=family, authkey=self.authkey)
+        self.is_running = True
+
+        accept_thread = threading.Thread(target=self._accept_connections, daemon=True)
+        accept_thread.start()
+
+        try:
+            while self.is_running:
+                batch = self._collect_batch()
+
+                if batch:
+                    self._process_batch(batch)
+        finally:
+            with self.queue_lock:
+                self.is_running = False
+
+            self.listener.close()
+            self._reject_queued_requests()
+
+    def shutdown(self):
+        """Stop serving. Requests that are still queued are not processed anymore, but answered with an error.
+
+        :return: nothing
+        """
+
+        self.is_running = False
+
+        # Wake up the thread that waits for the next connection.
+        family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+
+        try:
+            with socket.socket(family) as wake_up_socket:
+                wake_up_socket.connect(self.address)
+        except OSError:
+            # The listener was closed already.
+            pass
+
+    def _accept_connections(self):
+        """Accept client connections and start a handler thread for each of them.
+
+        :return: nothing
+        """
+
+        while self.is_running:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                # The listener was closed.
+                break
+            except (EOFError, AuthenticationError):
+                # The client disconnected or failed to authenticate, e.g. the wake-up connection of shutdown.
+                continue
+
+            if not self.is_running:
+                connection.close()
+                break
+
+            threading.Thread(target=self._handle_connection, args=(connection,), daemon=True).start()
+
+    def _handle_connection(self, connection):
+        """Handle the requests of a single client connection.
+
+        :param connection: Connection object of the client.
+        :return: nothing
+        """
+
+        with connection:
+            while self.is_running:
+                try:
+                    command, payload = connection.recv()
+                except (EOFError, OSError):
+                    break
+
+                if command == "detect":
+                    request = {
+                        "image": payload,
+                        "arrival_time": time.perf_counter(),
+                        "is_done": threading.Event(),
+                        "response": None
+                    }
+
+                    with self.queue_lock:
+                        if self.is_running:
+                            self.request_queue.put(request)
+                        else:
+                            request["response"] = ("error", "The server is shutting down.")
+                            request["is_done"].set()
+
+                    request["is_done"].wait()
+                    response = request["response"]
+                elif command == "metrics":
+                    response = ("ok", self.metrics)
+                else:
+                    response = ("error", "Unknown command: {}".format(command))
+
+                try:
+                    connection.send(response)
+                except (EOFError, OSError):
+                    break
+
+    def _reject_queued_requests(self):
+        """Answer all requests that are still queued with an error.
+
+        :return: nothing
+        """
+
+        while True:
+            try:
+                request = self.request_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            request["response"] = ("error", "The server was shut down before the request was processed.")
+            request["is_done"].set()
+
+    def _collect_batch(self):
+        """Collect requests until either the batch is full or the oldest request exceeds the maximum latency.
+
+        :return: List of requests.
+        """
+
+        try:
+            first_request = self.request_queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first_request]
+        deadline = first_request["arrival_time"] + self.max_latency
+
+        while len(batch) < self.model.config.BATCH_SIZE:
+            remaining_time = deadline - time.perf_counter()
+
+            if remaining_time <= 0:
+                break
+
+            try:
+                batch.append(self.request_queue.get(timeout=remaining_time))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _process_batch(self, batch):
+        """Run the detection for a batch of requests and hand the compact results back to the connection handlers.
+
+        :param batch: List of requests.
+        :return: nothing
+        """
+
+        start_time = time.perf_counter()
+
+        try:
+            detections = self.model.detect_batch([request["image"] for request in batch])
+            responses = [("ok", detection.to_compact()) for detection in detections]
+        except Exception as exception:
+            responses = [("error", repr(exception))] * len(batch)
+
+        end_time = time.perf_counter()
+
+        with self.metrics_lock:
+            self.number_of_requests += len(batch)
+            self.number_of_batches += 1
+            self.batch_sizes.append(len(batch))
+
+            for request in batch:
+                self.queue_latencies.append(start_time - request["arrival_time"])
+                self.total_latencies.append(end_time - request["arrival_time"])
+
+        for request, response in zip(batch, responses):
+            request["response"] = response
+            request["is_done"].set()
+
+
+class InferenceClient:
+    """Client for the InferenceServer."""
+
+    def __init__(self, address, authkey=None):
+        """Create an InferenceClient object and connect it to a running server.
+
+        :param address: Address of the server (see InferenceServer).
+        :param authkey: Authentication key (bytes) of the server (default: None).
+        """
+
+        family = "AF_UNIX" if isinstance(address, str) else "AF_INET"
+        self.connection = Client(address, family=family, authkey=authkey)
+
+    def detect(self, image):
+        """Find primary particles on an image, using the model of the server.
+
+        :param image: Input image.
+        :return: Detection object.
+        """
+
+        compact_detection = self._request("detect", image)
+        return Detection.from_compact(compact_detection, image=image)
+
+    def get_metrics(self):
+        """Retrieve the metrics of the server.
+
+        :return: Dictionary of metrics (see InferenceServer.metrics).
+        """
+
+        return self._request("metrics", None)
+
+    def close(self):
+        """Close the connection to the server.
+
+        :return: nothing
+        """
+
+        self.connection.close()
+
+    def _request(self, command, payload):
+        """Send a request to the server and wait for its response.
+
+        :param command: Command to execute.
+        :param payload: Payload of the command.
+        :return: Response of the server.
+        """
+
+        self.connection.send((command, payload))
+        status, response = self.connection.recv()
+
+        if status != "ok":
+            raise RuntimeError("Inference server error: {}".format(response))
+
+        return response
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
@@ -0,0 +1,160 @@
+from dpn.results import Results
+import multiprocessing
+import dill
+import os
+
+
+def get_shard_image_ids(dataset, shard_index, number_of_shards):
+    """Get the image IDs of a shard of a dataset. The images are ordered by their paths and distributed round-robin
+    over the shards, so that every node that loads the same dataset gets the same, disjoint shards.
+
+    :param dataset: Dataset object.
+    :param shard_index: Index of the shard (0 <= shard_index < number_of_shards).
+    :param number_of_shards: Total number of shards.
+    :return: List of image IDs.
+    """
+
+    assert 0 <= shard_index < number_of_shards, "Expected 0 <= shard_index < number_of_shards."
+
+    ordered_image_ids = sorted(dataset.image_ids, key=lambda image_id: dataset.image_info[image_id]["path"])
+
+    return ordered_image_ids[shard_index::number_of_shards]
+
+
+def get_shard_path(output_dir, shard_index, number_of_shards):
+    """Get the path of the partial results of a shard.
+
+    :param output_dir: Directory, where the partial results are stored.
+    :param shard_index: Index of the shard.
+    :param number_of_shards: Total number of shards.
+    :return: Path of the partial results file.
+    """
+
+    return os.path.join(output_dir, "results_shard_{:04d}_of_{:04d}.pkl".format(shard_index, number_of_shards))
+
+
+def analyze_dataset_shard(model, dataset, shard_index, number_of_shards, output_dir, **kwargs):
+    """Analyze a single shard of a dataset and save the partial results.
+
+    :param model: Model object in inference mode.
+    :param dataset: Dataset object.
+    :param shard_index: Index of the shard (0 <= shard_index < number_of_shards).
+    :param number_of_shards: Total number of shards.
+    :param output_dir: Directory, where the partial results are stored.
+    :param kwargs: Additional arguments to be passed to Model.analyze_dataset (e.g. cache or checkpoint).
+    :return: Path of the partial results file.
+    """
+
+    image_ids = get_shard_image_ids(dataset, shard_index, number_of_shards)
+
+    results = model.analyze_dataset(dataset, image_ids=image_ids, **kwargs)
+
+    os.makedirs(output_dir, exist_ok=True)
+    shard_path = get_shard_path(output_dir, shard_index, number_of_shards)
+    results.save(shard_path)
+
+    return shard_path
+
+
+def merge_shards(output_dir, number_of_shards):
+    """Merge the partial results of all shards of a dataset. The detections of the merged Results object are in the
+    same order as in an analysis of the whole dataset with get_shard_image_ids(dataset, 0, 1).
+
+    :param output_dir: Directory, where the partial results are stored.
+    :param number_of_shards: Total number of shards.
+    :return: Results object.
+    """
+
+    partial_results = list()
+
+    for shard_index in range(number_of_shards):
+        shard_path = get_shard_path(output_dir, shard_index, number_of_shards)
+        assert os.path.isfile(shard_path), "Missing partial results: {}".format(shard_path)
+        partial_results.append(Results.load(shard_path))
+
+    return merge_results(partial_results)
+
+
+def merge_results(partial_results):
+    """Merge a list of partial Results objects that were created with get_shard_image_ids, by undoing the round-robin
+    distribution of the images.
+
+    :param partial_results: List of Results objects, ordered by their shard index.
+    :return: Results object.
+    """
+
+    merged_results = Results()
+
+    maximum_number_of_detections = max(results.number_of_detections for results in partial_results)
+
+    for detection_index in range(maximum_number_of_detections):
+        for results in partial_results:
+            if detection_index < results.number_of_detections:
+                merged_results.append_detection(results.detections[detection_index])
+
+    return merged_results
+
+
+def analyze_dataset_locally(config, model_dir, dataset, number_of_shards, output_dir, weights_path=None):
+    """Analyze a dataset with several processes on the local machine, each of which analyzes one shard with its own
+    model, and merge the partial results.
+
+    :param config: Config object for the inference mode.
+    :param model_dir: Directory of the model (see Model).
+    :param dataset: Dataset object.
+    :param number_of_shards: Number of processes and shards.
+    :param output_dir: Directory, where the partial results are stored.
+    :param weights_path: Path of a weights file to load (default: None, use the weights specified by the config).
+    :return: Results object.
+    """
+
+    # Serialize config and dataset with dill, because their classes are often defined interactively (e.g. in a
+    # notebook) and cannot be imported by the worker processes.
+    serialized_config = dill.dumps(config)
+    serialized_dataset = dill.dumps(dataset)
+
+    # Spawn fresh processes, since TensorFlow does not support forking an initialized session.
+    context = multiprocessing.get_context("spawn")
+
+    processes = list()
+
+    for shard_index in range(number_of_shards):
+        process = context.Process(target=_analyze_dataset_shard_worker,
+                                  args=(serialized_config,
+                                        model_dir,
+                                        serialized_dataset,
+                                        shard_index,
+                                        number_of_shards,
+                                        output_dir,
+                                        weights_path))
+        process.start()
+        processes.append(process)
+
+    for process in processes:
+        process.join()
+
+    exit_codes = [process.exitcode for process in processes]
+    assert all(exit_code == 0 for exit_code in exit_codes), \
+        "At least one worker process failed (exit codes: {}).".format(exit_codes)
+
+    return merge_shards(output_dir, number_of_shards)
+
+
+def _analyze_dataset_shard_worker(serialized_config, model_dir, serialized_dataset, shard_index, number_of_shards,
+                                  output_dir, weights_path):
+    """Worker process of analyze_dataset_locally.
+
+    :return: nothing
+    """
+
+    from dpn.model import Model
+
+    config = dill.loads(serialized_config)
+    dataset = dill.loads(serialized_dataset)
+
+    model = Model(mode="inference", config=config, model_dir=model_dir)
+
+    if weights_path is not None:
+        model.load_weights(weights_path, by_name=True)
+
+    analyze_dataset_shard(model, dataset, shard_index, number_of_shards, output_dir)
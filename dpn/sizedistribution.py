@@ -1,5 +1,4 @@
 import numpy as np
-from scipy.stats.mstats import gmean
 from dpn.storable import Storable
 
 
@@ -12,6 +11,7 @@ class SizeDistribution(Storable):
         :param unit: Either "m" or "px". Unit of the sizes the sizedistribution is based on.
         """
 
+        self._cache = dict()
         self.sizes = np.uint32([])
         unit = unit.lower()
 
@@ -19,27 +19,67 @@ class SizeDistribution(Storable):
         assert unit in ["px", "m"], "Expected unit to be \"px\" or \"m\"."
         self.unit = unit
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_cache"]
+        return state
+
+    def __setstate__(self, state):
+        # Objects that were stored before the sizes became a property store them as "sizes".
+        if "sizes" in state:
+            state["_sizes"] = state.pop("sizes")
+
+        self.__dict__.update(state)
+        self._cache = dict()
+
+    @property
+    def sizes(self):
+        """Array of sizes. Characteristics and histograms are cached until new sizes are assigned, i.e. the array must
+        not be modified in-place."""
+        return self._sizes
+
+    @sizes.setter
+    def sizes(self, sizes):
+        self._sizes = sizes
+        self._cache = dict()
+
+    @property
+    def log_sizes(self):
+        """Array of the logarithms of the sizes."""
+        return self._get_cached("log_sizes", lambda: np.log(self.sizes))
+
     @property
     def geometric_mean(self):
         """Geometric mean of the SizeDistribution object."""
-        return gmean(self.sizes)
+        return self._get_cached("geometric_mean", lambda: np.exp(np.mean(self.log_sizes)))
 
     @property
     def geometric_standard_deviation(self):
         """Geometric standard deviation of the SizeDistribution object."""
-        return np.exp(np.std(np.log(self.sizes)))
+        return self._get_cached("geometric_standard_deviation", lambda: np.exp(np.std(self.log_sizes)))
 
     @property
     def number_of_particles(self):
         """Number of particles of the SizeDistribution object."""
         return len(self.sizes)
 
+    @property
+    def minimum_size(self):
+        """Smallest size of the SizeDistribution object."""
+        return self._get_cached("minimum_size", lambda: np.min(self.sizes))
+
+    @property
+    def maximum_size(self):
+        """Largest size of the SizeDistribution object."""
+        return self._get_cached("maximum_size", lambda: np.max(self.sizes))
+
     # Methods
+    @staticmethod
     def concatenate(size_distributions):
         """Concatenate a list SizeDistribution objects.
 
         :param size_distributions: List of SizeDistribution objects.
-        :return: nothing
+        :return: New SizeDistribution object, containing the sizes of all given SizeDistribution objects.
         """
 
         # Assert that all the size distributions have the same unit.
@@ -47,7 +87,7 @@ class SizeDistribution(Storable):
         assert all(x == units[0] for x in units), "You cannot concatenate sizedistributions with different units."
 
         # Extract the diameter arrays.
-        size_arrays = [psd.diameters for psd in size_distributions]
+        size_arrays = [psd.sizes for psd in size_distributions]
 
         size_distribution_new = SizeDistribution(units[0])
 
@@ -55,6 +95,207 @@ class SizeDistribution(Storable):
 
         return size_distribution_new
 
+    @staticmethod
+    def get_common_bin_edges(size_distributions, bins="auto"):
+        """Determine the bin edges of a binning mode of numpy.histogram for the sizes of several SizeDistribution
+        objects combined. The edges are cached in all of the objects, so that repeated calls with the same objects (e.g. for
+        plotting) do not process the sizes again, until the sizes of one of them are reassigned.
+
+        :param size_distributions: List of SizeDistribution objects with at least one size in total.
+        :param bins: Binning mode of numpy.histogram (default: "auto").
+        :return: Read-only array of bin edges.
+        """
+
+        key = ("common_bin_edges", bins)
+        size_distributions = tuple(size_distributions)
+
+        # The cached edges are valid, if they were determined for the same objects and are still in all of their caches.
+        cached_value = size_distributions[0]._cache.get(key)
+
+        if cached_value is not None and len(cached_value[0]) == len(size_distributions) and \
+                all(size_distribution is cached_size_distribution and size_distribution._cache.get(key) is cached_value
+                    for size_distribution, cached_size_distribution in zip(size_distributions, cached_value[0])):
+            return cached_value[1]
+
+        sizes = np.concatenate([size_distribution.sizes for size_distribution in size_distributions])
+        bin_edges = np.histogram_bin_edges(sizes, bins=bins)
+        bin_edges.setflags(write=False)
+
+        cached_value = (size_distributions, bin_edges)
+
+        for size_distribution in size_distributions:
+            size_distribution._cache[key] = cached_value
+
+        return bin_edges
+
+    def _get_cached(self, key, calculate):
+        """Get a cached value or calculate and cache it.
+
+        :param key: Key of the value.
+        :param calculate: Function without arguments that calculates the value.
+        :return: Value.
+        """
+
+        if key not in self._cache:
+            self._cache[key] = calculate()
+
+        return self._cache[key]
+
+    def get_histogram(self, bins="auto", do_use_log_bins=False):
+        """Calculate the histogram of the sizes. Histograms are cached, so that repeated calls (e.g. for plotting) do
+        not process the sizes again.
+
+        :param bins: List of bin edges, number of bins or binning mode of numpy.histogram (default: "auto").
+        :param do_use_log_bins: If True and bins is a number of bins, then the bins are spaced logarithmically between
+                                the smallest and the largest size (default: False).
+        :return: Histogram counts and bin edges.
+        """
+
+        if np.ndim(bins) > 0:
+            key = ("histogram", tuple(bins), False)
+        else:
+            do_use_log_bins = do_use_log_bins and not isinstance(bins, str)
+            key = ("histogram", bins, do_use_log_bins)
+
+        def calculate():
+            bin_edges = bins
+
+            if do_use_log_bins:
+                bin_edges = np.logspace(np.log10(self.minimum_size), np.log10(self.maximum_size), bins + 1)
+
+            return np.histogram(self.sizes, bins=bin_edges)
+
+        return self._get_cached(key, calculate)
+
+    def get_unique_log_sizes(self, maximum_number_of_values=10000):
+        """Reduce the logarithmic sizes to their unique values and counts. If there are more unique values than
+        maximum_number_of_values, then the log-sizes are binned into maximum_number_of_values equally spaced bins, each
+        represented by the mean log-size of its members, so that the mean of the log-sizes is preserved.
+
+        :param maximum_number_of_values: Maximum number of unique values (default: 10000).
+        :return: Arrays of unique log-sizes and their counts.
+        """
+
+        def calculate():
+            values, counts = np.unique(self.log_sizes, return_counts=True)
+
+            if len(values) > maximum_number_of_values:
+                bin_edges = np.linspace(values[0], values[-1], maximum_number_of_values + 1)
+                bin_indices = np.clip(np.searchsorted(bin_edges, values, side="right") - 1,
+                                      0, maximum_number_of_values - 1)
+
+                bin_counts = np.bincount(bin_indices, weights=counts, minlength=maximum_number_of_values)
+                bin_sums = np.bincount(bin_indices, weights=counts * values, minlength=maximum_number_of_values)
+
+                is_occupied = bin_counts > 0
+                values = bin_sums[is_occupied] / bin_counts[is_occupied]
+                counts = bin_counts[is_occupied].astype(np.int64)
+
+            return values, counts
+
+        return self._get_cached(("unique_log_sizes", maximum_number_of_values), calculate)
+
+    def bootstrap(self, number_of_resamples=1000, chunk_size=100, maximum_number_of_values=10000, random_state=None):
+        """Bootstrap the geometric mean and the geometric standard deviation. Instead of drawing the particles
+        individually, every resample is drawn as multinomial counts of the unique log-sizes (see get_unique_log_sizes),
+        so that the costs do not depend on the number of particles. Resamples are processed in chunks of chunk_size, to
+        cap the memory usage.
+
+        :param number_of_resamples: Number of resamples (default: 1000).
+        :param chunk_size: Number of resamples that are processed at once (default: 100).
+        :param maximum_number_of_values: Maximum number of unique log-sizes (see get_unique_log_sizes, default: 10000).
+        :param random_state: numpy RandomState object or seed (default: None).
+        :return: Arrays of the resampled geometric means and geometric standard deviations.
+        """
+
+        if not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(random_state)
+
+        values, counts = self.get_unique_log_sizes(maximum_number_of_values)
+
+        number_of_particles = int(np.sum(counts))
+        probabilities = counts / number_of_particles
+
+        # Center the values, to calculate the variances accurately from the sums of squares.
+        center = np.sum(values * probabilities)
+        values = values - center
+
+        log_means = list()
+        log_variances = list()
+
+        for chunk_start in range(0, number_of_resamples, chunk_size):
+            number_of_chunk_resamples = min(chunk_size, number_of_resamples - chunk_start)
+
+            resampled_counts = random_state.multinomial(number_of_particles, probabilities,
+                                                        size=number_of_chunk_resamples)
+
+            means = resampled_counts.dot(values) / number_of_particles
+            mean_squares = resampled_counts.dot(values ** 2) / number_of_particles
+
+            log_means.append(means)
+            log_variances.append(np.clip(mean_squares - means ** 2, 0, None))
+
+        geometric_means = np.exp(np.concatenate(log_means) + center)
+        geometric_standard_deviations = np.exp(np.sqrt(np.concatenate(log_variances)))
+
+        return geometric_means, geometric_standard_deviations
+
+    def get_confidence_intervals(self, confidence_level=0.95, number_of_resamples=1000, random_state=None, **kwargs):
+        """Calculate bootstrap confidence intervals (percentile method) of the geometric mean and the geometric standard
+        deviation.
+
+        :param confidence_level: Confidence level (default: 0.95).
+        :param number_of_resamples: Number of resamples (default: 1000).
+        :param random_state: numpy RandomState object or seed (default: None).
+        :param kwargs: Additional arguments to be passed to bootstrap.
+        :return: Dictionary with (lower, upper) bounds for "geometric_mean" and "geometric_standard_deviation".
+        """
+
+        geometric_means, geometric_standard_deviations = self.bootstrap(number_of_resamples=number_of_resamples,
+                                                                        random_state=random_state,
+                                                                        **kwargs)
+
+        percentiles = [50 * (1 - confidence_level), 50 * (1 + confidence_level)]
+
+        return {
+            "geometric_mean": tuple(np.percentile(geometric_means, percentiles)),
+            "geometric_standard_deviation": tuple(np.percentile(geometric_standard_deviations, percentiles))
+        }
+
+    def fit_lognormal(self):
+        """Fit a lognormal distribution by maximum likelihood. The estimates of the parameters are the mean and the
+        (biased) standard deviation of the log-sizes, i.e. the logarithms of the geometric mean and the geometric
+        standard deviation.
+
+        :return: Dictionary with the parameters "mu" and "sigma" and their asymptotic standard errors
+                 "standard_error_mu" and "standard_error_sigma".
+        """
+
+        number_of_particles = self.number_of_particles
+
+        mu = np.log(self.geometric_mean)
+        sigma = np.log(self.geometric_standard_deviation)
+
+        return {
+            "mu": mu,
+            "sigma": sigma,
+            "standard_error_mu": sigma / np.sqrt(number_of_particles),
+            "standard_error_sigma": sigma / np.sqrt(2 * number_of_particles)
+        }
+
+    def get_lognormal_density(self, sizes):
+        """Evaluate the probability density of the fitted lognormal distribution (see fit_lognormal).
+
+        :param sizes: Sizes to evaluate the density at.
+        :return: Array of probability densities.
+        """
+
+        fit = self.fit_lognormal()
+        sizes = np.asarray(sizes, dtype=float)
+
+        return np.exp(-(np.log(sizes) - fit["mu"]) ** 2 / (2 * fit["sigma"] ** 2)) / \
+            (sizes * fit["sigma"] * np.sqrt(2 * np.pi))
+
     def to_meter(self, scalingfactor_meterperpixel):
         """Convert a SizeDistribution object to meters using a given scaling factor.
 
@@ -75,7 +316,8 @@ class SizeDistribution(Storable):
         self.sizes = self.sizes / scalingfactor_meterperpixel
         self.unit = "px"
 
-    def compare(self, ground_truth, do_return_errors=False, do_print_output=True):
+    def compare(self, ground_truth, do_return_errors=False, do_print_output=True, number_of_resamples=0,
+                confidence_level=0.95, random_state=None):
         """Compare two SizeDistribution objects.
 
         :param ground_truth: SizeDistribution object representing the ground truth.
@@ -83,8 +325,14 @@ class SizeDistribution(Storable):
                                  standard deviation and the number of instances (default: False).
         :param do_print_output: If true, then calculate and print the errors of the geometric mean, the geometric
                                 standard deviation and the number of instances (default: True).
+        :param number_of_resamples: If larger than 0, then bootstrap confidence intervals of the errors of the geometric
+                                    mean and the geometric standard deviation are calculated, based on this number of
+                                    resamples of both size distributions (default: 0).
+        :param confidence_level: Confidence level of the confidence intervals (default: 0.95).
+        :param random_state: numpy RandomState object or seed for the bootstrap (default: None).
         :return: If do_return_errors=True, return the errors of the geometric mean, the geometric standard deviation and
-                 the number of instances
+                 the number of instances. If number_of_resamples is larger than 0, then additionally return a
+                 dictionary, mapping "error_d_g" and "error_s_g" to their (lower, upper) confidence interval bounds.
         """
 
         # Assert that the size distributions have the same unit.
@@ -102,18 +350,45 @@ class SizeDistribution(Storable):
         error_s_g = s_g / s_g_gt - 1
         error_N = N / N_gt - 1
 
+        # Bootstrap confidence intervals of the errors, if requested.
+        confidence_intervals = dict()
+
+        if number_of_resamples > 0:
+            if not isinstance(random_state, np.random.RandomState):
+                random_state = np.random.RandomState(random_state)
+
+            d_g_samples, s_g_samples = self.bootstrap(number_of_resamples, random_state=random_state)
+            d_g_gt_samples, s_g_gt_samples = ground_truth.bootstrap(number_of_resamples, random_state=random_state)
+
+            percentiles = [50 * (1 - confidence_level), 50 * (1 + confidence_level)]
+
+            confidence_intervals["error_d_g"] = tuple(np.percentile(d_g_samples / d_g_gt_samples - 1, percentiles))
+            confidence_intervals["error_s_g"] = tuple(np.percentile(s_g_samples / s_g_gt_samples - 1, percentiles))
+
         if do_print_output:
+            error_d_g_suffix = ""
+            error_s_g_suffix = ""
+
+            if confidence_intervals:
+                interval_format = " [{:.3f}, {:.3f}] ({:.0f}% CI)"
+
+                error_d_g_suffix = interval_format.format(*confidence_intervals["error_d_g"], 100 * confidence_level)
+                error_s_g_suffix = interval_format.format(*confidence_intervals["error_s_g"], 100 * confidence_level)
+
             print("d_g = {:.3f}".format(d_g))
             print("d_g_gt = {:.3f}".format(d_g_gt))
-            print("error_d_g = {:.3f}".format(error_d_g))
+            print("error_d_g = {:.3f}".format(error_d_g) + error_d_g_suffix)
             print("\n")
             print("s_g = {:.3f}".format(s_g))
             print("s_g_gt = {:.3f}".format(s_g_gt))
-            print("error_s_g = {:.3f}".format(error_s_g))
+            print("error_s_g = {:.3f}".format(error_s_g) + error_s_g_suffix)
             print("\n")
             print("N = {:.0f}".format(N))
             print("N_gt = {:.0f}".format(N_gt))
             print("error_N = {:.3f}".format(error_N))
 
         if do_return_errors:
+            if confidence_intervals:
+                return error_d_g, error_s_g, error_N, confidence_intervals
+
             return error_d_g, error_s_g, error_N
@@ -1,17 +1,45 @@
 import dill
+import json
+import lzma
+import struct
+import sys
+import zlib
+
+# Use the backport of pickle protocol 5, if the standard library does not support it.
+if sys.version_info >= (3, 8):
+    import pickle
+else:
+    try:
+        import pickle5 as pickle
+    except ImportError:
+        import pickle
+
+# Files that start with this byte sequence use the format of dump. Other files are considered to be plain dill files.
+MAGIC = b"DPNSTOR1"
+
+BACKENDS = ["auto", "pickle", "dill"]
+COMPRESSIONS = ["none", "zlib", "lzma"]
+
+# Size of the chunks that are passed to the (de)compressors and read from files.
+CHUNK_SIZE = 2 ** 24
+
+# Alignment of the buffers within the serialized data, so that deserialized arrays are aligned.
+ALIGNMENT = 64
 
 
 class Storable:
     """Abstract class for storable objects"""
 
-    def save(self, output_path):
+    def save(self, output_path, backend="auto", compression="none"):
         """Save an object to a file.
 
         :param output_path: Path of the output file.
+        :param backend: Serialization backend (see dump, default: "auto").
+        :param compression: Compression of the serialized data (see dump, default: "none").
         :return: nothing
         """
         with open(output_path, "wb") as file:
-            dill.dump(self, file)
+            dump(self, file, backend=backend, compression=compression)
 
     @staticmethod
     def load(input_path):
@@ -21,6 +49,183 @@ class Storable:
         :return: nothing
         """
 
-        dill._dill._reverse_typemap['ClassType'] = type
         with open(input_path, "rb") as file:
-            return dill.load(file)
+            return load(file)
+
+
+def _get_compressor(compression):
+    """Create a streaming compressor.
+
+    :param compression: "none", "zlib" or "lzma".
+    :return: Compressor object or None, if compression is "none".
+    """
+
+    if compression == "zlib":
+        return zlib.compressobj(1)
+    elif compression == "lzma":
+        return lzma.LZMACompressor(preset=1)
+
+    return None
+
+
+def _get_decompressor(compression):
+    """Create a streaming decompressor.
+
+    :param compression: "none", "zlib" or "lzma".
+    :return: Decompressor object or None, if compression is "none".
+    """
+
+    if compression == "zlib":
+        return zlib.decompressobj()
+    elif compression == "lzma":
+        return lzma.LZMADecompressor()
+
+    return None
+
+
+def _get_offsets(lengths):
+    """Calculate the aligned offsets of a list of chunks within the serialized data.
+
+    :param lengths: List of chunk lengths in bytes.
+    :return: List of offsets and total length of the serialized data in bytes.
+    """
+
+    offsets = list()
+    position = 0
+
+    for length in lengths:
+        offsets.append(position)
+        position += -(-length // ALIGNMENT) * ALIGNMENT
+
+    return offsets, position
+
+
+def dump(obj, file, backend="auto", compression="none"):
+    """Serialize an object to a file. The file consists of a header and the serialized object, followed by the raw
+    data of its numpy arrays, if the object was serialized with pickle protocol 5. Thereby, arrays are neither copied
+    into the pickle stream nor compressed as part of it, but written chunk by chunk.
+
+    :param obj: Object to serialize.
+    :param file: File object, opened in binary write mode.
+    :param backend: "pickle": Standard pickle, with out-of-band buffers if protocol 5 is available.
+                    "dill": dill, e.g. for classes that were defined interactively.
+                    "auto": pickle, with dill as fallback for objects of classes defined in __main__ or objects that
+                            pickle cannot serialize (default).
+    :param compression: Compression of the serialized data: "none" (default), "zlib" (fast) or "lzma" (small).
+    :return: nothing
+    """
+
+    # Check inputs.
+    assert backend in BACKENDS, "Expected backend to be one of the following: {}.".format(BACKENDS)
+    assert compression in COMPRESSIONS, "Expected compression to be one of the following: {}.".format(COMPRESSIONS)
+
+    if backend == "auto":
+        # Classes defined in __main__ can only be restored in other scripts, if dill serializes them by value.
+        backend = "dill" if type(obj).__module__ == "__main__" else "pickle"
+
+    buffers = list()
+    protocol = None
+
+    if backend == "pickle":
+        protocol = pickle.HIGHEST_PROTOCOL
+
+        try:
+            if protocol >= 5:
+                data = pickle.dumps(obj, protocol=protocol, buffer_callback=buffers.append)
+            else:
+                data = pickle.dumps(obj, protocol=protocol)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            backend = "dill"
+            buffers = list()
+            protocol = None
+
+    if backend == "dill":
+        data = dill.dumps(obj)
+
+    chunks = [memoryview(data)] + [buffer.raw() for buffer in buffers]
+
+    header = json.dumps({
+        "backend": backend,
+        "protocol": protocol,
+        "compression": compression,
+        "lengths": [chunk.nbytes for chunk in chunks]
+    }).encode()
+
+    file.write(MAGIC)
+    file.write(struct.pack("<I", len(header)))
+    file.write(header)
+
+    compressor = _get_compressor(compression)
+
+    offsets, _ = _get_offsets([chunk.nbytes for chunk in chunks])
+    position = 0
+
+    for offset, chunk in zip(offsets, chunks):
+        chunk = chunk.cast("B")
+
+        # Pad the data to align the chunk.
+        parts = [bytes(offset - position)] + [chunk[start:start + CHUNK_SIZE]
+                                              for start in range(0, len(chunk), CHUNK_SIZE)]
+        position = offset + len(chunk)
+
+        for part in parts:
+            file.write(part if compressor is None else compressor.compress(part))
+
+    if compressor is not None:
+        file.write(compressor.flush())
+
+
+def load(file):
+    """Deserialize an object from a file that was written by dump or, for backwards compatibility, by dill.dump.
+
+    :param file: File object, opened in binary read mode.
+    :return: Deserialized object.
+    """
+
+    magic = file.read(len(MAGIC))
+
+    if magic != MAGIC:
+        file.seek(0)
+        dill._dill._reverse_typemap['ClassType'] = type
+        return dill.load(file)
+
+    header_length, = struct.unpack("<I", file.read(4))
+    header = json.loads(file.read(header_length).decode())
+
+    # Decompress all chunks into a single preallocated buffer, which the deserialized arrays can share.
+    lengths = header["lengths"]
+    offsets, total_length = _get_offsets(lengths)
+    data = bytearray(total_length)
+    view = memoryview(data)
+
+    decompressor = _get_decompressor(header["compression"])
+
+    if decompressor is None:
+        file.readinto(view)
+    else:
+        position = 0
+
+        while True:
+            compressed_part = file.read(CHUNK_SIZE)
+
+            if not compressed_part:
+                break
+
+            part = decompressor.decompress(compressed_part)
+            view[position:position + len(part)] = part
+            position += len(part)
+
+        if header["compression"] == "zlib":
+            part = decompressor.flush()
+            view[position:position + len(part)] = part
+
+    chunks = [view[offset:offset + length] for offset, length in zip(offsets, lengths)]
+
+    if header["backend"] == "dill":
+        dill._dill._reverse_typemap['ClassType'] = type
+        return dill.loads(chunks[0])
+
+    if header["protocol"] >= 5:
+        return pickle.loads(chunks[0], buffers=chunks[1:])
+
+    return pickle.loads(chunks[0])
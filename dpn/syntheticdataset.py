@@ -0,0 +1,300 @@
+from dpn.dataset import Dataset
+import numpy as np
+import multiprocessing
+import time
+import os
+
+# Classes of the synthetic particles, which determine their shapes.
+SYNTHETIC_CLASSES = ["sphere", "cube"]
+
+
+class SyntheticDataset(Dataset):
+    """Dataset that generates images of spherical and cubic particles, along with their instance masks and classes,
+    procedurally and on the fly, without any disk I/O. The generation is controlled by the SYNTHETIC_* attributes of
+    the config.
+
+    If do_generate_fresh_samples is True (default for training datasets), then every request of an image yields a new
+    sample, so that the dataset provides an unlimited stream of samples. Otherwise (default for validation datasets),
+    every image ID always yields the same sample. When used with Model.train, the samples are generated in the data
+    generator worker processes."""
+
+    def __init__(self, class_map=None, config=None, dataset_name=None):
+        """Create and initialize a SyntheticDataset object.
+
+        :param class_map: Map to reassign classes.
+        :param config: Config object.
+        :param dataset_name: name of the dataset
+        """
+
+        self.config = config
+        self.do_generate_fresh_samples = True
+
+        # Number of samples that were generated per image ID, to derive fresh random seeds.
+        self.draw_counts = dict()
+
+        # Last generated sample by image ID, so that load_mask returns the masks matching the last load_image call.
+        self.samples = dict()
+
+        super().__init__(class_map=class_map, config=config, dataset_name=dataset_name)
+
+    def load_dataset_from_config(self, config, dataset_name):
+        """Set up a synthetic dataset based on a config.
+
+        :param config: Config object.
+        :param dataset_name: Name of the dataset.
+        :return: nothing
+        """
+
+        dataset_name = dataset_name.lower()
+
+        expected_dataset_names = ["train", "training", "val", "validation"]
+
+        assert dataset_name in expected_dataset_names, \
+            "Expected dataset_name to be one of the following: {}.".format(expected_dataset_names)
+
+        self.config = config
+
+        if dataset_name in ["train", "training"]:
+            self.generate_dataset(config.NUMBER_OF_SAMPLES_TRAIN, do_generate_fresh_samples=True)
+        elif dataset_name in ["val", "validation"]:
+            self.generate_dataset(config.NUMBER_OF_SAMPLES_VAL, do_generate_fresh_samples=False)
+
+    def generate_dataset(self, number_of_samples, do_generate_fresh_samples=True):
+        """Register the classes of config.SYNTHETIC_CLASSES and a number of synthetic images.
+
+        :param number_of_samples: Number of image IDs. With fresh samples, this only defines the length of an epoch.
+        :param do_generate_fresh_samples: Whether or not to generate a new sample for every request (default: True).
+        :return: nothing
+        """
+
+        self.do_generate_fresh_samples = do_generate_fresh_samples
+
+        check_synthetic_classes(self.config)
+
+        for class_id, class_name in enumerate(self.config.SYNTHETIC_CLASSES, start=1):
+            self.add_class("dataset", class_id, class_name)
+
+        for image_id in range(number_of_samples):
+            self.add_image("dataset", image_id=image_id, path=None)
+
+        self.prepare()
+
+    def load_image(self, image_id):
+        """Generate an image.
+
+        :param image_id: ID of the image.
+        :return: RGB image [height, width, 3].
+        """
+
+        image, masks, class_names = self._generate_sample(image_id)
+
+        # Only keep the last sample, so that images without a subsequent load_mask call do not accumulate.
+        self.samples = {image_id: (image, masks, class_names)}
+
+        return image
+
+    def load_mask(self, image_id):
+        """Load the instance masks of the image that was last generated for an image ID.
+
+        :param image_id: ID of the image.
+        :return:
+        masks: A bool array of shape [height, width, instance count] with
+            one mask per instance.
+        class_ids: a 1D array of class IDs of the instance masks.
+        """
+
+        if image_id not in self.samples:
+            self.load_image(image_id)
+
+        _, masks, class_names = self.samples.pop(image_id)
+
+        return masks, self.map_classname_id(class_names)
+
+    def image_reference(self, image_id):
+        """Return a description of the image.
+
+        :param image_id: ID of the image.
+        :return: Description of the image.
+        """
+
+        return "synthetic_{}".format(image_id)
+
+    def _generate_sample(self, image_id):
+        """Generate a sample with a random state derived from the seed of the config and the image ID. Fresh samples
+        also depend on the number of previous draws and the process ID, so that data generator worker processes do not
+        produce identical streams.
+
+        :param image_id: ID of the image.
+        :return: image, masks and list of class names.
+        """
+
+        seed = [self.config.SYNTHETIC_SEED, int(image_id)]
+
+        if self.do_generate_fresh_samples:
+            draw_count = self.draw_counts.get(image_id, 0)
+            self.draw_counts[image_id] = draw_count + 1
+            seed += [draw_count, os.getpid()]
+
+        return generate_sample(self.config, np.random.RandomState(seed))
+
+    def measure_generation_rate(self, number_of_samples=100, number_of_processes=1):
+        """Measure the rate at which samples are generated.
+
+        :param number_of_samples: Number of samples to generate (default: 100).
+        :param number_of_processes: Number of worker processes (default: 1).
+        :return: Number of generated samples per second.
+        """
+
+        seeds = [[self.config.SYNTHETIC_SEED, index] for index in range(number_of_samples)]
+
+        start_time = time.perf_counter()
+
+        if number_of_processes > 1:
+            with multiprocessing.Pool(number_of_processes) as pool:
+                pool.starmap(_generate_sample_from_seed, [(self.config, seed) for seed in seeds])
+        else:
+            for seed in seeds:
+                _generate_sample_from_seed(self.config, seed)
+
+        return number_of_samples / (time.perf_counter() - start_time)
+
+
+def _generate_sample_from_seed(config, seed):
+    """Generate a sample for a given seed (worker function of SyntheticDataset.measure_generation_rate).
+
+    :param config: Config object.
+    :param seed: Seed of the random state.
+    :return: nothing
+    """
+
+    generate_sample(config, np.random.RandomState(seed))
+
+
+def check_synthetic_classes(config):
+    """Assert that the classes of config.SYNTHETIC_CLASSES are known shapes.
+
+    :param config: Config object, defining SYNTHETIC_CLASSES.
+    :return: nothing
+    """
+
+    unknown_classes = [class_name for class_name in config.SYNTHETIC_CLASSES if class_name not in SYNTHETIC_CLASSES]
+
+    assert not unknown_classes, "Expected SYNTHETIC_CLASSES to be a subset of {}, but got {}.".format(SYNTHETIC_CLASSES,
+                                                                                                    unknown_classes)
+
+
+def generate_sample(config, random_state):
+    """Generate an image of randomly placed spheres and cubes, along with their instance masks and class names.
+
+    :param config: Config object, defining the SYNTHETIC_* attributes.
+    :param random_state: numpy RandomState object.
+    :return: image [height, width, 3], masks [height, width, instance count] and list of class names.
+    """
+
+    check_synthetic_classes(config)
+
+    image_size = config.SYNTHETIC_IMAGE_SIZE
+    minimum_number, maximum_number = config.SYNTHETIC_NUMBER_OF_PARTICLES
+
+    number_of_particles = random_state.randint(minimum_number, maximum_number + 1)
+    diameters = random_state.lognormal(np.log(config.SYNTHETIC_DIAMETER_GEOMETRIC_MEAN),
+                                       np.log(config.SYNTHETIC_DIAMETER_GEOMETRIC_STANDARD_DEVIATION),
+                                       size=number_of_particles)
+
+    image = np.full((image_size, image_size), config.SYNTHETIC_BACKGROUND_INTENSITY, dtype=np.float32)
+    # Index of the visible particle at every pixel (-1 for the background).
+    owners = np.full((image_size, image_size), -1, dtype=np.int32)
+
+    masks = list()
+    class_names = list()
+    areas = list()
+    visible_areas = list()
+
+    maximum_number_of_attempts = 20
+
+    for diameter in diameters:
+        class_name = config.SYNTHETIC_CLASSES[random_state.randint(len(config.SYNTHETIC_CLASSES))]
+        radius = max(diameter / 2, 1)
+
+        # Place the particle, so that it does not overlap too much with the previous particles and does not hide more
+        # than the maximum overlap of any previous particle. Overlaps are evaluated within the bounding box of the
+        # particle only.
+        for _ in range(maximum_number_of_attempts):
+            center_y, center_x = random_state.uniform(0, image_size, size=2)
+
+            y1 = int(max(np.floor(center_y - radius * np.sqrt(2)), 0))
+            y2 = int(min(np.ceil(center_y + radius * np.sqrt(2)) + 1, image_size))
+            x1 = int(max(np.floor(center_x - radius * np.sqrt(2)), 0))
+            x2 = int(min(np.ceil(center_x + radius * np.sqrt(2)) + 1, image_size))
+
+            y, x = np.mgrid[y1:y2, x1:x2].astype(np.float32)
+            y -= center_y
+            x -= center_x
+
+            if class_name == "sphere":
+                squared_distance = (y ** 2 + x ** 2) / radius ** 2
+                crop_mask = squared_distance <= 1
+                # Brightness of a sphere, lit from the front.
+                crop_intensity = np.sqrt(np.clip(1 - squared_distance, 0, 1))
+            elif class_name == "cube":
+                angle = random_state.uniform(0, np.pi / 2)
+                rotated_y = np.cos(angle) * y - np.sin(angle) * x
+                rotated_x = np.sin(angle) * y + np.cos(angle) * x
+                crop_mask = (np.abs(rotated_y) <= radius) & (np.abs(rotated_x) <= radius)
+                # Brightness of a cube, slightly inclined towards the light.
+                crop_intensity = 0.8 + 0.2 * rotated_y / radius
+
+            area = np.sum(crop_mask)
+
+            if area == 0:
+                continue
+
+            covered_owners = owners[y1:y2, x1:x2][crop_mask]
+            covered_owners = covered_owners[covered_owners >= 0]
+
+            if covered_owners.size / area > config.SYNTHETIC_MAXIMUM_OVERLAP:
+                continue
+
+            hidden_areas = np.bincount(covered_owners, minlength=len(masks))
+            remaining_areas = np.asarray(visible_areas) - hidden_areas
+
+            if np.all(remaining_areas >= (1 - config.SYNTHETIC_MAXIMUM_OVERLAP) * np.asarray(areas)):
+                break
+        else:
+            continue
+
+        # Draw the particle on top of the previous particles.
+        crop_image = image[y1:y2, x1:x2]
+        crop_image[crop_mask] = config.SYNTHETIC_BACKGROUND_INTENSITY + \
+            (config.SYNTHETIC_PARTICLE_INTENSITY - config.SYNTHETIC_BACKGROUND_INTENSITY) * crop_intensity[crop_mask]
+
+        # Clip the masks of the previous particles, which are hidden by the new particle.
+        for index in np.flatnonzero(hidden_areas):
+            masks[index][y1:y2, x1:x2] &= ~crop_mask
+            visible_areas[index] = int(remaining_areas[index])
+
+        owners[y1:y2, x1:x2][crop_mask] = len(masks)
+
+        mask = np.zeros((image_size, image_size), dtype=bool)
+        mask[y1:y2, x1:x2] = crop_mask
+
+        masks.append(mask)
+        class_names.append(class_name)
+        areas.append(int(area))
+        visible_areas.append(int(area))
+
+    # Remove particles that are hidden completely.
+    is_visible = [visible_area > 0 for visible_area in visible_areas]
+    masks = [mask for mask, do_keep in zip(masks, is_visible) if do_keep]
+    class_names = [class_name for class_name, do_keep in zip(class_names, is_visible) if do_keep]
+
+    image += random_state.normal(0, config.SYNTHETIC_NOISE_STANDARD_DEVIATION, size=image.shape)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    image = np.stack([image] * 3, axis=-1)
+
+    if masks:
+        masks = np.stack(masks, axis=-1)
+    else:
+        masks = np.zeros((image_size, image_size, 0), dtype=bool)
+
+    return image, masks, class_names
@@ -0,0 +1,177 @@
+from dpn.detection import Detection
+from dpn.utilities import get_bboxes
+import numpy as np
+
+# Views of the dihedral group, as (number of 90° rotations, whether or not the image is flipped left-right before the
+# rotation). The order is chosen, so that the first 2 and 4 views form subgroups (identity/flip and
+# identity/flips/180°).
+VIEWS = [(0, False), (0, True), (2, True), (2, False), (1, False), (3, False), (1, True), (3, True)]
+
+
+def transform_image(image, view):
+    """Transform an image (or a mask) according to a view.
+
+    :param image: Image [height, width(, channels)].
+    :param view: (number of 90° rotations, do_flip) tuple.
+    :return: Transformed image (a view of the input array, if possible).
+    """
+
+    number_of_rotations, do_flip = view
+
+    if do_flip:
+        image = np.fliplr(image)
+
+    return np.rot90(image, number_of_rotations)
+
+
+def inverse_transform_image(image, view):
+    """Undo the transformation of an image (or a mask) according to a view.
+
+    :param image: Transformed image [height, width(, channels)].
+    :param view: (number of 90° rotations, do_flip) tuple.
+    :return: Image in the original orientation (a view of the input array, if possible).
+    """
+
+    number_of_rotations, do_flip = view
+
+    image = np.rot90(image, -number_of_rotations)
+
+    if do_flip:
+        image = np.fliplr(image)
+
+    return image
+
+
+def inverse_transform_bboxes(bboxes, view, shape):
+    """Undo the transformation of bounding boxes according to a view.
+
+    :param bboxes: Array of bounding boxes in the transformed image [instance count, (y1, x1, y2, x2)].
+    :param view: (number of 90° rotations, do_flip) tuple.
+    :param shape: Shape of the transformed image (height, width).
+    :return: Array of bounding boxes in the original image.
+    """
+
+    number_of_rotations, do_flip = view
+
+    bboxes = np.asarray(bboxes, dtype=np.int32).reshape(-1, 4)
+    height, width = shape[:2]
+
+    # Rotate counterclockwise by 90°, until the inverse rotation is complete.
+    for _ in range(-number_of_rotations % 4):
+        y1, x1, y2, x2 = bboxes.T
+        bboxes = np.stack([width - x2, y1, width - x1, y2], axis=1)
+        height, width = width, height
+
+    if do_flip:
+        y1, x1, y2, x2 = bboxes.T
+        bboxes = np.stack([y1, width - x2, y2, width - x1], axis=1)
+
+    return bboxes
+
+
+def merge_detections(image, detections, views, iou_threshold=0.5, minimum_votes=None):
+    """Merge the detections of several views of an image. Instances are greedily clustered in the order of descending
+    scores: every unassigned instance collects the best matching unassigned instance of each other view, if its IoU is
+    at least iou_threshold. IoUs are only calculated for instances with overlapping bounding boxes, within the bounding
+    box of the seed instance. Clusters that are supported by at least minimum_votes views are merged by a pixel-wise
+    majority vote of their masks, the mean score and the class with the largest sum of scores.
+
+    :param image: Original image.
+    :param detections: List of Detection objects, one per view, in the coordinates of the original image.
+    :param views: List of views, one per detection.
+    :param iou_threshold: Minimum IoU of matching instances (default: 0.5).
+    :param minimum_votes: Minimum number of views that detect an instance (default: None, half of the views).
+    :return: Merged Detection object.
+    """
+
+    if minimum_votes is None:
+        minimum_votes = int(np.ceil(len(views) / 2))
+
+    masks = list()
+    view_indices = list()
+
+    for view_index, detection in enumerate(detections):
+        masks += list(detection.masks)
+        view_indices += [view_index] * detection.number_of_instances
+
+    if not masks:
+        return Detection(image, [], [], [], [])
+
+    bboxes = np.concatenate([np.asarray(detection.bboxes, dtype=np.int32).reshape(-1, 4)
+                             for detection in detections])
+    scores = np.concatenate([np.asarray(detection.scores, dtype=float) for detection in detections])
+    class_ids = np.concatenate([np.asarray(detection.class_ids, dtype=int) for detection in detections])
+    view_indices = np.asarray(view_indices)
+    areas = np.array([np.sum(mask[y1:y2, x1:x2]) for mask, (y1, x1, y2, x2) in zip(masks, bboxes)])
+
+    is_assigned = np.zeros(len(masks), dtype=bool)
+
+    merged_masks = list()
+    merged_bboxes = list()
+    merged_scores = list()
+    merged_class_ids = list()
+
+    for seed in np.argsort(-scores, kind="stable"):
+        if is_assigned[seed]:
+            continue
+
+        is_assigned[seed] = True
+        y1, x1, y2, x2 = bboxes[seed]
+
+        # Candidates are unassigned instances of other views with overlapping bounding boxes.
+        candidates = np.flatnonzero(~is_assigned &
+                                    (view_indices != view_indices[seed]) &
+                                    (bboxes[:, 0] < y2) & (bboxes[:, 2] > y1) &
+                                    (bboxes[:, 1] < x2) & (bboxes[:, 3] > x1))
+
+        cluster = [seed]
+
+        if candidates.size > 0:
+            # The intersections lie within the bounding box of the seed.
+            seed_crop = masks[seed][y1:y2, x1:x2]
+            candidate_crops = np.stack([masks[candidate][y1:y2, x1:x2] for candidate in candidates])
+
+            intersections = np.sum(candidate_crops & seed_crop, axis=(1, 2))
+            ious = intersections / np.maximum(areas[seed] + areas[candidates] - intersections, 1)
+
+            # Keep the best match per view.
+            for candidate_index in np.argsort(-ious, kind="stable"):
+                candidate = candidates[candidate_index]
+
+                if ious[candidate_index] < iou_threshold:
+                    break
+
+                if view_indices[candidate] in view_indices[cluster]:
+                    continue
+
+                cluster.append(candidate)
+
+        cluster = np.array(cluster)
+
+        if len(cluster) < minimum_votes:
+            continue
+
+        is_assigned[cluster] = True
+
+        # Merge the masks within the union of their bounding boxes.
+        union_y1, union_x1 = np.min(bboxes[cluster, :2], axis=0)
+        union_y2, union_x2 = np.max(bboxes[cluster, 2:], axis=0)
+
+        votes = np.zeros((union_y2 - union_y1, union_x2 - union_x1), dtype=np.int32)
+        for instance in cluster:
+            votes += masks[instance][union_y1:union_y2, union_x1:union_x2]
+
+        merged_crop = votes * 2 >= len(cluster)
+
+        crop_y1, crop_x1, crop_y2, crop_x2 = get_bboxes(merged_crop[:, :, np.newaxis])[0]
+
+        merged_mask = np.zeros(image.shape[:2], dtype=bool)
+        merged_mask[union_y1:union_y2, union_x1:union_x2] = merged_crop
+
+        merged_masks.append(merged_mask)
+        merged_bboxes.append([int(union_y1 + crop_y1), int(union_x1 + crop_x1),
+                              int(union_y1 + crop_y2), int(union_x1 + crop_x2)])
+        merged_scores.append(float(np.mean(scores[cluster])))
+        merged_class_ids.append(int(np.argmax(np.bincount(class_ids[cluster], weights=scores[cluster]))))
+
+    return Detection(image, merged_masks, merged_class_ids, merged_bboxes, merged_scores)
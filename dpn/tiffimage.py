@@ -0,0 +1,263 @@
+import numpy as np
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+TIFF_FILE_EXTENSIONS = [".tif", ".tiff"]
+
+# Maximum number of pixels that are converted at once.
+CHUNK_SIZE = 2 ** 22
+
+
+def is_tiff_file(path):
+    """Check whether a file is a TIFF file, based on its file extension.
+
+    :param path: Path of the file.
+    :return: True, if the file is a TIFF file.
+    """
+
+    return path.lower().endswith(tuple(TIFF_FILE_EXTENSIONS))
+
+
+class TiffImage:
+    """Region-wise access to large (Big)TIFF images, e.g. 16-bit micrographs with several gigapixels. Uncompressed
+    images are memory-mapped. Tiled or striped images are read tile by tile (or strip by strip), decoding only the
+    segments that intersect the requested region. Regions are converted to 8-bit RGB, the input of the model, in chunks
+    of bounded size, so that the peak memory depends on the region size rather than the image size."""
+
+    def __init__(self, path, intensity_range=None):
+        """Create and initialize a TiffImage object.
+
+        :param path: Path of the TIFF file.
+        :param intensity_range: (minimum, maximum) intensity that is mapped to 0 and 255 (default: None, use the range
+                                of the data type, e.g. (0, 65535) for 16-bit images, or the range of floating point
+                                images as estimated by estimate_intensity_range).
+        """
+
+        assert tifffile is not None, "Reading TIFF files requires the tifffile package."
+
+        self.path = path
+        self.tiff_file = tifffile.TiffFile(path)
+        self.page = self.tiff_file.pages[0]
+
+        self._memmap = None
+
+        if self.page.is_memmappable:
+            self._memmap = self.page.asarray(out="memmap")
+
+        if intensity_range is None:
+            if np.issubdtype(self.dtype, np.integer):
+                intensity_range = (np.iinfo(self.dtype).min, np.iinfo(self.dtype).max)
+            else:
+                intensity_range = self.estimate_intensity_range()
+
+        self.intensity_range = intensity_range
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Dependant properties
+    @property
+    def shape(self):
+        """Shape of the image [height, width(, samples)]."""
+        return self.page.shape
+
+    @property
+    def height(self):
+        """Height of the image in pixels."""
+        return self.page.imagelength
+
+    @property
+    def width(self):
+        """Width of the image in pixels."""
+        return self.page.imagewidth
+
+    @property
+    def dtype(self):
+        """Data type of the image."""
+        return self.page.dtype
+
+    @property
+    def is_segmented(self):
+        """True, if regions can be read segment by segment (tiles or strips) without decoding the whole image."""
+        return self.page.planarconfig == 1 and self.page.imagedepth == 1
+
+    # Methods
+    def read_raw_region(self, y, x, height, width):
+        """Read a region of the image in its original data type.
+
+        :param y: Top coordinate of the region.
+        :param x: Left coordinate of the region.
+        :param height: Height of the region.
+        :param width: Width of the region.
+        :return: Array [height, width(, samples)].
+        """
+
+        y2 = min(y + height, self.height)
+        x2 = min(x + width, self.width)
+
+        if self._memmap is not None:
+            return self._memmap[y:y2, x:x2]
+
+        if not self.is_segmented:
+            # Images with separate sample planes or volumes are read completely.
+            return self.page.asarray()[y:y2, x:x2]
+
+        page = self.page
+        samples = page.samplesperpixel
+
+        if page.is_tiled:
+            segment_height, segment_width = page.tilelength, page.tilewidth
+        else:
+            segment_height, segment_width = page.rowsperstrip, self.width
+
+        number_of_segments_x = -(-self.width // segment_width)
+
+        region = np.zeros((y2 - y, x2 - x, samples), dtype=self.dtype)
+
+        file_handle = self.tiff_file.filehandle
+        decode = page.decode
+
+        for segment_y in range(y // segment_height, -(-y2 // segment_height)):
+            for segment_x in range(x // segment_width, -(-x2 // segment_width)):
+                index = segment_y * number_of_segments_x + segment_x
+
+                file_handle.seek(page.dataoffsets[index])
+                data = file_handle.read(page.databytecounts[index])
+
+                segment, position, _ = decode(data, index, jpegtables=page.jpegtables)
+
+                if segment is None:
+                    continue
+
+                segment = segment[0]
+                segment_top, segment_left = position[2], position[3]
+
+                # Intersect the segment with the region.
+                top = max(segment_top, y)
+                left = max(segment_left, x)
+                bottom = min(segment_top + segment.shape[0], y2)
+                right = min(segment_left + segment.shape[1], x2)
+
+                region[top - y:bottom - y, left - x:right - x] = \
+                    segment[top - segment_top:bottom - segment_top, left - segment_left:right - segment_left]
+
+        if samples == 1:
+            region = region[:, :, 0]
+
+        return region
+
+    def read_region(self, y, x, height, width):
+        """Read a region of the image and convert it to 8-bit RGB.
+
+        :param y: Top coordinate of the region.
+        :param x: Left coordinate of the region.
+        :param height: Height of the region.
+        :param width: Width of the region.
+        :return: RGB image [height, width, 3] of type uint8.
+        """
+
+        return self.to_rgb8(self.read_raw_region(y, x, height, width))
+
+    def read_image(self):
+        """Read the whole image and convert it to 8-bit RGB, region by region.
+
+        :return: RGB image [height, width, 3] of type uint8.
+        """
+
+        image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+        number_of_rows = self._get_number_of_rows_per_chunk(self.width)
+
+        for y in range(0, self.height, number_of_rows):
+            image[y:y + number_of_rows] = self.read_region(y, 0, number_of_rows, self.width)
+
+        return image
+
+    def iter_tiles(self, tile_size=1024, overlap=0):
+        """Iterate the image tile by tile.
+
+        :param tile_size: Edge length of the tiles in pixels (default: 1024).
+        :param overlap: Overlap of adjacent tiles in pixels (default: 0).
+        :return: Generator of (y, x, RGB tile [height, width, 3]) tuples. Tiles at the border may be smaller.
+        """
+
+        assert 0 <= overlap < tile_size, "Expected overlap to be smaller than tile_size."
+
+        stride = tile_size - overlap
+
+        for y in range(0, max(self.height - overlap, 1), stride):
+            for x in range(0, max(self.width - overlap, 1), stride):
+                yield y, x, self.read_region(y, x, tile_size, tile_size)
+
+    def to_rgb8(self, region):
+        """Convert a region to 8-bit RGB in chunks of rows, using the intensity range of the image.
+
+        :param region: Array [height, width(, samples)] in the original data type.
+        :return: RGB image [height, width, 3] of type uint8.
+        """
+
+        height, width = region.shape[:2]
+
+        if region.ndim == 3:
+            # Remove alpha channels and further samples.
+            region = region[:, :, :3]
+
+        minimum_intensity, maximum_intensity = self.intensity_range
+        scale = 255 / max(maximum_intensity - minimum_intensity, np.finfo(np.float32).eps)
+
+        rgb_region = np.empty((height, width, 3), dtype=np.uint8)
+
+        number_of_rows = self._get_number_of_rows_per_chunk(width)
+
+        for y in range(0, height, number_of_rows):
+            chunk = region[y:y + number_of_rows].astype(np.float32)
+            chunk -= minimum_intensity
+            chunk *= scale
+            np.clip(chunk, 0, 255, out=chunk)
+
+            if chunk.ndim == 2:
+                chunk = chunk[:, :, np.newaxis]
+
+            rgb_region[y:y + number_of_rows] = chunk
+
+        return rgb_region
+
+    def estimate_intensity_range(self, percentiles=(0, 100), number_of_samples=2 ** 20):
+        """Estimate the intensity range of the image from a regular subsample of its rows.
+
+        :param percentiles: Lower and upper percentile of the intensities (default: (0, 100)).
+        :param number_of_samples: Approximate number of sampled pixels (default: 2 ** 20).
+        :return: (minimum, maximum) intensity.
+        """
+
+        number_of_rows = max(number_of_samples // self.width, 1)
+        step = max(self.height // number_of_rows, 1)
+
+        samples = [self.read_raw_region(y, 0, 1, self.width).ravel() for y in range(0, self.height, step)]
+        samples = np.concatenate(samples)
+
+        return tuple(np.percentile(samples, percentiles).tolist())
+
+    def close(self):
+        """Close the file.
+
+        :return: nothing
+        """
+
+        self._memmap = None
+        self.tiff_file.close()
+
+    def _get_number_of_rows_per_chunk(self, width):
+        """Number of rows of a chunk, so that it contains at most CHUNK_SIZE pixels.
+
+        :param width: Width of the chunk.
+        :return: Number of rows.
+        """
+
+        return max(CHUNK_SIZE // max(width, 1), 1)
@@ -0,0 +1,153 @@
+from keras.callbacks import Callback
+import time
+import csv
+import sys
+import os
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+COLUMNS = ["epoch", "steps", "samples", "epoch_time", "steps_per_second", "samples_per_second", "data_wait_time",
+           "train_step_time", "data_wait_fraction", "validation_time", "memory_mb", "peak_memory_mb"]
+
+
+def get_memory_usage():
+    """Determine the current and the peak memory usage (resident set size) of the process.
+
+    :return: Current and peak memory usage in MB. Values that cannot be determined on this platform are None.
+    """
+
+    memory = None
+    peak_memory = None
+
+    if psutil is not None:
+        memory = psutil.Process().memory_info().rss / 2 ** 20
+
+    if resource is not None:
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # The peak memory usage is given in bytes on macOS and in kB elsewhere.
+        peak_memory /= 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+
+    return memory, peak_memory
+
+
+class TrainingProfiler(Callback):
+    """Keras callback, which profiles the throughput of the training. The time of every step is split into the time
+    that is spent waiting for the data generator (from the end of a step to the beginning of the next) and the time of
+    the train step itself, so that slow data loading (e.g. decoding or augmentation) can be told apart from slow
+    computation. The time between the last step and the end of an epoch is attributed to the validation. One row per
+    epoch is appended to a CSV file."""
+
+    def __init__(self, csv_path, batch_size=None, verbose=False):
+        """Create and initialize a TrainingProfiler object.
+
+        :param csv_path: Path of the CSV file.
+        :param batch_size: Number of samples per step, if the batch logs do not contain it (default: None).
+        :param verbose: If True, then the profile of every epoch is printed (default: False).
+        """
+
+        super().__init__()
+
+        self.csv_path = csv_path
+        self.batch_size = batch_size
+        self.verbose = verbose
+
+        self.profiles = list()
+
+        self._epoch_start_time = None
+        self._batch_start_time = None
+        self._batch_end_time = None
+        self._profile = None
+
+    # Methods
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start_time = time.perf_counter()
+        self._batch_end_time = self._epoch_start_time
+
+        self._profile = {column: 0 for column in COLUMNS}
+        self._profile["epoch"] = epoch
+
+    def on_batch_begin(self, batch, logs=None):
+        self._batch_start_time = time.perf_counter()
+
+        # Keras fetches the next batch from the data generator between the end of a step and the beginning of the next.
+        self._profile["data_wait_time"] += self._batch_start_time - self._batch_end_time
+
+    def on_batch_end(self, batch, logs=None):
+        self._batch_end_time = time.perf_counter()
+
+        logs = logs or {}
+
+        self._profile["train_step_time"] += self._batch_end_time - self._batch_start_time
+        self._profile["steps"] += 1
+        self._profile["samples"] += logs.get("size", self.batch_size or 0)
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch_end_time = time.perf_counter()
+
+        profile = self._profile
+        profile["epoch_time"] = epoch_end_time - self._epoch_start_time
+        profile["validation_time"] = epoch_end_time - self._batch_end_time
+
+        training_time = profile["data_wait_time"] + profile["train_step_time"]
+
+        if training_time > 0:
+            profile["steps_per_second"] = profile["steps"] / training_time
+            profile["samples_per_second"] = profile["samples"] / training_time
+            profile["data_wait_fraction"] = profile["data_wait_time"] / training_time
+
+        profile["memory_mb"], profile["peak_memory_mb"] = get_memory_usage()
+
+        self.profiles.append(profile)
+        self.write_profile(profile)
+
+        if self.verbose:
+            self.print_profile(profile)
+
+    def write_profile(self, profile):
+        """Append the profile of an epoch to the CSV file. The header is written, if the file is new.
+
+        :param profile: Dictionary, mapping the columns to their values.
+        :return: nothing
+        """
+
+        do_write_header = not os.path.isfile(self.csv_path) or os.path.getsize(self.csv_path) == 0
+
+        with open(self.csv_path, "a", newline="") as file:
+            writer = csv.writer(file)
+
+            if do_write_header:
+                writer.writerow(COLUMNS)
+
+            writer.writerow(["" if profile[column] is None else
+                             "{:.4f}".format(profile[column]) if isinstance(profile[column], float) else
+                             profile[column] for column in COLUMNS])
+
+    @staticmethod
+    def print_profile(profile):
+        """Print the profile of an epoch.
+
+        :param profile: Dictionary, mapping the columns to their values.
+        :return: nothing
+        """
+
+        print("Epoch {}: {:.2f} steps/s; {:.2f} samples/s; data wait {:.1f}s ({:.0%}); train steps {:.1f}s; "
+              "validation {:.1f}s".format(profile["epoch"] + 1,
+                                          profile["steps_per_second"],
+                                          profile["samples_per_second"],
+                                          profile["data_wait_time"],
+                                          profile["data_wait_fraction"],
+                                          profile["train_step_time"],
+                                          profile["validation_time"]))
+
+        if profile["peak_memory_mb"] is not None:
+            print("Peak memory: {:.0f}MB".format(profile["peak_memory_mb"]))
@@ -2,7 +2,6 @@ import numpy as np
 from scipy.spatial.distance import pdist
 from skimage.morphology import convex_hull_image
 from skimage.measure import find_contours
-from external.Mask_RCNN.mrcnn.utils import compute_ap
 
 
 def get_major_bbox_side_length(bboxes):
@@ -44,12 +43,14 @@ def calculate_equivalent_diameter(areas):
     return diameters.tolist()
 
 
-def get_maximum_feret_diameter(masks):
+def get_maximum_feret_diameter(masks, do_skip_invalid_masks=True):
     """Calculates the maximum feret diameter for a list of masks.
     Based on: https://github.com/scikit-image/scikit-image/issues/2320#issuecomment-256057683
     See also:   https://github.com/scikit-image/scikit-image/pull/1780
 
     :param masks: List of masks.
+    :param do_skip_invalid_masks: If True, then masks that are too small to be measured are skipped. Otherwise, NaN is
+                                  returned for them, so that the output is aligned with the masks (default: True).
     :return: List of maximum Feret diameters.
     """
 
@@ -66,6 +67,9 @@ def get_maximum_feret_diameter(masks):
         except ValueError:
             print("Ignored mask, due to small size.")
 
+            if not do_skip_invalid_masks:
+                max_feret_diameters.append(np.nan)
+
     return max_feret_diameters
 
 
@@ -81,8 +85,174 @@ def compute_average_precision(detection, ground_truth, iou_threshold=0.5):
     masks_detection = np.moveaxis(masks_detection, 0, 2)
     scores_detection = np.asarray(detection.scores)
     
+    # mrcnn.utils depends on TensorFlow, so it is only imported when it is needed.
+    from external.Mask_RCNN.mrcnn.utils import compute_ap
+
     average_precision, _, _, _ = compute_ap(bboxes_gt, class_ids_gt, masks_gt,
                                             bboxes_detection, class_ids_detection, scores_detection, masks_detection,
                                             iou_threshold=iou_threshold)
     
     return average_precision
+
+
+def get_bboxes(masks):
+    """Compute the bounding boxes of a stack of instance masks with vectorized reductions, instead of one instance at a
+    time.
+
+    :param masks: Boolean array of instance masks [height, width, instance count].
+    :return: Integer array of bounding boxes [instance count, (y1, x1, y2, x2)]. Empty masks yield (0, 0, 0, 0).
+    """
+
+    height, width = masks.shape[:2]
+
+    rows = np.any(masks, axis=1)
+    columns = np.any(masks, axis=0)
+    is_not_empty = np.any(rows, axis=0)
+
+    y1 = np.argmax(rows, axis=0)
+    y2 = height - np.argmax(rows[::-1], axis=0)
+    x1 = np.argmax(columns, axis=0)
+    x2 = width - np.argmax(columns[::-1], axis=0)
+
+    bboxes = np.stack([y1, x1, y2, x2], axis=1).astype(np.int32)
+    bboxes[~is_not_empty] = 0
+
+    return bboxes
+
+
+def encode_mask(mask):
+    """Encode a boolean mask compactly, by cropping it to its bounding box and packing the cropped pixels into bits.
+
+    :param mask: Boolean mask.
+    :return: Dictionary storing the shape of the mask, the bounding box (y1, x1, y2, x2) of its foreground pixels and
+             the bit-packed pixels within the bounding box.
+    """
+
+    mask = np.asarray(mask, dtype=bool)
+
+    rows = np.flatnonzero(np.any(mask, axis=1))
+    columns = np.flatnonzero(np.any(mask, axis=0))
+
+    if rows.size == 0:
+        return {"shape": mask.shape, "bbox": (0, 0, 0, 0), "data": b""}
+
+    y1, y2 = rows[0], rows[-1] + 1
+    x1, x2 = columns[0], columns[-1] + 1
+
+    data = np.packbits(mask[y1:y2, x1:x2]).tobytes()
+
+    return {"shape": mask.shape, "bbox": (int(y1), int(x1), int(y2), int(x2)), "data": data}
+
+
+def decode_mask(encoded_mask):
+    """Decode a mask that was encoded with encode_mask.
+
+    :param encoded_mask: Dictionary, as returned by encode_mask.
+    :return: Boolean mask.
+    """
+
+    mask = np.zeros(encoded_mask["shape"], dtype=bool)
+
+    y1, x1, y2, x2 = encoded_mask["bbox"]
+    height = y2 - y1
+    width = x2 - x1
+
+    if height > 0 and width > 0:
+        bits = np.unpackbits(np.frombuffer(encoded_mask["data"], dtype=np.uint8))
+        mask[y1:y2, x1:x2] = bits[:height * width].reshape(height, width).astype(bool)
+
+    return mask
+
+
+def masks_to_label_image(masks, scores=None):
+    """Convert a list of (possibly overlapping) instance masks to a label image. Overlaps are resolved in favor of the
+    instance with the highest score, with a single argmax over the masks, stacked in order of descending scores.
+
+    :param masks: List of boolean masks.
+    :param scores: List of scores, one per mask (default: None, earlier masks take precedence).
+    :return: Label image of type int32, where 0 is background and i + 1 is the i-th instance, and array of the overlap
+             areas of the instances, i.e. the number of pixels that an instance shares with at least one other
+             instance.
+    """
+
+    number_of_instances = len(masks)
+
+    if number_of_instances == 0:
+        return None, np.zeros(0, dtype=np.int64)
+
+    if scores is None:
+        order = np.arange(number_of_instances)
+    else:
+        order = np.argsort(-np.asarray(scores, dtype=float), kind="stable")
+
+    stacked_masks = np.stack([masks[index] for index in order]).astype(bool, copy=False)
+
+    # The first mask in the stack that covers a pixel belongs to the instance with the highest score.
+    label_image = order[np.argmax(stacked_masks, axis=0)].astype(np.int32) + 1
+
+    coverage = np.sum(stacked_masks, axis=0, dtype=np.int32)
+    label_image[coverage == 0] = 0
+
+    overlap_areas = np.zeros(number_of_instances, dtype=np.int64)
+    overlap_areas[order] = np.sum(stacked_masks & (coverage > 1), axis=(1, 2))
+
+    return label_image, overlap_areas
+
+
+def label_image_to_crops(label_image, number_of_instances=None):
+    """Convert a label image to bounding boxes and masks that are cropped to these bounding boxes.
+
+    :param label_image: Label image, where 0 is background and i + 1 is the i-th instance.
+    :param number_of_instances: Number of instances (default: None, use the largest label).
+    :return: List of cropped boolean masks and integer array of bounding boxes [instance count, (y1, x1, y2, x2)].
+             Instances without pixels yield empty crops and (0, 0, 0, 0).
+    """
+
+    from scipy.ndimage import find_objects
+
+    if number_of_instances is None:
+        number_of_instances = int(np.max(label_image)) if label_image.size > 0 else 0
+
+    slices = find_objects(label_image, max_label=number_of_instances)
+
+    crops = list()
+    bboxes = np.zeros((number_of_instances, 4), dtype=np.int32)
+
+    for index, instance_slices in enumerate(slices):
+        if instance_slices is None:
+            crops.append(np.zeros((0, 0), dtype=bool))
+            continue
+
+        rows, columns = instance_slices
+        crops.append(label_image[instance_slices] == index + 1)
+        bboxes[index] = [rows.start, columns.start, rows.stop, columns.stop]
+
+    return crops, bboxes
+
+
+def read_image(path):
+    """Read an image file as RGB image, like mrcnn.utils.Dataset.load_image does. TIFF files are read with TiffImage.
+
+    :param path: Path of the image file.
+    :return: RGB image [height, width, 3].
+    """
+
+    from dpn.tiffimage import TiffImage, is_tiff_file, tifffile
+
+    # Read TIFF files region by region, to convert large 16-bit images with little memory.
+    if is_tiff_file(path) and tifffile is not None:
+        with TiffImage(path) as tiff_image:
+            return tiff_image.read_image()
+
+    from skimage.io import imread
+    from skimage.color import gray2rgb
+
+    image = imread(path)
+
+    # Convert grayscale images to RGB and remove alpha channels.
+    if image.ndim != 3:
+        image = gray2rgb(image)
+    if image.shape[-1] == 4:
+        image = image[..., :3]
+
+    return image
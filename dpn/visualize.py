@@ -4,6 +4,7 @@ from matplotlib.patches import Polygon
 from skimage.measure import find_contours
 from scipy.ndimage import binary_fill_holes
 import seaborn as sns
+from dpn.sizedistribution import SizeDistribution
 
 
 def display_image(image, title="", figsize=(16, 16), ax=None):
@@ -115,12 +116,49 @@ def display_instance_outlines(image, masks,
     return ax.figure
 
 
+def get_common_bin_edges(sizedistributions, bins="auto", do_use_log_bins=False):
+    """Determine common bin edges for a list of SizeDistribution objects.
+
+    :param sizedistributions: List of SizeDistribution objects.
+    :param bins: List of bin edges, number of bins or binning mode of numpy.histogram (Default: "auto"). Binning modes
+                 are applied to the sizes of all distributions combined and the edges are cached (see
+                 SizeDistribution.get_common_bin_edges).
+    :param do_use_log_bins: If True and bins is a number of bins, then the bins are spaced logarithmically
+                            (Default: False).
+    :return: Array of bin edges.
+    """
+
+    if np.ndim(bins) > 0:
+        return np.asarray(bins)
+
+    sizedistributions = [sizedistribution for sizedistribution in sizedistributions
+                         if sizedistribution.number_of_particles > 0]
+
+    number_of_bins = 1 if isinstance(bins, str) else bins
+
+    # Without any sizes, fall back to the default range of numpy.histogram.
+    if not sizedistributions:
+        return np.linspace(0, 1, number_of_bins + 1)
+
+    if isinstance(bins, str):
+        return SizeDistribution.get_common_bin_edges(sizedistributions, bins=bins)
+
+    minimum_size = min(sizedistribution.minimum_size for sizedistribution in sizedistributions)
+    maximum_size = max(sizedistribution.maximum_size for sizedistribution in sizedistributions)
+
+    if do_use_log_bins:
+        return np.logspace(np.log10(minimum_size), np.log10(maximum_size), number_of_bins + 1)
+
+    return np.linspace(minimum_size, maximum_size, number_of_bins + 1)
+
+
 def plot_size_distributions(sizedistributions, captions,
                             density=True,
                             number_in_legend=True,
                             d_g_in_legend=True,
                             sigma_g_in_legend=True,
                             bins="auto",
+                            do_use_log_bins=False,
                             alpha=0.5,
                             fill=True,
                             histtype="step",
@@ -135,7 +173,11 @@ def plot_size_distributions(sizedistributions, captions,
     :param d_g_in_legend: Display the geometric mean of each distribution in the legend (Default: True).
     :param sigma_g_in_legend: Display the geometric standard deviation of each distribution in the legend
                               (Default: True).
-    :param bins: List of bin edges, number of bins or binning mode (Default: "auto").
+    :param bins: List of bin edges, number of bins or binning mode (Default: "auto"). The histograms are calculated
+                 once per SizeDistribution object and bin edges and cached, so that drawing only depends on the number
+                 of bins.
+    :param do_use_log_bins: If True and bins is a number of bins, then the bins are spaced logarithmically
+                            (Default: False).
     :param alpha: Opacity of the histograms (Default: 1).
     :param fill: Whether or not to fill the histograms (Default: True).
     :param histtype: Histogram type. For further information, see matplotlib.pyplot.hist (Default: "step").
@@ -152,8 +194,12 @@ def plot_size_distributions(sizedistributions, captions,
         number_of_sizedistributions = len(sizedistributions)
         colors = sns.color_palette("viridis",number_of_sizedistributions)
     
-    sizes_list = [sizedistribution.sizes for sizedistribution in sizedistributions]
-    
+    bin_edges = get_common_bin_edges(sizedistributions, bins=bins, do_use_log_bins=do_use_log_bins)
+
+    # Draw the precomputed histogram counts as weights of the bins, instead of binning the sizes.
+    counts_list = [sizedistribution.get_histogram(bins=bin_edges)[0] for sizedistribution in sizedistributions]
+    bin_list = [bin_edges[:-1]] * len(sizedistributions)
+
     labels = list()
     
     for sizedistribution, caption in zip(sizedistributions, captions):
@@ -179,13 +225,14 @@ def plot_size_distributions(sizedistributions, captions,
             
         labels += [label]
         
-    # Reverse colors, labels and sizes_list because they are again reversed by the hist function.
+    # Reverse colors, labels and counts_list because they are again reversed by the hist function.
     colors.reverse()
-    sizes_list.reverse()
+    counts_list.reverse()
     labels.reverse()
             
-    histogram_n, histogram_bins, _ = plt.hist(sizes_list,
-                                           bins=bins,
+    histogram_n, histogram_bins, _ = plt.hist(bin_list,
+                                           bins=bin_edges,
+                                           weights=counts_list,
                                            density=density,
                                            label=labels,
                                            alpha=alpha,
@@ -194,8 +241,9 @@ def plot_size_distributions(sizedistributions, captions,
                                            color=colors,
                                            **kwargs)
     
-    # Reverse outputs
-    histogram_n.reverse()
+    # Reverse outputs. For a single distribution, matplotlib returns a single array of counts, which is kept as is.
+    if len(sizedistributions) > 1:
+        histogram_n = histogram_n[::-1]
         
     plt.legend(bbox_to_anchor=(0., 1.02, 1., .102),
                loc="lower left",
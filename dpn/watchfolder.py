@@ -0,0 +1,263 @@
+from dpn.analysischeckpoint import AnalysisCheckpoint
+from dpn.detection import Detection
+from dpn.detectioncache import DetectionCache
+from dpn.results import Results
+from dpn.sizedistribution import SizeDistribution
+from dpn.utilities import read_image
+import numpy as np
+import threading
+import time
+import os
+
+
+class WatchFolder:
+    """Continuously analyze the images that arrive in a directory (e.g. the output directory of a microscope). The
+    directory and its sub-directories are polled for new image files, which are analyzed in batches by a persistent
+    model. The detections are appended to an AnalysisCheckpoint in the output directory, which also serves as index of
+    the processed files, so that a restarted WatchFolder only analyzes images that arrived in the meantime. A running
+    SizeDistribution is kept for every (sub-)directory."""
+
+    IMAGE_FILE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp"]
+
+    def __init__(self, model, watch_dir, output_dir=None, measurand="equivalent_diameter", polling_interval=1.0,
+                 minimum_file_age=1.0, checkpoint_interval=100, flush_interval=60.0):
+        """Create and initialize a WatchFolder object. If the output directory already contains the results of a
+        previous run, then they are restored. They have to be written by the same model.
+
+        :param model: Model object in inference mode.
+        :param watch_dir: Directory to watch.
+        :param output_dir: Directory, where the detections are stored (default: None, use the sub-directory
+                           dpn_watchfolder of watch_dir).
+        :param measurand: Measurand to use for the size distributions (see Results.to_size_distribution,
+                          default: "equivalent_diameter").
+        :param polling_interval: Time between two scans of the directory in seconds (default: 1.0).
+        :param minimum_file_age: Minimum time since the last modification of a file in seconds, before it is
+                                 analyzed, so that files that are still being written are skipped (default: 1.0).
+        :param checkpoint_interval: Number of detections per shard file of the checkpoint (default: 100).
+        :param flush_interval: Maximum time in seconds, before detections are written to the checkpoint, even if less
+                               than checkpoint_interval detections have been accumulated (default: 60.0). Pending
+                               detections are also written when run returns.
+        """
+
+        if output_dir is None:
+            output_dir = os.path.join(watch_dir, "dpn_watchfolder")
+
+        self.model = model
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.measurand = measurand
+        self.polling_interval = polling_interval
+        self.minimum_file_age = minimum_file_age
+        self.flush_interval = flush_interval
+
+        self.checkpoint = AnalysisCheckpoint(self.output_dir, checkpoint_interval=checkpoint_interval)
+        self.checkpoint.check_model_fingerprint(DetectionCache.get_model_fingerprint(model))
+
+        # Index of the processed files, relative to watch_dir.
+        self.processed_files = set()
+        self.failed_files = set()
+
+        # Sizes per directory, relative to watch_dir, as list of arrays, which are concatenated only when needed.
+        self._sizes = dict()
+        self._size_distributions = dict()
+
+        self._stop_event = threading.Event()
+        self._last_flush_time = time.time()
+
+        # Restore the detections of a previous run.
+        for key, compact_detection in self.checkpoint.load().items():
+            self._add_detection(key, Detection.from_compact(compact_detection))
+
+        if self.processed_files:
+            print("Restored {} processed images.".format(len(self.processed_files)))
+
+    # Dependant properties
+    @property
+    def size_distributions(self):
+        """Dictionary, mapping every directory (relative to watch_dir) to its SizeDistribution object."""
+
+        for directory, sizes in self._sizes.items():
+            if directory not in self._size_distributions:
+                size_distribution = SizeDistribution("px")
+                size_distribution.sizes = np.concatenate(sizes)
+                self._size_distributions[directory] = size_distribution
+
+        return self._size_distributions
+
+    @property
+    def size_distribution(self):
+        """SizeDistribution object of all directories."""
+        size_distributions = list(self.size_distributions.values())
+
+        if not size_distributions:
+            return SizeDistribution("px")
+
+        return SizeDistribution.concatenate(size_distributions)
+
+    @property
+    def number_of_processed_files(self):
+        """Number of processed image files."""
+        return len(self.processed_files)
+
+    # Methods
+    def find_new_files(self):
+        """Scan the watched directory for image files that have not been processed yet and that are old enough.
+
+        :return: Sorted list of file paths, relative to watch_dir.
+        """
+
+        new_files = list()
+        current_time = time.time()
+
+        for directory, directory_names, file_names in os.walk(self.watch_dir):
+            # Do not scan the output directory.
+            directory_names[:] = [directory_name for directory_name in directory_names
+                                  if os.path.join(directory, directory_name) != self.output_dir]
+
+            for file_name in file_names:
+                if os.path.splitext(file_name)[1].lower() not in self.IMAGE_FILE_EXTENSIONS:
+                    continue
+
+                path = os.path.join(directory, file_name)
+                key = os.path.relpath(path, self.watch_dir)
+
+                if key in self.processed_files or key in self.failed_files:
+                    continue
+
+                try:
+                    if current_time - os.path.getmtime(path) < self.minimum_file_age:
+                        continue
+                except OSError:
+                    # The file was removed in the meantime.
+                    continue
+
+                new_files.append(key)
+
+        return sorted(new_files)
+
+    def poll(self, verbose=True):
+        """Scan the watched directory once and analyze all new images in batches.
+
+        :param verbose: If True, then the updated statistics are printed (default: True).
+        :return: List of the processed files, relative to watch_dir.
+        """
+
+        new_files = self.find_new_files()
+        batch_size = self.model.config.BATCH_SIZE
+
+        processed_files = list()
+
+        for batch_start in range(0, len(new_files), batch_size):
+            keys = list()
+            images = list()
+
+            for key in new_files[batch_start:batch_start + batch_size]:
+                try:
+                    images.append(read_image(os.path.join(self.watch_dir, key)))
+                    keys.append(key)
+                except Exception as error:
+                    # Unreadable files raise different errors, depending on the image reader.
+                    print("Skipped {}: {}".format(key, error))
+                    self.failed_files.add(key)
+
+            if not images:
+                continue
+
+            detections = self.model.detect_batch(images)
+
+            for key, detection in zip(keys, detections):
+                detection.data_set = os.path.dirname(key)
+                detection.image_file_name = os.path.basename(key)
+
+                self.checkpoint.append(key, detection)
+                self._add_detection(key, detection)
+
+            processed_files += keys
+
+        # Shard files are written every checkpoint_interval detections, partial shards at most every flush_interval.
+        if time.time() - self._last_flush_time >= self.flush_interval:
+            self.flush()
+
+        if processed_files:
+            if verbose:
+                self.print_statistics(processed_files)
+
+        return processed_files
+
+    def run(self, maximum_duration=None, verbose=True):
+        """Poll the watched directory until stop is called, a KeyboardInterrupt occurs or the maximum duration elapsed.
+
+        :param maximum_duration: Maximum duration in seconds (default: None, run until stopped).
+        :param verbose: If True, then the updated statistics are printed after every batch (default: True).
+        :return: nothing
+        """
+
+        self._stop_event.clear()
+        start_time = time.time()
+
+        print("Watching {}".format(self.watch_dir))
+
+        try:
+            while not self._stop_event.is_set():
+                self.poll(verbose=verbose)
+
+                if maximum_duration is not None and time.time() - start_time >= maximum_duration:
+                    break
+
+                self._stop_event.wait(self.polling_interval)
+        except KeyboardInterrupt:
+            print("Stopped watching {}".format(self.watch_dir))
+        finally:
+            self.flush()
+
+    def flush(self):
+        """Write the pending detections to the checkpoint.
+
+        :return: nothing
+        """
+
+        self.checkpoint.flush()
+        self._last_flush_time = time.time()
+
+    def stop(self):
+        """Stop a WatchFolder that is running in another thread.
+
+        :return: nothing
+        """
+
+        self._stop_event.set()
+
+    def print_statistics(self, processed_files=None):
+        """Print the number of particles, the geometric mean and the geometric standard deviation per directory.
+
+        :param processed_files: List of newly processed files, to print their number (default: None).
+        :return: nothing
+        """
+
+        if processed_files is not None:
+            print("Processed {} new images ({} in total).".format(len(processed_files),
+                                                                 self.number_of_processed_files))
+
+        for directory, size_distribution in sorted(self.size_distributions.items()):
+            print("{}: N = {:d}; d_g = {:.1f}px; s_g = {:.3f}".format(directory or ".",
+                                                                       size_distribution.number_of_particles,
+                                                                       size_distribution.geometric_mean,
+                                                                       size_distribution.geometric_standard_deviation))
+
+    def _add_detection(self, key, detection):
+        """Add the particle sizes of a detection to the running size distribution of its directory.
+
+        :param key: Path of the image file, relative to watch_dir.
+        :param detection: Detection object.
+        :return: nothing
+        """
+
+        directory = os.path.dirname(key)
+
+        sizes = Results(detection).measure(self.measurand)
+        sizes = sizes[~np.isnan(sizes)]
+
+        self._sizes.setdefault(directory, list()).append(sizes)
+        self._size_distributions.pop(directory, None)
+
+        self.processed_files.add(key)